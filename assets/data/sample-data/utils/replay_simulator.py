@@ -1,30 +1,66 @@
 #!/usr/bin/env python3
 """
-Live Replay Simulator
+Live Replay Simulator / Load Generator
 
-Simulates GRID live feeds from historical match data.
-Streams events in real-time (or time-scaled) to Redis Streams.
+Simulates GRID live feeds from historical match data. One archive can be replayed as-is
+(the original use), or cloned into many synthetic matches replayed concurrently to load
+the whole pipeline:
+
+    inject (Redis XADD pipeline, or POST /webhook/grid) -> ingest -> consumers -> WebSocket
+
+Each injected event carries a unique event_id; optional WebSocket listeners match the
+frames they receive against the injection time and report end-to-end latency
+percentiles every --report-interval seconds. Raise --matches / --rate / --position-hz (or
+stagger matches in with --ramp-seconds) and watch where delivery rate stops following
+injection rate and p99 climbs: that is the saturation point.
+
+/ws/replay (served by app.api) only sees events that reach the canonical stream: its
+reader tails CANONICAL_STREAM on the same Redis. With --target redis the simulator writes
+there itself, so the latency covers Redis -> WebSocket fan-out only; --target webhook adds
+the ingest path (raw persist, normalize, publish). --stream-format flat entries carry no
+`data` field and are never delivered.
 
 Usage:
     python replay_simulator.py --match-archive match_archive.json --speed 1.0
     python replay_simulator.py --match-archive match_archive.json --speed 3.0 --redis-host localhost
+
+    # 200 concurrent matches, 10 Hz positions for every player, 60x game time,
+    # through the webhook, 4 replay viewers measuring latency
+    python replay_simulator.py --match-archive match_archive.json --quiet \\
+        --matches 200 --speed 60 --position-hz 10 --target webhook \\
+        --webhook-url http://localhost:8000/webhook/grid \\
+        --ws-url "ws://localhost:8000/ws/replay?positions=raw" --ws-clients 4
 """
 
-import json
-import time
 import argparse
+import asyncio
+import json
+import random
 import sys
-from datetime import datetime
+import time
+import zlib
+from datetime import datetime, timedelta
 from pathlib import Path
-from typing import Dict, Any, List, Optional
+from typing import Any, Dict, List, Optional
 
 try:
     import redis
+    import redis.asyncio as aredis
     REDIS_AVAILABLE = True
 except ImportError:
     REDIS_AVAILABLE = False
     print("Warning: redis not available. Install with: pip install redis")
 
+try:
+    import aiohttp
+except ImportError:  # only needed for --target webhook
+    aiohttp = None
+
+try:
+    import websockets
+except ImportError:  # only needed for --ws-url
+    websockets = None
+
 
 def load_match_archive(file_path: Path) -> Dict[str, Any]:
     """Load match archive JSON."""
@@ -32,12 +68,16 @@ def load_match_archive(file_path: Path) -> Dict[str, Any]:
         return json.load(f)
 
 
+def parse_ts(value: str) -> datetime:
+    return datetime.fromisoformat(value.replace("Z", "+00:00"))
+
+
 def extract_all_events(archive: Dict[str, Any]) -> List[Dict[str, Any]]:
     """Extract all events from archive, flattening structure."""
     events = []
     match_id = archive["match"]["match_id"]
     tournament_id = archive["tournament"]["tournament_id"]
-    
+
     for map_data in archive["maps"]:
         map_id = map_data["map_id"]
         for round_data in map_data["rounds"]:
@@ -52,20 +92,122 @@ def extract_all_events(archive: Dict[str, Any]) -> List[Dict[str, Any]]:
                     "round": round_num
                 }
                 events.append(enriched_event)
-    
+
     # Sort by timestamp
     events.sort(key=lambda e: e["timestamp"])
     return events
 
 
-def replay_events(events: List[Dict[str, Any]], 
+def synthesize_positions(archive: Dict[str, Any], events: List[Dict[str, Any]], hz: float,
+                         seed: int = 0) -> List[Dict[str, Any]]:
+    """
+    POSITION_UPDATE events for every archive player at `hz` (game time) between each
+    round's first and last event, as a seeded random walk. The archive itself has none.
+    """
+    if hz <= 0 or not events:
+        return []
+    rng = random.Random(seed)
+    players = [(team["team_id"], p["player_id"]) for team in archive["teams"] for p in team["players"]]
+    pos = {pid: [rng.uniform(-2000, 2000), rng.uniform(-2000, 2000), 0.0] for _team, pid in players}
+    step = timedelta(seconds=1.0 / hz)
+    out = []
+    rounds: Dict[tuple, List[datetime]] = {}
+    for e in events:
+        rounds.setdefault((e["map_id"], e["round"]), []).append(parse_ts(e["timestamp"]))
+    base = events[0]
+    for (map_id, round_num), stamps in rounds.items():
+        t, end = min(stamps), max(stamps)
+        while t <= end:
+            for team, pid in players:
+                pos[pid] = [pos[pid][0] + rng.uniform(-30, 30), pos[pid][1] + rng.uniform(-30, 30), 0.0]
+                out.append({
+                    "event_id": f"pos_{map_id}_{round_num}_{pid}_{t.timestamp():.3f}",
+                    "event_type": "POSITION_UPDATE",
+                    "timestamp": t.isoformat().replace("+00:00", "Z"),
+                    "actor": f"player:{pid}",
+                    "team": team,
+                    "payload": {"player_id": pid, "pos": [round(v, 2) for v in pos[pid]]},
+                    "match_id": base["match_id"],
+                    "tournament_id": base["tournament_id"],
+                    "map_id": map_id,
+                    "round": round_num,
+                })
+            t += step
+    return out
+
+
+def clone_for_match(events: List[Dict[str, Any]], match_id: str) -> List[Dict[str, Any]]:
+    """The same timeline under another match id, with event ids unique to that match."""
+    return [{**e, "match_id": match_id, "event_id": f"{match_id}:{e['event_id']}"} for e in events]
+
+
+def to_stream_fields(event: Dict[str, Any]) -> Dict[str, str]:
+    """Legacy flat stream entry (one field per attribute, payload as a JSON string)."""
+    stream_payload = {
+        "event_id": event["event_id"],
+        "match_id": event["match_id"],
+        "tournament_id": event["tournament_id"],
+        "map_id": event.get("map_id", ""),
+        "round": str(event.get("round", "")),
+        "event_type": event["event_type"],
+        "timestamp": event["timestamp"]
+    }
+    for key in ("actor", "target", "team"):
+        if key in event:
+            stream_payload[key] = event[key]
+    if "payload" in event:
+        stream_payload["payload"] = json.dumps(event["payload"])
+    return stream_payload
+
+
+def to_canonical(event: Dict[str, Any], seq: int) -> Dict[str, Any]:
+    """Canonical event as the ingest pipeline publishes it (`{"data": <json>}` entries)."""
+    return {
+        "event_id": event["event_id"],
+        "match_id": event["match_id"],
+        "event_type": event["event_type"],
+        "timestamp": event["timestamp"],
+        "actor": event.get("actor"),
+        "target": event.get("target"),
+        "team": event.get("team"),
+        "payload": {**event.get("payload", {}), "map_id": event.get("map_id"), "round": event.get("round")},
+        "enriched": {},
+        "ingestion_meta": {"source": "REPLAY_SIMULATOR", "grid_seq": seq},
+    }
+
+
+def to_grid_raw(event: Dict[str, Any], seq: int) -> Dict[str, Any]:
+    """Raw GRID-style webhook body; `id` becomes the canonical event_id."""
+    payload = {**event.get("payload", {}), "map_id": event.get("map_id"), "round": event.get("round")}
+    for key, field in (("actor", "player_id"), ("target", "victim"), ("team", "team")):
+        if event.get(key) is not None:
+            payload.setdefault(field, event[key])
+    return {
+        "id": event["event_id"],
+        "match_id": event["match_id"],
+        "type": event["event_type"],
+        "seq": seq,
+        "timestamp": event["timestamp"],
+        "payload": payload,
+    }
+
+
+def stream_for_match(base: str, match_id: str, shards: int) -> str:
+    """Same partitioning as app/stream_shards.py (crc32(match_id) % shards)."""
+    if shards <= 1:
+        return base
+    return f"{base}:{zlib.crc32(str(match_id).encode('utf-8')) % shards}"
+
+
+def replay_events(events: List[Dict[str, Any]],
                   speed: float = 1.0,
                   redis_client: Optional[Any] = None,
                   stream_name: str = "events:canonical",
                   verbose: bool = True):
     """
-    Replay events in real-time (time-scaled).
-    
+    Replay events in real-time (time-scaled), one synchronous XADD each.
+    Kept for scripts that import it; the CLI uses the concurrent `LoadGenerator`.
+
     Args:
         events: List of events sorted by timestamp
         speed: Time scaling factor (1.0 = real-time, 2.0 = 2x speed, 0.5 = half speed)
@@ -74,54 +216,292 @@ def replay_events(events: List[Dict[str, Any]],
         verbose: Print events to stdout
     """
     prev_timestamp = None
-    
+
     for i, event in enumerate(events):
         # Parse timestamp
-        event_timestamp = datetime.fromisoformat(event["timestamp"].replace("Z", "+00:00"))
-        
+        event_timestamp = parse_ts(event["timestamp"])
+
         # Calculate sleep time
         if prev_timestamp:
             delta = (event_timestamp - prev_timestamp).total_seconds() / speed
             if delta > 0:
                 time.sleep(delta)
-        
-        # Prepare Redis stream payload
-        stream_payload = {
-            "event_id": event["event_id"],
-            "match_id": event["match_id"],
-            "tournament_id": event["tournament_id"],
-            "map_id": event.get("map_id", ""),
-            "round": str(event.get("round", "")),
-            "event_type": event["event_type"],
-            "timestamp": event["timestamp"]
-        }
-        
-        if "actor" in event:
-            stream_payload["actor"] = event["actor"]
-        if "target" in event:
-            stream_payload["target"] = event["target"]
-        if "team" in event:
-            stream_payload["team"] = event["team"]
-        if "payload" in event:
-            import json as json_module
-            stream_payload["payload"] = json_module.dumps(event["payload"])
-        
+
         # Stream to Redis if available
         if redis_client:
             try:
-                redis_client.xadd(stream_name, stream_payload)
+                redis_client.xadd(stream_name, to_stream_fields(event))
             except Exception as e:
                 print(f"Error streaming to Redis: {e}", file=sys.stderr)
-        
+
         # Print to stdout
         if verbose:
             print(f"[{event['timestamp']}] {event['event_type']}: {event.get('actor', 'N/A')}")
-        
+
         prev_timestamp = event_timestamp
-    
+
     print(f"\nReplay complete: {len(events)} events streamed")
 
 
+class RateLimiter:
+    """Global events/second cap shared by every match task (0 = unlimited)."""
+
+    def __init__(self, rate: float):
+        self.interval = 1.0 / rate if rate > 0 else 0.0
+        self._next = time.perf_counter()
+
+    async def wait(self):
+        if not self.interval:
+            return
+        now = time.perf_counter()
+        self._next = max(self._next + self.interval, now - 1.0)  # at most 1s of burst credit
+        if self._next > now:
+            await asyncio.sleep(self._next - now)
+
+
+class Stats:
+    """Injection / delivery counters and latency samples, reported per interval and overall."""
+
+    def __init__(self):
+        self.injected_at: Dict[str, float] = {}
+        self.injected = 0
+        self.errors = 0
+        self.delivered = 0
+        self.window: List[float] = []
+        self.samples: List[float] = []
+        self.started = time.perf_counter()
+
+    def inject(self, event_ids: List[str], track: bool):
+        now = time.perf_counter()
+        self.injected += len(event_ids)
+        if track:
+            for event_id in event_ids:
+                self.injected_at[event_id] = now
+
+    def deliver(self, event_id: Optional[str], received: float):
+        sent = self.injected_at.get(event_id) if event_id is not None else None
+        if sent is None:
+            return
+        latency = (received - sent) * 1000.0
+        self.delivered += 1
+        self.window.append(latency)
+        self.samples.append(latency)
+
+    @staticmethod
+    def percentiles(values: List[float]) -> str:
+        if not values:
+            return "p50=-  p95=-  p99=-  max=-"
+        values = sorted(values)
+        pick = lambda q: values[min(len(values) - 1, int(q * len(values)))]
+        return f"p50={pick(0.5):.1f}  p95={pick(0.95):.1f}  p99={pick(0.99):.1f}  max={values[-1]:.1f} ms"
+
+    def report(self, prev_injected: int, prev_delivered: int, interval: float) -> str:
+        line = (f"[{time.perf_counter() - self.started:6.1f}s] "
+                f"inject {(self.injected - prev_injected) / interval:8.0f}/s  "
+                f"deliver {(self.delivered - prev_delivered) / interval:8.0f}/s  "
+                f"errors {self.errors}  latency {self.percentiles(self.window)}")
+        self.window = []
+        return line
+
+
+class LoadGenerator:
+    def __init__(self, args: argparse.Namespace, stats: Stats):
+        self.args = args
+        self.stats = stats
+        self.limiter = RateLimiter(args.rate)
+        self.track = bool(args.ws_url)
+        self._redis = None
+        self._http = None
+        self._http_limit = asyncio.Semaphore(max(1, args.concurrency))
+        self._buffer: List[tuple] = []
+        self._flushed = asyncio.Event()
+        self._flusher: Optional[asyncio.Task] = None
+
+    async def start(self):
+        args = self.args
+        if args.target == "redis":
+            self._redis = aredis.Redis(host=args.redis_host, port=args.redis_port, db=args.redis_db,
+                                       password=args.redis_password, decode_responses=True,
+                                       max_connections=max(1, args.concurrency))
+            await self._redis.ping()
+            self._flusher = asyncio.create_task(self._flush_loop())
+        elif args.target == "webhook":
+            self._http = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=max(1, args.concurrency)),
+                timeout=aiohttp.ClientTimeout(total=30),
+            )
+
+    async def close(self):
+        if self._flusher is not None:
+            self._flusher.cancel()
+            await asyncio.gather(self._flusher, return_exceptions=True)
+            await self._flush()
+        if self._redis is not None:
+            await self._redis.close()
+        if self._http is not None:
+            await self._http.close()
+
+    # --- sinks -----------------------------------------------------------------------
+
+    async def _send(self, event: Dict[str, Any], seq: int):
+        if self.args.target == "redis":
+            if self.args.stream_format == "flat":
+                fields = to_stream_fields(event)
+            else:
+                fields = {"data": json.dumps(to_canonical(event, seq))}
+            stream = stream_for_match(self.args.stream_name, event["match_id"], self.args.shards)
+            self._buffer.append((stream, fields, event["event_id"]))
+            if len(self._buffer) >= self.args.batch_size:
+                await self._flush()
+        elif self.args.target == "webhook":
+            async with self._http_limit:
+                self.stats.inject([event["event_id"]], self.track)
+                try:
+                    async with self._http.post(self.args.webhook_url, json=to_grid_raw(event, seq)) as resp:
+                        if resp.status >= 400:
+                            self.stats.errors += 1
+                        await resp.read()
+                except Exception as e:
+                    self.stats.errors += 1
+                    if self.stats.errors <= 5:
+                        print(f"Error posting to webhook: {e}", file=sys.stderr)
+        else:
+            self.stats.inject([event["event_id"]], False)
+
+    async def _flush(self):
+        """One non-transactional pipeline for everything buffered (one round trip)."""
+        if not self._buffer:
+            return
+        batch, self._buffer = self._buffer, []
+        pipe = self._redis.pipeline(transaction=False)
+        for stream, fields, _event_id in batch:
+            if self.args.maxlen:
+                pipe.xadd(stream, fields, maxlen=self.args.maxlen, approximate=True)
+            else:
+                pipe.xadd(stream, fields)
+        self.stats.inject([event_id for _s, _f, event_id in batch], self.track)
+        try:
+            await pipe.execute()
+        except Exception as e:
+            self.stats.errors += len(batch)
+            print(f"Error streaming to Redis: {e}", file=sys.stderr)
+
+    async def _flush_loop(self):
+        while True:
+            await asyncio.sleep(self.args.linger_ms / 1000.0)
+            await self._flush()
+
+    # --- replay ----------------------------------------------------------------------
+
+    async def replay_match(self, events: List[Dict[str, Any]], start_delay: float = 0.0):
+        """Replay one match's timeline, paced by game time / speed and the global rate cap."""
+        if start_delay:
+            await asyncio.sleep(start_delay)
+        verbose = not self.args.quiet
+        t0 = time.perf_counter()
+        first = parse_ts(events[0]["timestamp"]) if events else None
+        for seq, event in enumerate(events):
+            if self.args.speed > 0:
+                due = t0 + (parse_ts(event["timestamp"]) - first).total_seconds() / self.args.speed
+                delay = due - time.perf_counter()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+            await self.limiter.wait()
+            await self._send(event, seq)
+            if verbose:
+                print(f"[{event['timestamp']}] {event['match_id']} {event['event_type']}: {event.get('actor', 'N/A')}")
+
+
+async def listen(url: str, stats: Stats, stop: asyncio.Event):
+    """One WebSocket viewer: every frame carrying a known event_id is a latency sample."""
+    while not stop.is_set():
+        try:
+            async with websockets.connect(url, max_size=None) as ws:
+                while not stop.is_set():
+                    try:
+                        frame = await asyncio.wait_for(ws.recv(), timeout=0.5)
+                    except asyncio.TimeoutError:
+                        continue
+                    received = time.perf_counter()
+                    try:
+                        msg = json.loads(frame)
+                    except ValueError:
+                        continue
+                    if isinstance(msg, dict):
+                        data = msg.get("data")
+                        stats.deliver(msg.get("event_id") or (data.get("event_id") if isinstance(data, dict) else None),
+                                      received)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            if not stop.is_set():
+                print(f"WebSocket listener error ({url}): {e}; reconnecting", file=sys.stderr)
+                await asyncio.sleep(1.0)
+
+
+async def report_loop(stats: Stats, interval: float):
+    injected = delivered = 0
+    while True:
+        await asyncio.sleep(interval)
+        print(stats.report(injected, delivered, interval), flush=True)
+        injected, delivered = stats.injected, stats.delivered
+
+
+async def run_load(args: argparse.Namespace, archive: Dict[str, Any], events: List[Dict[str, Any]]):
+    timeline = sorted(events + synthesize_positions(archive, events, args.position_hz, args.seed),
+                      key=lambda e: e["timestamp"])
+    base_id = archive["match"]["match_id"]
+    if args.matches == 1 and not args.match_prefix:
+        matches = {base_id: clone_for_match(timeline, base_id) if args.unique_ids else timeline}
+    else:
+        prefix = args.match_prefix or f"{base_id}-load"
+        matches = {f"{prefix}-{i:04d}": None for i in range(args.matches)}
+        for match_id in matches:
+            matches[match_id] = clone_for_match(timeline, match_id)
+    total = sum(len(v) for v in matches.values())
+    print(f"Replaying {len(matches)} match(es), {total} events "
+          f"({len(timeline)} per match, positions at {args.position_hz} Hz) -> {args.target}")
+
+    stats = Stats()
+    gen = LoadGenerator(args, stats)
+    stop = asyncio.Event()
+    await gen.start()
+    listeners = [asyncio.create_task(listen(args.ws_url, stats, stop)) for _ in range(args.ws_clients)] \
+        if args.ws_url else []
+    if listeners:
+        await asyncio.sleep(1.0)  # let viewers connect before the first event
+    reporter = asyncio.create_task(report_loop(stats, args.report_interval))
+    try:
+        stagger = args.ramp_seconds / len(matches) if args.ramp_seconds > 0 else 0.0
+        await asyncio.gather(*(gen.replay_match(evts, i * stagger) for i, evts in enumerate(matches.values())))
+        await gen.close()
+        if listeners:
+            # give the pipeline time to deliver what is still in flight
+            deadline = time.perf_counter() + args.drain_seconds
+            expected = stats.injected * args.ws_clients
+            while stats.delivered < expected and time.perf_counter() < deadline:
+                await asyncio.sleep(0.1)
+    finally:
+        stop.set()
+        reporter.cancel()
+        for task in listeners:
+            task.cancel()
+        await asyncio.gather(reporter, *listeners, return_exceptions=True)
+
+    elapsed = time.perf_counter() - stats.started
+    print(f"\nReplay complete: {stats.injected} events in {elapsed:.1f}s "
+          f"({stats.injected / elapsed:.0f}/s), {stats.errors} errors")
+    if args.ws_url:
+        expected = stats.injected * args.ws_clients
+        print(f"Delivered {stats.delivered}/{expected} to {args.ws_clients} WebSocket client(s); "
+              f"latency {Stats.percentiles(stats.samples)}")
+    if args.latency_csv and stats.samples:
+        with open(args.latency_csv, "w") as f:
+            f.write("latency_ms\n")
+            f.writelines(f"{v:.3f}\n" for v in stats.samples)
+        print(f"Latency samples written to {args.latency_csv}")
+
+
 def create_redis_consumer_groups(redis_client: Any):
     """Create consumer groups for event streams."""
     groups = [
@@ -130,7 +510,7 @@ def create_redis_consumer_groups(redis_client: Any):
         ("events:canonical", "ws_broadcaster"),
         ("events:agent:review", "human_reviewers"),
     ]
-    
+
     for stream_name, group_name in groups:
         try:
             redis_client.xgroup_create(stream_name, group_name, id="0", mkstream=True)
@@ -148,7 +528,7 @@ def main():
     parser.add_argument("--match-archive", type=str, required=True,
                        help="Path to match archive JSON file")
     parser.add_argument("--speed", type=float, default=1.0,
-                       help="Replay speed (1.0 = real-time, 2.0 = 2x speed)")
+                       help="Replay speed (1.0 = real-time, 2.0 = 2x speed, 0 = as fast as possible)")
     parser.add_argument("--redis-host", type=str, default="localhost",
                        help="Redis host")
     parser.add_argument("--redis-port", type=int, default=6379,
@@ -165,27 +545,81 @@ def main():
                        help="Don't use Redis, just print to stdout")
     parser.add_argument("--quiet", action="store_true",
                        help="Don't print events to stdout")
-    
+    # load generation
+    parser.add_argument("--target", choices=["redis", "webhook", "none"], default=None,
+                       help="Where to inject events (default: redis, or none with --no-redis)")
+    parser.add_argument("--matches", type=int, default=1,
+                       help="Concurrent synthetic matches cloned from the archive")
+    parser.add_argument("--match-prefix", type=str, default=None,
+                       help="Match id prefix for synthetic matches (default: <match_id>-load)")
+    parser.add_argument("--unique-ids", action="store_true",
+                       help="Prefix event ids with the match id even for a single match (re-runnable)")
+    parser.add_argument("--rate", type=float, default=0.0,
+                       help="Global cap on injected events per second (0 = no cap)")
+    parser.add_argument("--position-hz", type=float, default=0.0,
+                       help="Synthetic POSITION_UPDATE rate per player in game time (0 = none)")
+    parser.add_argument("--ramp-seconds", type=float, default=0.0,
+                       help="Stagger match starts over this many seconds")
+    parser.add_argument("--seed", type=int, default=0,
+                       help="Seed for synthetic positions")
+    parser.add_argument("--stream-format", choices=["data", "flat"], default="data",
+                       help="Stream entry layout: data = {'data': canonical JSON} as the consumers read it, "
+                            "flat = one field per attribute")
+    parser.add_argument("--shards", type=int, default=1,
+                       help="Write to <stream-name>:<crc32(match_id) %% N> like CANONICAL_STREAM_SHARDS")
+    parser.add_argument("--maxlen", type=int, default=None,
+                       help="Approximate MAXLEN trimming per XADD")
+    parser.add_argument("--batch-size", type=int, default=500,
+                       help="XADDs per Redis pipeline")
+    parser.add_argument("--linger-ms", type=float, default=5.0,
+                       help="Flush a partial Redis pipeline after this long")
+    parser.add_argument("--webhook-url", type=str, default="http://localhost:8000/webhook/grid",
+                       help="URL for --target webhook")
+    parser.add_argument("--concurrency", type=int, default=64,
+                       help="In-flight webhook requests / Redis connections")
+    parser.add_argument("--ws-url", type=str, default=None,
+                       help="WebSocket to measure delivery latency on, e.g. ws://localhost:8000/ws/replay?positions=raw "
+                            "(app.api; needs --stream-format data on the same Redis)")
+    parser.add_argument("--ws-clients", type=int, default=1,
+                       help="Number of WebSocket listeners")
+    parser.add_argument("--report-interval", type=float, default=5.0,
+                       help="Seconds between throughput / latency reports")
+    parser.add_argument("--drain-seconds", type=float, default=10.0,
+                       help="How long to wait for in-flight deliveries after the last injection")
+    parser.add_argument("--latency-csv", type=str, default=None,
+                       help="Write every latency sample (ms) to this CSV")
+
     args = parser.parse_args()
-    
+    if args.target is None:
+        args.target = "none" if args.no_redis else "redis"
+
     # Load archive
     archive_path = Path(args.match_archive)
     if not archive_path.exists():
         print(f"Error: File not found: {archive_path}", file=sys.stderr)
         sys.exit(1)
-    
+
     archive = load_match_archive(archive_path)
     events = extract_all_events(archive)
-    
+
     print(f"Loaded {len(events)} events from {archive_path}")
     print(f"Match: {archive['match']['match_id']}")
     print(f"Tournament: {archive['tournament']['name']}")
     print(f"Replay speed: {args.speed}x")
     print()
-    
+
+    if args.target == "redis" and not REDIS_AVAILABLE:
+        print("Warning: redis library not available. Install with: pip install redis")
+        args.target = "none"
+    if args.target == "webhook" and aiohttp is None:
+        print("Error: --target webhook needs aiohttp (pip install aiohttp)", file=sys.stderr)
+        sys.exit(1)
+    if args.ws_url and websockets is None:
+        print("Error: --ws-url needs websockets (pip install websockets)", file=sys.stderr)
+        sys.exit(1)
+
     # Setup Redis
-    redis_client = None
-    if not args.no_redis and REDIS_AVAILABLE:
+    if args.target == "redis":
         try:
             redis_client = redis.Redis(
                 host=args.redis_host,
@@ -196,32 +630,23 @@ def main():
             )
             redis_client.ping()
             print(f"Connected to Redis at {args.redis_host}:{args.redis_port}")
-            
+
             if args.setup_groups:
                 create_redis_consumer_groups(redis_client)
+            redis_client.close()
         except Exception as e:
             print(f"Warning: Could not connect to Redis: {e}", file=sys.stderr)
             print("Continuing without Redis...", file=sys.stderr)
-            redis_client = None
+            args.target = "none"
     elif args.no_redis:
         print("Redis disabled (--no-redis)")
-    else:
-        print("Warning: redis library not available. Install with: pip install redis")
-    
+
     # Start replay
     try:
-        replay_events(
-            events,
-            speed=args.speed,
-            redis_client=redis_client,
-            stream_name=args.stream_name,
-            verbose=not args.quiet
-        )
+        asyncio.run(run_load(args, archive, events))
     except KeyboardInterrupt:
         print("\nReplay interrupted by user")
 
 
 if __name__ == "__main__":
     main()
-
-
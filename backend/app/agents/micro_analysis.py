@@ -1,6 +1,6 @@
 # app/agents/micro_analysis.py
 import asyncio
-import json
+from app.utils.serialization import dumps
 import time
 import traceback
 from datetime import datetime, timezone
@@ -10,7 +10,7 @@ from app.settings import settings
 from app.features import FeatureWindowManager, compute_features_from_event
 from app.intent_model import IntentModel
 from app.hy_motion_client import HYMotionClient, MotionRequest
-from app.grid_storage import redis
+from app.consumer_runtime import ConsumerRuntime, shared_redis
 from app.storage import upload_bytes
 from app.persistence_hitl import create_review  # human-in-loop hook
 from uuid import uuid4
@@ -63,38 +63,28 @@ def is_sensitive_intent(intent: str) -> bool:
 
 async def publish_stream_event(stream_name: str, payload: Dict[str, Any]):
     """Publish event to Redis stream."""
-    r = await redis()
-    await r.xadd(stream_name, {"data": json.dumps(payload)})
+    r = await shared_redis()
+    await r.xadd(stream_name, {"data": dumps(payload)})
+
+def register_consumer(runtime: ConsumerRuntime):
+    # per-match feature windows stay correct when scaled out: each shard has one owner,
+    # and concurrent lanes within a batch never split a match
+    return runtime.group(
+        "micro_analysis",
+        CANONICAL_STREAM,
+        group="micro_analysis_group",
+        consumer=settings.INGESTOR_NAME,
+        handler=handle_canonical_event,
+        concurrency=settings.MICRO_ANALYSIS_CONCURRENCY,
+        count=10,
+        block_ms=1000,
+    )
 
 async def run_consumer():
-    r = await redis()
-    # set up consumer group
-    group = "micro_analysis_group"
-    stream = CANONICAL_STREAM
-    try:
-        await r.xgroup_create(stream, group, id="$", mkstream=True)
-    except Exception:
-        pass
-
-    while True:
-        try:
-            entries = await r.xreadgroup(group, consumer_name=settings.INGESTOR_NAME, streams={stream: ">"}, count=10, block=1000)
-            if not entries:
-                continue
-            for _stream_name, messages in entries:
-                for message_id, msg in messages:
-                    try:
-                        data = json.loads(msg.get("data"))
-                        await handle_canonical_event(data)
-                        # ack the message
-                        await r.xack(stream, group, message_id)
-                    except Exception:
-                        log.exception("failed to process event", event=msg)
-        except asyncio.CancelledError:
-            raise
-        except Exception:
-            log.exception("consumer loop error, sleeping briefly")
-            await asyncio.sleep(1)
+    """Run the agent until SIGTERM/SIGINT; the batch in hand is finished before exit."""
+    runtime = ConsumerRuntime()
+    register_consumer(runtime)
+    await runtime.run()
 
 async def handle_canonical_event(evt: Dict[str, Any]):
     """
@@ -180,7 +170,7 @@ async def handle_canonical_event(evt: Dict[str, Any]):
         await publish_agent_signal(match_id, actor, intent, confidence, motion_req, s3_url=None, error=str(e))
 
 async def publish_agent_signal(match_id, actor, intent, confidence, motion_req: MotionRequest, s3_url=None, review_required=False, review_id=None, error=None):
-    r = await redis()
+    r = await shared_redis()
     payload = {
         "signal_id": str(uuid4()),
         "type": "MOTION_SYNTHESIS",
@@ -195,7 +185,9 @@ async def publish_agent_signal(match_id, actor, intent, confidence, motion_req:
         "error": error,
         "generated_at": datetime.now(timezone.utc).isoformat()
     }
-    await r.xadd(AGENT_SIGNALS_STREAM, {"data": json.dumps(payload)})
+    await r.xadd(AGENT_SIGNALS_STREAM, {"data": dumps(payload)})
     # also emit to a WebSocket fanout or message bus as needed
     await publish_stream_event("agent.signals", payload)
 
+if __name__ == "__main__":
+    asyncio.run(run_consumer())
@@ -0,0 +1,286 @@
+# app/analytics/round_materializer.py
+"""
+Materializes rounds and macro_outcomes from ROUND_START / ROUND_END canonical events.
+
+Open rounds live in memory per match. Each consumer read batch is applied to that state and
+every round it touched is written with one multi-row upsert into `rounds` (RETURNING ids)
+plus one multi-row upsert into `macro_outcomes`, instead of a SELECT and an INSERT/UPDATE
+per event. A ROUND_START and ROUND_END in the same batch collapse into a single row.
+
+The batch is acked only after its flush commits. Open-round state that was already acked is
+rebuilt on start by scanning the tail of the stream (ROUND_STARTs without a later ROUND_END);
+entries still pending come back through the consumer's XAUTOCLAIM. All writes are upserts,
+so replaying an event is harmless.
+"""
+import logging
+import time
+import uuid
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+import aioredis
+
+from app.metrics import ROUNDS_OPEN, ROUNDS_FLUSH_SECONDS, ROUNDS_REJECTED_TOTAL
+from app.settings import settings
+from app.utils.serialization import dumps, loads
+
+logger = logging.getLogger("analytics.rounds")
+
+RoundKey = Tuple[str, int]
+
+_UPSERT_ROUNDS = """
+    INSERT INTO rounds (
+        id, match_id, map_id, round_no, round_start, round_end,
+        winner_team, site_executed, economy_snapshot, meta
+    )
+    SELECT id, match_id, map_id, round_no, round_start, round_end,
+           winner_team, site_executed, economy_snapshot::jsonb, meta::jsonb
+    FROM unnest(
+        $1::varchar[], $2::varchar[], $3::varchar[], $4::int[], $5::timestamptz[], $6::timestamptz[],
+        $7::varchar[], $8::bool[], $9::text[], $10::text[]
+    ) AS t(id, match_id, map_id, round_no, round_start, round_end,
+           winner_team, site_executed, economy_snapshot, meta)
+    ON CONFLICT (match_id, round_no) DO UPDATE
+    SET map_id = COALESCE(EXCLUDED.map_id, rounds.map_id),
+        round_start = COALESCE(EXCLUDED.round_start, rounds.round_start),
+        round_end = COALESCE(EXCLUDED.round_end, rounds.round_end),
+        winner_team = COALESCE(EXCLUDED.winner_team, rounds.winner_team),
+        site_executed = COALESCE(EXCLUDED.site_executed, rounds.site_executed),
+        economy_snapshot = COALESCE(EXCLUDED.economy_snapshot, rounds.economy_snapshot),
+        meta = COALESCE(EXCLUDED.meta, rounds.meta)
+    RETURNING id, match_id, round_no
+"""
+
+_UPSERT_OUTCOMES = """
+    INSERT INTO macro_outcomes (
+        id, round_id, match_id, team, round_win, econ_delta, site_executed, outcome_meta
+    )
+    SELECT id, round_id, match_id, team, round_win, econ_delta, site_executed, outcome_meta::jsonb
+    FROM unnest(
+        $1::varchar[], $2::varchar[], $3::varchar[], $4::varchar[], $5::bool[], $6::int[],
+        $7::bool[], $8::text[]
+    ) AS t(id, round_id, match_id, team, round_win, econ_delta, site_executed, outcome_meta)
+    ON CONFLICT (round_id, team) DO UPDATE
+    SET round_win = EXCLUDED.round_win,
+        econ_delta = EXCLUDED.econ_delta,
+        site_executed = EXCLUDED.site_executed,
+        outcome_meta = EXCLUDED.outcome_meta
+"""
+
+
+def parse_ts(value) -> Optional[datetime]:
+    """ISO-8601 string (incl. trailing Z) or datetime -> datetime; None if unparseable."""
+    if value is None or isinstance(value, datetime):
+        return value
+    if isinstance(value, str):
+        try:
+            return datetime.fromisoformat(value.replace("Z", "+00:00"))
+        except ValueError:
+            return None
+    return None
+
+
+def _rejected(exc: BaseException) -> bool:
+    """
+    Whether Postgres (or the driver encoding the arguments) refused the data itself: a retry
+    cannot succeed. asyncpg raises ValueError subclasses client-side and SQLSTATE class 22
+    (data exception) / 23 (integrity constraint) server-side.
+    """
+    return isinstance(exc, (ValueError, TypeError)) or str(getattr(exc, "sqlstate", "") or "")[:2] in ("22", "23")
+
+
+def _as_int(value) -> Optional[int]:
+    if value is None or isinstance(value, int):
+        return value
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _round_no(evt: dict, payload: dict) -> Optional[int]:
+    return _as_int(payload.get("round") or payload.get("round_no") or evt.get("round"))
+
+
+def _outcomes(payload: dict, winner, econ_snapshot, site_exec) -> List[dict]:
+    # Extract teams from payload or use winner/opponent logic
+    if payload.get("teamA") and payload.get("teamB"):
+        teams = list(dict.fromkeys([payload["teamA"], payload["teamB"]]))
+    elif winner:
+        # opponent unknown: only the winner's outcome can be recorded
+        teams = [winner]
+    else:
+        teams = []
+    outcomes = []
+    for team in teams:
+        econ_delta = None
+        if isinstance(econ_snapshot, dict) and team in econ_snapshot:
+            team_econ = econ_snapshot.get(team, {})
+            econ_delta = _as_int(team_econ.get("delta") or team_econ.get("change", 0))
+        outcomes.append({
+            "team": team,
+            "round_win": (team == winner) if winner else None,
+            "econ_delta": econ_delta,
+            "site_executed": site_exec,
+            "outcome_meta": dumps({"source": "round_end", "payload": payload}),
+        })
+    return outcomes
+
+
+class RoundMaterializer:
+    def __init__(self, pool, max_matches: int = 1024):
+        self.pool = pool
+        self.max_matches = max_matches
+        # match_id -> {round_no: row}; rounds started but not yet ended (least recently used first)
+        self._open: "OrderedDict[str, Dict[int, Dict[str, Any]]]" = OrderedDict()
+        # rounds touched since the last flush, merged per (match_id, round_no)
+        self._dirty: Dict[RoundKey, Dict[str, Any]] = {}
+        self._dirty_outcomes: Dict[RoundKey, List[dict]] = {}
+        ROUNDS_OPEN.set_function(lambda: sum(len(rounds) for rounds in list(self._open.values())))
+
+    def _open_rounds(self, match_id: str) -> Dict[int, Dict[str, Any]]:
+        rounds = self._open.get(match_id)
+        if rounds is None:
+            rounds = self._open[match_id] = {}
+            while len(self._open) > self.max_matches:
+                self._open.popitem(last=False)
+        else:
+            self._open.move_to_end(match_id)
+        return rounds
+
+    def apply(self, evt: dict, stage: bool = True) -> bool:
+        """Fold one canonical event into round state; returns True if it was a round event."""
+        etype = evt.get("event_type")
+        if etype not in ("ROUND_START", "ROUND_END"):
+            return False
+        match_id = evt.get("match_id")
+        payload = evt.get("payload") or {}
+        round_no = _round_no(evt, payload)
+        if match_id is None or round_no is None:
+            logger.warning(f"Skipping {etype} without match_id/round: event_id={evt.get('event_id')}")
+            return True
+        key = (match_id, round_no)
+        meta = dumps(evt)
+
+        if etype == "ROUND_START":
+            row = self._open_rounds(match_id).setdefault(round_no, {"match_id": match_id, "round_no": round_no})
+            row["map_id"] = evt.get("map_id") or evt.get("map")
+            row["round_start"] = parse_ts(evt.get("timestamp"))
+            row["meta"] = meta
+        else:
+            row = self._open_rounds(match_id).pop(round_no, None) or {"match_id": match_id, "round_no": round_no}
+            winner = payload.get("winner") or payload.get("winner_team")
+            econ_snapshot = payload.get("economy") or payload.get("economy_snapshot") or {}
+            site_exec = payload.get("site_executed", False)
+            row["map_id"] = row.get("map_id") or evt.get("map_id") or evt.get("map")
+            row["round_end"] = parse_ts(evt.get("timestamp"))
+            row["winner_team"] = winner
+            row["site_executed"] = site_exec
+            row["economy_snapshot"] = dumps(econ_snapshot)
+            row["meta"] = meta
+            if stage:
+                self._dirty_outcomes[key] = _outcomes(payload, winner, econ_snapshot, site_exec)
+        if stage:
+            self._dirty.setdefault(key, {}).update(row)
+        return True
+
+    async def flush(self):
+        """
+        Write every round touched since the last flush (two statements, one transaction).
+        If Postgres rejects the batch for its data, rounds are retried one per transaction
+        and only the ones rejected on their own are dropped (logged and counted), so one bad
+        event cannot keep every later batch from committing. Other errors (connection, pool)
+        propagate with the rows still staged, for the redelivered batch to retry.
+        """
+        if not self._dirty:
+            return
+        started = time.perf_counter()
+        try:
+            n_rounds, n_outcomes = await self._upsert(self._dirty, self._dirty_outcomes)
+        except Exception as e:
+            if not _rejected(e):
+                raise
+            logger.warning(f"Batch upsert of {len(self._dirty)} rounds rejected ({e}); retrying round by round")
+            n_rounds, n_outcomes = await self._flush_each()
+        ROUNDS_FLUSH_SECONDS.observe(time.perf_counter() - started)
+        logger.debug(f"Flushed {n_rounds} rounds, {n_outcomes} macro outcomes")
+        self._dirty.clear()
+        self._dirty_outcomes.clear()
+
+    async def _flush_each(self) -> Tuple[int, int]:
+        n_rounds = n_outcomes = 0
+        for key in list(self._dirty):
+            row, outcomes = self._dirty[key], self._dirty_outcomes.get(key)
+            try:
+                _, written = await self._upsert({key: row}, {key: outcomes} if outcomes else {})
+            except Exception as e:
+                if not _rejected(e):
+                    raise  # rounds written so far are unstaged below; the rest stay staged
+                ROUNDS_REJECTED_TOTAL.inc()
+                logger.error(f"Dropping round {key[0]}#{key[1]} rejected by Postgres: {e}; meta={row.get('meta')}")
+            else:
+                n_rounds += 1
+                n_outcomes += written
+            finally:
+                self._dirty.pop(key, None)
+                self._dirty_outcomes.pop(key, None)
+        return n_rounds, n_outcomes
+
+    async def _upsert(self, dirty: Dict[RoundKey, Dict[str, Any]],
+                      dirty_outcomes: Dict[RoundKey, List[dict]]) -> Tuple[int, int]:
+        rows = list(dirty.values())
+        cols = ("map_id", "round_start", "round_end", "winner_team", "site_executed", "economy_snapshot", "meta")
+        args = [[str(uuid.uuid4()) for _ in rows], [r["match_id"] for r in rows], *[[] for _ in range(8)]]
+        args[3] = [r["round_no"] for r in rows]
+        for i, col in zip((2, 4, 5, 6, 7, 8, 9), cols):
+            args[i] = [r.get(col) for r in rows]
+
+        async with self.pool.acquire() as conn:
+            async with conn.transaction():
+                returned = await conn.fetch(_UPSERT_ROUNDS, *args)
+                round_ids = {(rec["match_id"], rec["round_no"]): rec["id"] for rec in returned}
+                outcome_rows = [
+                    (str(uuid.uuid4()), round_ids[key], key[0], o["team"], o["round_win"],
+                     o["econ_delta"], o["site_executed"], o["outcome_meta"])
+                    for key, outcomes in dirty_outcomes.items() if key in round_ids
+                    for o in outcomes
+                ]
+                if outcome_rows:
+                    await conn.execute(_UPSERT_OUTCOMES, *[list(col) for col in zip(*outcome_rows)])
+        return len(rows), len(outcome_rows)
+
+    async def handle_batch(self, payloads: List[dict], ids: List[str]) -> List[str]:
+        """StreamConsumer batch handler: apply, flush once, ack everything on success."""
+        for evt in payloads:
+            self.apply(evt)
+        # on a non-data failure the staged rows stay dirty and the batch stays pending for redelivery
+        await self.flush()
+        return ids
+
+    async def rebuild(self, r: aioredis.Redis, stream: str):
+        """Restore open rounds from the tail of `stream` (newest first, bounded by count and age)."""
+        cutoff_ms = (time.time() - settings.ROUNDS_REBUILD_WINDOW_SECONDS) * 1000
+        remaining = settings.ROUNDS_REBUILD_MAX_ENTRIES
+        end = "+"
+        events = []
+        while remaining > 0:
+            page = await r.xrevrange(stream, max=end, min="-", count=min(1000, remaining))
+            if not page:
+                break
+            for message_id, data in page:
+                if int(message_id.split("-", 1)[0]) < cutoff_ms:
+                    remaining = 0
+                    break
+                try:
+                    evt = loads(data.get("data", "{}"))
+                except Exception:
+                    continue
+                if evt.get("event_type") in ("ROUND_START", "ROUND_END"):
+                    events.append(evt)
+            remaining -= len(page)
+            end = f"({page[-1][0]}"  # exclusive: continue before the oldest entry seen
+        for evt in reversed(events):
+            self.apply(evt, stage=False)
+        restored = sum(len(rounds) for rounds in self._open.values())
+        logger.info(f"Rebuilt {restored} open rounds from {len(events)} round events on {stream}")
@@ -2,11 +2,13 @@
 """
 Script to start analytics stream consumers.
 Run this as a separate process or Celery worker to continuously ingest data.
+SIGTERM/SIGINT drain in-flight batches before the pools are closed.
 """
 import asyncio
 import logging
-from app.analytics.stream_ingest import consume_micro, pg_connect
-from app.analytics.canonical_ingest import consume_canonical
+from app.analytics.stream_ingest import register_micro, pg_connect
+from app.analytics.canonical_ingest import register_canonical
+from app.consumer_runtime import ConsumerRuntime
 
 logging.basicConfig(
     level=logging.INFO,
@@ -22,14 +24,12 @@ async def main():
     pool = await pg_connect()
     logger.info("Database connection pool created")
     
+    runtime = ConsumerRuntime()
+    register_micro(runtime, pool)
+    register_canonical(runtime, pool)
     try:
-        # Run both consumers concurrently
-        await asyncio.gather(
-            consume_micro(pool),
-            consume_canonical(pool)
-        )
-    except KeyboardInterrupt:
-        logger.info("Shutting down consumers...")
+        # Run both consumers on one Redis pool until signalled, then drain
+        await runtime.run()
     finally:
         await pool.close()
         logger.info("Database connection pool closed")
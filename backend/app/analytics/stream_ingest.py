@@ -3,13 +3,12 @@
 Stream consumer for micro_actions (events:agent:motion).
 Listens to Redis streams and writes to Postgres.
 """
-import asyncio
-import json
+from app.utils.serialization import dumps
 import logging
-import aioredis
 import asyncpg
 from datetime import datetime
 from app.settings import settings
+from app.utils.stream_consumer import AdaptiveReadSize
 
 logger = logging.getLogger("analytics.ingest")
 
@@ -22,44 +21,156 @@ async def pg_connect():
     return await asyncpg.create_pool(settings.DATABASE_URL, min_size=1, max_size=5)
 
 
-async def consume_micro(pool):
+def register_micro(runtime, pool):
     """
-    Consume micro-action events from Redis stream and persist to Postgres.
+    Register the micro-action consumer (Redis stream -> Postgres) on a ConsumerRuntime.
+    Each read batch is written in one statement (COPY + merge for large batches) and acked
+    with a single XACK; stale pending entries are retried, then dead-lettered.
     """
-    r = await aioredis.from_url(settings.REDIS_URL, decode_responses=True)
-    group = "analytics_micro_group"
-    consumer = settings.INGESTOR_NAME + "_micro"
+    return runtime.group(
+        "micro_actions",
+        REDIS_STREAM_MICRO,
+        group="analytics_micro_group",
+        consumer=settings.INGESTOR_NAME + "_micro",
+        batch_handler=lambda payloads, ids: persist_micro_batch(payloads, ids, pool),
+        shards=1,  # agent signals are not partitioned
+        sizing=AdaptiveReadSize(
+            min_count=settings.MICRO_BATCH_MIN,
+            max_count=settings.MICRO_BATCH_MAX,
+            min_block_ms=settings.MICRO_BLOCK_MS_MIN,
+            max_block_ms=settings.MICRO_BLOCK_MS_MAX,
+            high_lag_ms=settings.MICRO_LAG_HIGH_MS,
+            low_lag_ms=settings.MICRO_LAG_LOW_MS,
+        ),
+    )
+
+
+_MICRO_COLUMNS = (
+    "signal_id", "match_id", "round_id", "player_id", "team", "intent",
+    "confidence", "features", "artifact_url", "generated_at", "ingestion_meta",
+)
+
+_MICRO_INSERT = """
+    INSERT INTO micro_actions (
+        signal_id, match_id, round_id, player_id, team, intent,
+        confidence, features, artifact_url, generated_at, ingestion_meta
+    )
+    VALUES ($1, $2, $3, $4, $5, $6, $7, $8, $9, $10, $11)
+    ON CONFLICT (signal_id) DO NOTHING
+"""
+
+# staging keeps JSON as text so COPY needs no codec; the merge casts it
+_MICRO_STAGE = """
+    CREATE TEMP TABLE IF NOT EXISTS micro_actions_stage (
+        signal_id VARCHAR(256), match_id VARCHAR(128), round_id VARCHAR(36),
+        player_id VARCHAR(128), team VARCHAR(128), intent VARCHAR(128),
+        confidence FLOAT, features TEXT, artifact_url VARCHAR(512),
+        generated_at TIMESTAMP WITH TIME ZONE, ingestion_meta TEXT
+    ) ON COMMIT DELETE ROWS
+"""
+
+_MICRO_MERGE = """
+    INSERT INTO micro_actions (
+        signal_id, match_id, round_id, player_id, team, intent,
+        confidence, features, artifact_url, generated_at, ingestion_meta
+    )
+    SELECT signal_id, match_id, round_id, player_id, team, intent,
+           confidence, features::jsonb, artifact_url, generated_at, ingestion_meta::jsonb
+    FROM micro_actions_stage
+    ON CONFLICT (signal_id) DO NOTHING
+"""
+
+
+def micro_row(payload) -> tuple:
+    """Map a micro-action payload (flexible agent motion structure) to a micro_actions row."""
+    # Extract fields with flexible structure
+    signal_id = payload.get("signal_id") or payload.get("id")
+    match_id = payload.get("match_id")
     
-    try:
-        await r.xgroup_create(REDIS_STREAM_MICRO, group, id="$", mkstream=True)
-    except Exception:
-        pass  # group already exists
+    # Try to extract round_id from various locations
+    round_id = (
+        payload.get("round_id") or
+        payload.get("motion_request", {}).get("meta", {}).get("round_id") or
+        payload.get("meta", {}).get("round_id")
+    )
+    
+    player_id = payload.get("player_id") or payload.get("player")
+    team = (
+        payload.get("team") or
+        payload.get("motion_request", {}).get("meta", {}).get("team") or
+        payload.get("meta", {}).get("team")
+    )
+    intent = payload.get("intent") or payload.get("motion_request", {}).get("intent")
+    confidence = payload.get("confidence")
+    
+    # Extract features
+    features = (
+        payload.get("features") or
+        payload.get("motion_request", {}).get("features") or
+        {}
+    )
     
-    logger.info(f"Starting micro-action consumer: {consumer}")
+    artifact_url = payload.get("artifact_url") or payload.get("artifact", {}).get("url")
     
-    while True:
+    # Parse generated_at timestamp
+    generated_at = None
+    if payload.get("generated_at"):
         try:
-            msgs = await r.xreadgroup(
-                group, consumer,
-                streams={REDIS_STREAM_MICRO: ">"},
-                count=20,
-                block=2000
-            )
-            if not msgs:
-                await asyncio.sleep(0.2)
-                continue
-            
-            for stream, entries in msgs:
-                for message_id, data in entries:
-                    try:
-                        payload = json.loads(data.get("data", "{}"))
-                        await persist_micro(payload, pool)
-                        await r.xack(REDIS_STREAM_MICRO, group, message_id)
-                    except Exception as e:
-                        logger.exception(f"Failed to process micro entry {message_id}: {e}")
+            generated_at = datetime.fromisoformat(payload["generated_at"].replace("Z", "+00:00"))
+        except:
+            pass
+    
+    return (
+        signal_id,
+        match_id,
+        round_id,
+        player_id,
+        team,
+        intent,
+        confidence,
+        dumps(features),
+        artifact_url,
+        generated_at,
+        dumps(payload)
+    )
+
+
+async def persist_micro_batch(payloads: list, ids: list, pool) -> list:
+    """
+    Write a read batch of micro actions in one transaction and return the ids to ack.
+    If the batch is rejected (e.g. a round_id that violates the rounds FK), rows are retried
+    one by one so a single bad entry only leaves itself pending.
+    """
+    rows, row_ids = [], []
+    for message_id, payload in zip(ids, payloads):
+        try:
+            rows.append(micro_row(payload))
+            row_ids.append(message_id)
         except Exception as e:
-            logger.exception(f"Error in micro consumer loop: {e}")
-            await asyncio.sleep(1)
+            logger.exception(f"Failed to map micro entry {message_id}: {e}")
+    if not rows:
+        return []
+    try:
+        async with pool.acquire() as conn:
+            async with conn.transaction():
+                if len(rows) >= settings.MICRO_COPY_MIN_ROWS:
+                    await conn.execute(_MICRO_STAGE)
+                    await conn.copy_records_to_table("micro_actions_stage", records=rows, columns=_MICRO_COLUMNS)
+                    await conn.execute(_MICRO_MERGE)
+                else:
+                    await conn.executemany(_MICRO_INSERT, rows)
+        return row_ids
+    except Exception as e:
+        logger.warning(f"Bulk insert of {len(rows)} micro actions failed, retrying per row: {e}")
+    acked = []
+    async with pool.acquire() as conn:
+        for message_id, row in zip(row_ids, rows):
+            try:
+                await conn.execute(_MICRO_INSERT, *row)
+                acked.append(message_id)
+            except Exception as e:
+                logger.exception(f"Failed to process micro entry {message_id}: {e}")
+    return acked
 
 
 async def persist_micro(payload, pool):
@@ -68,62 +179,4 @@ async def persist_micro(payload, pool):
     Handles flexible payload structure from agent motion signals.
     """
     async with pool.acquire() as conn:
-        # Extract fields with flexible structure
-        signal_id = payload.get("signal_id") or payload.get("id")
-        match_id = payload.get("match_id")
-        
-        # Try to extract round_id from various locations
-        round_id = (
-            payload.get("round_id") or
-            payload.get("motion_request", {}).get("meta", {}).get("round_id") or
-            payload.get("meta", {}).get("round_id")
-        )
-        
-        player_id = payload.get("player_id") or payload.get("player")
-        team = (
-            payload.get("team") or
-            payload.get("motion_request", {}).get("meta", {}).get("team") or
-            payload.get("meta", {}).get("team")
-        )
-        intent = payload.get("intent") or payload.get("motion_request", {}).get("intent")
-        confidence = payload.get("confidence")
-        
-        # Extract features
-        features = (
-            payload.get("features") or
-            payload.get("motion_request", {}).get("features") or
-            {}
-        )
-        
-        artifact_url = payload.get("artifact_url") or payload.get("artifact", {}).get("url")
-        
-        # Parse generated_at timestamp
-        generated_at = None
-        if payload.get("generated_at"):
-            try:
-                generated_at = datetime.fromisoformat(payload["generated_at"].replace("Z", "+00:00"))
-            except:
-                pass
-        
-        await conn.execute("""
-            INSERT INTO micro_actions (
-                signal_id, match_id, round_id, player_id, team, intent,
-                confidence, features, artifact_url, generated_at, ingestion_meta
-            )
-            VALUES ($1, $2, $3, $4, $5, $6, $7, $8, $9, $10, $11)
-            ON CONFLICT (signal_id) DO NOTHING
-        """,
-            signal_id,
-            match_id,
-            round_id,
-            player_id,
-            team,
-            intent,
-            confidence,
-            json.dumps(features),
-            artifact_url,
-            generated_at,
-            json.dumps(payload)
-        )
-
-
+        await conn.execute(_MICRO_INSERT, *micro_row(payload))
@@ -9,7 +9,7 @@ from app.celery_orchestrator import run_orchestration   # celery task from earli
 from app.ws_broadcast import broadcaster
 from app.api_data import router as data_router
 from app.api_hitl import router as hitl_router
-from app.ws_replay import router as replay_router
+from app.ws_replay import router as replay_router, canonical_tail
 from app.narrative import router as narrative_router
 from app.api_motion import router as motion_router
 from app.db import init_db
@@ -130,6 +130,14 @@ async def startup_event():
         log.error("Failed to initialize WebSocket broadcaster", error=str(e), exc_info=True)
         raise
 
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Stop the replay viewers' canonical stream reader."""
+    try:
+        await canonical_tail.close()
+    except Exception as e:
+        log.error("Error stopping replay stream reader", error=str(e), exc_info=True)
+
 # If running as main process
 if __name__ == "__main__":
     uvicorn.run("app.api:app", host="0.0.0.0", port=int(os.getenv("PORT", 8000)), reload=False)
@@ -0,0 +1,173 @@
+# app/consumer_runtime.py
+"""
+One process-wide runtime for Redis Streams consumers.
+
+    runtime = ConsumerRuntime()
+    runtime.group("canonical", CANONICAL_STREAM, group="...", consumer="...",
+                  batch_handler=..., concurrency=4)
+    await runtime.run()          # until SIGTERM/SIGINT, then drain
+
+- every consumer shares one bounded, blocking Redis connection pool (`shared_redis()`)
+  instead of opening its own client;
+- each registered handler is wrapped with a semaphore (in-flight limit across all of its
+  shards/lanes) and per-handler throughput / latency metrics;
+- on SIGTERM each consumer stops reading, finishes and acks the batch in hand (bounded by
+  CONSUMER_DRAIN_SECONDS), releases its shard leases, and the pool is closed last.
+"""
+import asyncio
+import logging
+import signal
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+import aioredis
+
+from app.metrics import CONSUMER_EVENTS_TOTAL, CONSUMER_HANDLER_SECONDS, CONSUMER_INFLIGHT
+from app.settings import settings
+from app.stream_shards import ShardedConsumerGroup
+
+logger = logging.getLogger("consumer_runtime")
+
+_shared_redis: Optional[aioredis.Redis] = None
+
+
+async def shared_redis() -> aioredis.Redis:
+    """Process-wide Redis client over a bounded pool; callers wait for a free connection."""
+    global _shared_redis
+    if _shared_redis is None:
+        pool = aioredis.BlockingConnectionPool.from_url(
+            settings.REDIS_URL,
+            max_connections=settings.REDIS_MAX_CONNECTIONS,
+            timeout=settings.REDIS_POOL_TIMEOUT,
+            decode_responses=True,
+        )
+        _shared_redis = aioredis.Redis(connection_pool=pool)
+    return _shared_redis
+
+
+async def close_shared_redis():
+    global _shared_redis
+    if _shared_redis is not None:
+        client, _shared_redis = _shared_redis, None
+        try:
+            await client.close()
+            await client.connection_pool.disconnect()
+        except Exception as e:
+            logger.warning(f"Error closing Redis pool: {e}")
+
+
+class ConsumerRuntime:
+    def __init__(self, redis_factory: Optional[Callable[[], Awaitable[aioredis.Redis]]] = None,
+                 drain_timeout: Optional[float] = None):
+        self.redis_factory = redis_factory or shared_redis
+        self.drain_timeout = drain_timeout if drain_timeout is not None else settings.CONSUMER_DRAIN_SECONDS
+        self._workers: Dict[str, Any] = {}  # name -> object with run() / stop()
+        self._stop_requested = asyncio.Event()
+
+    def instrument(self, name: str, handler: Optional[Callable] = None,
+                   batch_handler: Optional[Callable] = None, concurrency: Optional[int] = None):
+        """Wrap a per-event or batch handler with an in-flight limit and metrics labelled `name`."""
+        limit = asyncio.Semaphore(concurrency) if concurrency else None
+        seconds = CONSUMER_HANDLER_SECONDS.labels(handler=name)
+        inflight = CONSUMER_INFLIGHT.labels(handler=name)
+
+        async def call(fn, n_events: int, *args):
+            if limit is not None:
+                await limit.acquire()
+            inflight.inc()
+            started = time.perf_counter()
+            try:
+                result = await fn(*args)
+            except Exception:
+                CONSUMER_EVENTS_TOTAL.labels(handler=name, outcome="error").inc(n_events)
+                raise
+            finally:
+                seconds.observe(time.perf_counter() - started)
+                inflight.dec()
+                if limit is not None:
+                    limit.release()
+            CONSUMER_EVENTS_TOTAL.labels(handler=name, outcome="ok").inc(n_events)
+            return result
+
+        if batch_handler is not None:
+            async def run_batch(payloads: List[Any], ids: List[str]) -> List[str]:
+                return await call(batch_handler, len(payloads), payloads, ids)
+            return run_batch
+
+        async def run_one(payload: Any):
+            return await call(handler, 1, payload)
+        return run_one
+
+    def group(self, name: str, stream: str, group: str, consumer: str,
+              handler: Optional[Callable] = None, batch_handler: Optional[Callable] = None,
+              concurrency: Optional[int] = None, **kwargs) -> ShardedConsumerGroup:
+        """
+        Register a consumer group on `stream`. `concurrency` bounds in-flight handler calls;
+        per-event handlers also process that many matches of a batch in parallel.
+        Remaining kwargs go to ShardedConsumerGroup / StreamConsumer (shards, count, ...).
+        """
+        if batch_handler is not None:
+            kwargs["batch_handler"] = self.instrument(name, batch_handler=batch_handler, concurrency=concurrency)
+        else:
+            kwargs["handler"] = self.instrument(name, handler=handler, concurrency=concurrency)
+            kwargs.setdefault("concurrency", concurrency or 1)
+        worker = ShardedConsumerGroup(stream, group, consumer, redis_factory=self.redis_factory, **kwargs)
+        self.add(name, worker)
+        return worker
+
+    def add(self, name: str, worker):
+        """Register anything with `async run()` and `stop()`."""
+        if name in self._workers:
+            raise ValueError(f"consumer {name!r} already registered")
+        self._workers[name] = worker
+
+    def request_stop(self):
+        if not self._stop_requested.is_set():
+            logger.info("Stop requested; draining consumers")
+            self._stop_requested.set()
+
+    async def run(self, install_signal_handlers: bool = True):
+        """Run every registered consumer until stopped (signal or request_stop), then drain."""
+        loop = asyncio.get_running_loop()
+        if install_signal_handlers:
+            for sig in (signal.SIGTERM, signal.SIGINT):
+                try:
+                    loop.add_signal_handler(sig, self.request_stop)
+                except (NotImplementedError, RuntimeError):
+                    pass  # not on the main thread / platform without signal support
+        tasks = {loop.create_task(worker.run(), name=f"consumer:{name}"): name
+                 for name, worker in self._workers.items()}
+        stop_wait = loop.create_task(self._stop_requested.wait())
+        logger.info(f"Consumer runtime started: {', '.join(self._workers) or 'no consumers'}")
+        try:
+            done, _ = await asyncio.wait([stop_wait, *tasks], return_when=asyncio.FIRST_COMPLETED)
+            for task in done - {stop_wait}:
+                if not task.cancelled() and task.exception() is not None:
+                    logger.error(f"Consumer {tasks[task]} crashed: {task.exception()!r}; stopping runtime")
+                else:
+                    logger.warning(f"Consumer {tasks[task]} exited; stopping runtime")
+        finally:
+            stop_wait.cancel()
+            await self._drain(tasks)
+            if install_signal_handlers:
+                for sig in (signal.SIGTERM, signal.SIGINT):
+                    try:
+                        loop.remove_signal_handler(sig)
+                    except (NotImplementedError, RuntimeError):
+                        pass
+            if self.redis_factory is shared_redis:
+                await close_shared_redis()
+
+    async def _drain(self, tasks: Dict[asyncio.Task, str]):
+        for worker in self._workers.values():
+            worker.stop()
+        pending = [t for t in tasks if not t.done()]
+        if not pending:
+            return
+        _done, still_running = await asyncio.wait(pending, timeout=self.drain_timeout)
+        for task in still_running:
+            logger.warning(f"Consumer {tasks[task]} did not drain within {self.drain_timeout}s; cancelling")
+            task.cancel()
+        if still_running:
+            await asyncio.gather(*still_running, return_exceptions=True)
+        logger.info("Consumer runtime stopped")
@@ -1,7 +1,11 @@
 # app/db.py
 from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker, declarative_base
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
+import functools
 import os
+from app.utils.serialization import dumps
 
 DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./data/agent_data.db")  # change to Postgres in prod
 
@@ -11,10 +15,26 @@ if DATABASE_URL.startswith("sqlite"):
     if "/" in db_path:
         os.makedirs(os.path.dirname(db_path), exist_ok=True)
 
-engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False} if DATABASE_URL.startswith("sqlite") else {})
+engine = create_engine(
+    DATABASE_URL,
+    connect_args={"check_same_thread": False} if DATABASE_URL.startswith("sqlite") else {},
+    json_serializer=dumps,  # JSON columns (raw/canonical payloads) use the fast codec
+)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
 
+# Dedicated threads for blocking DB work issued from async code (bulk writers, ingest).
+# Kept separate from the default executor so slow commits can't starve other to_thread users.
+db_executor = ThreadPoolExecutor(
+    max_workers=int(os.getenv("DB_EXECUTOR_WORKERS", "4")),
+    thread_name_prefix="db-writer",
+)
+
+async def run_db(fn, *args, **kwargs):
+    """Run a blocking DB call on `db_executor` without blocking the event loop."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(db_executor, functools.partial(fn, *args, **kwargs))
+
 def init_db():
     from app import models  # ensure models are imported before create_all
     from app import models_hitl  # ensure HITL models are imported before create_all
@@ -1,26 +1,143 @@
 # app/enricher.py
+import logging
 import math
+import time
+from collections import OrderedDict
 from datetime import datetime
-from typing import Dict, Any
-from app.schemas import CanonicalEvent
+from typing import Dict, Any, List, Optional, Union
+from app.metrics import ENRICHER_TRACKED_MATCHES, ENRICHER_STATE_ENTRIES, ENRICHER_EVICTIONS_TOTAL
+from app.schemas import CanonicalEvent, CanonicalRecord
+from app.settings import settings
+from app.spatial_index import SpatialGrid
+from app.position_history import PositionRing, to_ts, to_xyz
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+MATCH_END_EVENTS = ("MATCH_END", "GAME_END", "SERIES_END")
+TRADE_RADIUS_M = 15.0  # 15 meters for trade window
+
+
+class MatchStateStore:
+    """
+    In-memory per-match enrichment state (single process), bounded three ways:
+    - matches are evicted on MATCH_END, after `ttl_seconds` without events, or LRU beyond `max_matches`
+    - per-round maps keep only the latest `max_rounds` rounds
+    - `last_kills` keeps the last 5 kills
+    Workers that partition events by match_id each own the state of their matches.
+    """
+
+    def __init__(self, max_matches: int, ttl_seconds: float, max_rounds: int):
+        self.max_matches = max_matches
+        self.ttl_seconds = ttl_seconds
+        self.max_rounds = max_rounds
+        self._states: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()  # least recently used first
+        self._last_seen: Dict[str, float] = {}
+        ENRICHER_TRACKED_MATCHES.set_function(lambda: len(self._states))
+        ENRICHER_STATE_ENTRIES.labels(kind="positions").set_function(lambda: self._count("last_positions") + self._count("spatial") + self._count("tracks"))
+        ENRICHER_STATE_ENTRIES.labels(kind="rounds").set_function(lambda: self._count("round_econ") + self._count("round_first_kill"))
+
+    def _count(self, key: str) -> int:
+        return sum(len(st[key]) for st in list(self._states.values()))
+
+    def get(self, match_id: str) -> Dict[str, Any]:
+        now = time.monotonic()
+        st = self._states.get(match_id)
+        if st is None:
+            self.sweep(now)
+            st = {
+                "last_positions": {},           # player_id -> {"pos": (x,y,z), "t": timestamp}
+                "round_econ": OrderedDict(),    # round_id -> {team: econ}
+                "last_kills": [],               # recent kill events for streaks
+                "round_first_kill": OrderedDict(),  # round_id -> actor
+                "spatial": SpatialGrid(cell_size=TRADE_RADIUS_M),  # last positions + teams for radius queries
+                "tracks": {},           # player_id -> PositionRing (ts, xyz, velocity history)
+            }
+            self._states[match_id] = st
+            while len(self._states) > self.max_matches:
+                oldest, _ = self._states.popitem(last=False)
+                self._last_seen.pop(oldest, None)
+                ENRICHER_EVICTIONS_TOTAL.labels(reason="lru").inc()
+        else:
+            self._states.move_to_end(match_id)
+        self._last_seen[match_id] = now
+        return st
+
+    def remember_round(self, mapping: "OrderedDict[Any, Any]", round_id, value):
+        """Store per-round state, dropping the oldest rounds beyond `max_rounds`."""
+        mapping[round_id] = value
+        mapping.move_to_end(round_id)
+        while len(mapping) > self.max_rounds:
+            mapping.popitem(last=False)
+
+    def evict(self, match_id: str, reason: str = "match_end") -> bool:
+        self._last_seen.pop(match_id, None)
+        if self._states.pop(match_id, None) is None:
+            return False
+        ENRICHER_EVICTIONS_TOTAL.labels(reason=reason).inc()
+        return True
+
+    def sweep(self, now: Optional[float] = None):
+        """Drop matches idle for longer than `ttl_seconds` (oldest first, so this stops early)."""
+        cutoff = (now if now is not None else time.monotonic()) - self.ttl_seconds
+        while self._states:
+            match_id = next(iter(self._states))
+            if self._last_seen.get(match_id, 0.0) >= cutoff:
+                break
+            self.evict(match_id, reason="ttl")
+
+    def __contains__(self, match_id: str) -> bool:
+        return match_id in self._states
+
+    def __delitem__(self, match_id: str):
+        if not self.evict(match_id, reason="manual"):
+            raise KeyError(match_id)
+
+    def __len__(self) -> int:
+        return len(self._states)
+
 
 # simple in-memory match state (for single-process). In prod use Redis or persistent store.
-_match_state: Dict[str, Dict[str, Any]] = {}
+_match_state = MatchStateStore(
+    max_matches=settings.ENRICHER_MAX_MATCHES,
+    ttl_seconds=settings.ENRICHER_MATCH_TTL,
+    max_rounds=settings.ENRICHER_MAX_ROUNDS,
+)
 
 def _ensure_state(match_id: str):
-    if match_id not in _match_state:
-        _match_state[match_id] = {
-            "last_positions": {},   # player_id -> {"pos": (x,y,z), "t": timestamp}
-            "round_econ": {},       # round_id -> {team: econ}
-            "last_kills": [],       # recent kill events for streaks
-            "round_first_kill": {}, # round_id -> actor
-        }
-    return _match_state[match_id]
+    return _match_state.get(match_id)
 
 def _distance(a, b):
     return math.sqrt((a[0]-b[0])**2 + (a[1]-b[1])**2 + (a[2]-b[2])**2)
 
-async def enrich_canonical(c: CanonicalEvent) -> Dict[str, Any]:
+def _track(s: Dict[str, Any], pid: str) -> PositionRing:
+    track = s["tracks"].get(pid)
+    if track is None:
+        track = s["tracks"][pid] = PositionRing(settings.ENRICHER_TRACK_CAPACITY)
+    return track
+
+def _set_motion(enriched: Dict[str, Any], speed: Optional[float], accel: Optional[float], heading: Optional[float]):
+    # speed/accel from consecutive samples; heading change is the angle between velocity vectors
+    enriched["player_speed_m_s"] = round(speed, 3) if speed is not None else None
+    enriched["player_accel_m_s2"] = round(accel, 3) if accel is not None else None
+    enriched["heading_change_deg"] = round(heading, 1) if heading is not None else None
+
+def _set_objective(enriched: Dict[str, Any], dist: float):
+    enriched["dist_to_objective_m"] = round(dist, 2)
+
+    # New: Objective Control Signal
+    # If player is very close to objective, they are "controlling" it
+    if dist < 5.0:
+        enriched["objective_control"] = "ACTIVE"
+        enriched["control_intensity"] = round(1.0 - (dist / 5.0), 2)
+    elif dist < 15.0:
+        enriched["objective_control"] = "CONTESTING"
+        enriched["control_intensity"] = round(1.0 - (dist / 15.0), 2)
+    else:
+        enriched["objective_control"] = "NONE"
+        enriched["control_intensity"] = 0.0
+
+async def enrich_canonical(c: Union[CanonicalEvent, CanonicalRecord]) -> Dict[str, Any]:
     """
     Add derived signals to canonical event. Keep deterministic and explainable.
     """
@@ -35,22 +152,17 @@ async def enrich_canonical(c: CanonicalEvent) -> Dict[str, Any]:
         pos = payload.get("pos")
         ts = payload.get("ts") or c.ingestion_meta.get("grid_seq") or None
         if pid and pos:
-            last = s["last_positions"].get(pid)
-            if last and last.get("pos") and ts:
-                # compute elapsed in seconds; GRID's ts may be game_time in seconds
-                try:
-                    elapsed = float(ts) - float(last.get("t"))
-                    if elapsed > 0:
-                        dist = _distance(pos, last["pos"])
-                        speed = dist / elapsed
-                        enriched["player_speed_m_s"] = round(speed, 3)
-                    else:
-                        enriched["player_speed_m_s"] = 0.0
-                except Exception:
-                    enriched["player_speed_m_s"] = None
-            else:
-                enriched["player_speed_m_s"] = None
+            track = _track(s, pid)
+            try:
+                speed, accel, heading = track.push(to_ts(ts), pos)
+            except (TypeError, ValueError, IndexError):
+                speed = accel = heading = None
+            _set_motion(enriched, speed, accel, heading)
             s["last_positions"][pid] = {"pos": pos, "t": ts}
+            try:
+                s["spatial"].update(pid, pos, team=payload.get("team") or c.team)
+            except (TypeError, ValueError, IndexError):
+                pass  # malformed position; keep the raw value for speed only
 
     # 2) KILL event -> opening_kill, streaks, and trade potential
     if c.event_type == "KILL":
@@ -60,24 +172,24 @@ async def enrich_canonical(c: CanonicalEvent) -> Dict[str, Any]:
         if round_id:
             # opening kill
             if s["round_first_kill"].get(round_id) is None:
-                s["round_first_kill"][round_id] = actor
+                _match_state.remember_round(s["round_first_kill"], round_id, actor)
                 enriched["opening_kill"] = True
             else:
                 enriched["opening_kill"] = False
         
-        # trade potential: check if anyone on victim's team is nearby to trade
-        # requires victim's last position
-        if target and s["last_positions"].get(target):
-            v_pos = s["last_positions"][target]["pos"]
-            teammates_nearby = 0
-            for pid, pdata in s["last_positions"].items():
-                # skip victim and killer
-                if pid == target or pid == actor:
-                    continue
-                # check if same team (heuristic: GRID payload might have team info)
-                # For now, just check distance
-                if _distance(v_pos, pdata["pos"]) < 15.0: # 15 meters for trade window
-                    teammates_nearby += 1
+        # trade potential: count the victim's teammates within the trade window of the victim's
+        # last position, using the per-match spatial grid instead of scanning every player
+        grid = s["spatial"]
+        v_pos = grid.position_of(target) if target else None
+        if v_pos is not None:
+            victim_team = payload.get("victim_team") or grid.team_of(target)
+            killer_team = payload.get("killer_team") or payload.get("attacker_team") or (grid.team_of(actor) if actor else None)
+            if victim_team:
+                nearby = grid.query_radius(v_pos, TRADE_RADIUS_M, exclude=(target, actor), team=victim_team)
+            else:
+                # team unknown: anyone who is not the killer (or on the killer's team, if known)
+                nearby = grid.query_radius(v_pos, TRADE_RADIUS_M, exclude=(target, actor), exclude_team=killer_team)
+            teammates_nearby = len(nearby)
             enriched["trade_potential_count"] = teammates_nearby
             enriched["is_untraded_risk"] = teammates_nearby == 0
 
@@ -100,10 +212,10 @@ async def enrich_canonical(c: CanonicalEvent) -> Dict[str, Any]:
         round_id = payload.get("round") or payload.get("round_id")
         if round_id:
             if c.event_type == "ROUND_START":
-                s["round_econ"][round_id] = {
+                _match_state.remember_round(s["round_econ"], round_id, {
                     "teamA": payload.get("teamA_bank"),
                     "teamB": payload.get("teamB_bank")
-                }
+                })
                 enriched["team_econ_delta"] = None
             else:
                 prev = s["round_econ"].get(round_id)
@@ -119,22 +231,7 @@ async def enrich_canonical(c: CanonicalEvent) -> Dict[str, Any]:
 
     # 4) proximity to objective (bomb site) if position and site coords available
     if payload.get("pos") and payload.get("objective_pos"):
-        pos = payload.get("pos")
-        obj = payload.get("objective_pos")
-        dist = _distance(pos, obj)
-        enriched["dist_to_objective_m"] = round(dist, 2)
-        
-        # New: Objective Control Signal
-        # If player is very close to objective, they are "controlling" it
-        if dist < 5.0:
-            enriched["objective_control"] = "ACTIVE"
-            enriched["control_intensity"] = round(1.0 - (dist / 5.0), 2)
-        elif dist < 15.0:
-            enriched["objective_control"] = "CONTESTING"
-            enriched["control_intensity"] = round(1.0 - (dist / 15.0), 2)
-        else:
-            enriched["objective_control"] = "NONE"
-            enriched["control_intensity"] = 0.0
+        _set_objective(enriched, _distance(to_xyz(payload.get("pos")), to_xyz(payload.get("objective_pos"))))
 
     # 5) default passthrough enriched metadata: compute confidence placeholders
     # (real confidence comes from models, but we can provide heuristic confidence)
@@ -144,5 +241,119 @@ async def enrich_canonical(c: CanonicalEvent) -> Dict[str, Any]:
     # 6) attach ingestion meta for auditing
     enriched["_ingestion"] = c.ingestion_meta
 
+    # 7) match finished -> release its state
+    if c.event_type in MATCH_END_EVENTS:
+        _match_state.evict(c.match_id)
+
     return enriched
 
+
+
+async def enrich_batch(events: List[Union[CanonicalEvent, CanonicalRecord]]) -> List[Dict[str, Any]]:
+    """
+    Enrich a list of canonical events in order, returning one enriched dict per event.
+    Consecutive POSITION_UPDATE events are handled together: each player's samples go
+    through PositionRing.extend and objective distances are computed as one array op.
+    Output matches calling enrich_canonical on each event in turn; an event whose
+    enrichment fails gets {} (as normalize_grid_event does) and the rest carry on, so
+    no event is applied to match state twice.
+    """
+    results: List[Dict[str, Any]] = []
+    run: List[Union[CanonicalEvent, CanonicalRecord]] = []
+    for c in events:
+        if c.event_type == "POSITION_UPDATE":
+            run.append(c)
+            continue
+        if run:
+            results.extend(_enrich_run_safely(run))
+            run = []
+        try:
+            results.append(await enrich_canonical(c))
+        except Exception as e:
+            logger.warning(f"Enrichment failed for event_id={c.event_id}: {e}", exc_info=True)
+            results.append({})
+    if run:
+        results.extend(_enrich_run_safely(run))
+    return results
+
+
+def _enrich_run_safely(run: List[Union[CanonicalEvent, CanonicalRecord]]) -> List[Dict[str, Any]]:
+    # per-sample errors are handled inside the run; this only guards against the unexpected
+    try:
+        return _enrich_position_run(run)
+    except Exception as e:
+        logger.warning(f"Position enrichment failed for {len(run)} events: {e}", exc_info=True)
+        return [{} for _ in run]
+
+
+def _enrich_position_run(run: List[Union[CanonicalEvent, CanonicalRecord]]) -> List[Dict[str, Any]]:
+    out: List[Dict[str, Any]] = [{} for _ in run]
+    groups: Dict[tuple, List[int]] = {}
+    for i, c in enumerate(run):
+        payload = c.payload or {}
+        pid = payload.get("player_id") or c.actor
+        if pid and payload.get("pos"):
+            groups.setdefault((c.match_id, pid), []).append(i)
+        else:
+            _ensure_state(c.match_id)
+
+    # 1) per-player motion over the whole run
+    for (match_id, pid), idxs in groups.items():
+        s = _ensure_state(match_id)
+        try:
+            pos = np.array([to_xyz(run[i].payload["pos"]) for i in idxs], dtype=float)
+        except (TypeError, ValueError, IndexError):
+            pos = None
+        if pos is None:
+            # malformed sample somewhere in the group: fall back to per-sample updates
+            for i in idxs:
+                c = run[i]
+                ts = c.payload.get("ts") or c.ingestion_meta.get("grid_seq") or None
+                try:
+                    motion = _track(s, pid).push(to_ts(ts), c.payload["pos"])
+                except (TypeError, ValueError, IndexError):
+                    motion = (None, None, None)
+                _set_motion(out[i], *motion)
+                s["last_positions"][pid] = {"pos": c.payload["pos"], "t": ts}
+                try:
+                    s["spatial"].update(pid, c.payload["pos"], team=c.payload.get("team") or c.team)
+                except (TypeError, ValueError, IndexError):
+                    pass  # malformed position; keep the raw value for speed only
+            continue
+        ts_raw = [run[i].payload.get("ts") or run[i].ingestion_meta.get("grid_seq") or None for i in idxs]
+        speed, accel, heading = _track(s, pid).extend(np.array([to_ts(t) for t in ts_raw], dtype=float), pos)
+        # back to Python floats once per group; NaN (x != x) marks "not computable"
+        for i, sp, ac, hd in zip(idxs, speed.tolist(), accel.tolist(), heading.tolist()):
+            _set_motion(out[i], sp if sp == sp else None, ac if ac == ac else None, hd if hd == hd else None)
+        last = run[idxs[-1]]
+        s["last_positions"][pid] = {"pos": last.payload["pos"], "t": ts_raw[-1]}
+        team = None
+        for i in idxs:
+            team = run[i].payload.get("team") or run[i].team or team
+        s["spatial"].update(pid, pos[-1], team=team)
+
+    # 4) objective proximity for every sample that carries both coordinates
+    failed = set()
+    with_obj = [i for i, c in enumerate(run) if (c.payload or {}).get("pos") and c.payload.get("objective_pos")]
+    if with_obj:
+        try:
+            pos = np.array([to_xyz(run[i].payload["pos"]) for i in with_obj], dtype=float)
+            obj = np.array([to_xyz(run[i].payload["objective_pos"]) for i in with_obj], dtype=float)
+            dists = np.sqrt(((pos - obj) ** 2).sum(axis=1)).tolist()
+        except (TypeError, ValueError, IndexError):
+            dists = None
+        for j, i in enumerate(with_obj):
+            if dists is not None:
+                _set_objective(out[i], dists[j])
+            else:
+                try:
+                    _set_objective(out[i], _distance(to_xyz(run[i].payload["pos"]), to_xyz(run[i].payload["objective_pos"])))
+                except Exception:
+                    out[i] = {}  # mirrors enrich_canonical failing for this event
+                    failed.add(i)
+
+    # 6) attach ingestion meta for auditing
+    for i, c in enumerate(run):
+        if i not in failed:
+            out[i]["_ingestion"] = c.ingestion_meta
+    return out
@@ -1,14 +1,18 @@
 # app/grid_client.py
 import asyncio
-import json
+import contextlib
+from app.utils.serialization import loads, JSONDecodeError
 import logging
 import math
 import random
 from typing import Optional
 from tenacity import retry, wait_exponential, stop_after_attempt, retry_if_exception_type
 from app.settings import settings
-from app.grid_normalizer import normalize_grid_event
-from app.grid_storage import persist_raw_event, publish_canonical
+from app.db import run_db
+from app.grid_storage import load_backfill_checkpoint, save_backfill_checkpoint
+from app.ingest_pipeline import ingest_pipeline
+from app.metrics import BACKFILL_CONCURRENCY, BACKFILL_EVENTS_TOTAL, BACKFILL_THROTTLED_TOTAL
+from app.sequence_tracker import SequenceTracker, DUPLICATE
 import httpx
 import websockets
 
@@ -50,8 +54,8 @@ async def connect_ws(match_filter: Optional[str] = None):
                     if settings.MAX_EVENT_BYTES and len(raw_text) > settings.MAX_EVENT_BYTES:
                         logger.warning(f"[WS] Dropping oversized message of {len(raw_text)} bytes")
                         continue
-                    raw = json.loads(raw_text)
-                except json.JSONDecodeError as e:
+                    raw = loads(raw_text)
+                except JSONDecodeError as e:
                     logger.error(f"[WS] Invalid JSON payload: {e}")
                     continue
                 except Exception as e:
@@ -62,24 +66,16 @@ async def connect_ws(match_filter: Optional[str] = None):
                 if match_filter and raw.get("match_id") != match_filter:
                     continue
 
-                # persist raw (idempotent)
-                try:
-                    persist_raw_event(raw)
-                except Exception as e:
-                    logger.error(f"[WS] Error persisting raw event: {e}", exc_info=True)
-                    # Continue processing even if persist fails
+                # drop replays of seqs we already have; gaps schedule a range backfill
+                if seq_tracker.observe(raw) == DUPLICATE:
+                    continue
 
-                # normalize, enrich, and publish canonical
+                # hand off to the staged pipeline (persist -> normalize -> publish); this only
+                # waits when downstream queues are full, so socket reads never block on Postgres
                 try:
-                    canonical = await normalize_grid_event(raw)
-                    await publish_canonical(canonical.dict())
+                    await ingest_pipeline.submit(raw)
                 except Exception as e:
-                    evt_ctx = {
-                        "match_id": raw.get("match_id"),
-                        "type": raw.get("type") or raw.get("event_type"),
-                        "seq": raw.get("seq"),
-                    }
-                    logger.error(f"[WS] Error normalizing/publishing event ctx={evt_ctx}: {e}", exc_info=True)
+                    logger.error(f"[WS] Error submitting event match_id={raw.get('match_id')} seq={raw.get('seq')}: {e}", exc_info=True)
                     # Continue processing other events
     except asyncio.CancelledError:
         logger.info("[WS] Consumer task cancelled; shutting down gracefully")
@@ -99,10 +95,251 @@ async def connect_ws(match_filter: Optional[str] = None):
         raise RuntimeError(f"ws connection error: {str(e)}")
 
 
-async def rest_backfill(matches: list[str], max_parallel: int = 5):
+# ---------------------------------------------------------------------------
+# REST backfill
+# ---------------------------------------------------------------------------
+
+_rest_client: Optional[httpx.AsyncClient] = None
+
+
+def rest_client() -> httpx.AsyncClient:
+    """
+    Process-wide pooled client for GRID REST. Connections (and, with `h2` installed, HTTP/2
+    multiplexing) are reused across matches and backfill runs instead of one client per call.
+    """
+    global _rest_client
+    if _rest_client is None or _rest_client.is_closed:
+        http2 = settings.HTTP2_ENABLED
+        if http2:
+            try:
+                import h2  # noqa: F401  (httpx needs it for http2=True)
+            except ImportError:
+                logger.warning("[REST] h2 not installed; GRID REST client falls back to HTTP/1.1")
+                http2 = False
+        _rest_client = httpx.AsyncClient(
+            base_url=settings.GRID_REST_BASE,
+            headers={"Authorization": f"Bearer {settings.GRID_API_KEY}"},
+            timeout=httpx.Timeout(settings.HTTP_TIMEOUT),
+            limits=httpx.Limits(
+                max_connections=settings.HTTP_MAX_CONNECTIONS,
+                max_keepalive_connections=settings.HTTP_MAX_KEEPALIVE,
+            ),
+            http2=http2,
+        )
+    return _rest_client
+
+
+async def close_rest_client():
+    global _rest_client
+    if _rest_client is not None:
+        await _rest_client.aclose()
+        _rest_client = None
+
+
+class AdaptiveLimiter:
+    """
+    AIMD cap on in-flight REST requests shared by all matches of a backfill.
+    Each success grows the limit by 1/limit (about +1 per window); a 429 halves it once per
+    window and, with Retry-After, pauses every new request until the server's deadline.
+    """
+
+    def __init__(self, initial: int, minimum: int, maximum: int):
+        self.minimum = max(1, minimum)
+        self.maximum = max(self.minimum, maximum)
+        self.limit = float(min(self.maximum, max(self.minimum, initial)))
+        self._in_flight = 0
+        self._epoch = 0  # bumped on every decrease; 429s from older requests don't halve again
+        self._resume_at = 0.0
+        self._cond = asyncio.Condition()
+        BACKFILL_CONCURRENCY.set(self.limit)
+
+    async def acquire(self) -> int:
+        loop = asyncio.get_running_loop()
+        while True:
+            pause = self._resume_at - loop.time()
+            if pause > 0:
+                await asyncio.sleep(pause)
+                continue
+            async with self._cond:
+                if self._in_flight < int(self.limit) and self._resume_at <= loop.time():
+                    self._in_flight += 1
+                    return self._epoch
+                await self._cond.wait()
+
+    async def release(self):
+        async with self._cond:
+            self._in_flight -= 1
+            self._cond.notify_all()
+
+    @contextlib.asynccontextmanager
+    async def slot(self):
+        epoch = await self.acquire()
+        try:
+            yield epoch
+        finally:
+            await self.release()
+
+    def on_success(self):
+        self.limit = min(self.maximum, self.limit + 1.0 / self.limit)
+        BACKFILL_CONCURRENCY.set(self.limit)
+
+    def on_throttle(self, epoch: int, retry_after: Optional[float]):
+        if epoch == self._epoch:
+            self._epoch += 1
+            self.limit = max(self.minimum, self.limit / 2)
+            BACKFILL_CONCURRENCY.set(self.limit)
+        if retry_after and retry_after > 0:
+            loop = asyncio.get_running_loop()
+            self._resume_at = max(self._resume_at, loop.time() + retry_after)
+
+
+def _retry_after(resp: httpx.Response) -> Optional[float]:
+    try:
+        return float(resp.headers.get("Retry-After", "0"))
+    except (TypeError, ValueError):
+        # HTTP-date form is rare for GRID; fall back to our own backoff
+        return None
+
+
+def _seq_of(raw: dict) -> Optional[int]:
+    seq = raw.get("seq")
+    if seq is None or isinstance(seq, int):
+        return seq
+    try:
+        return int(seq)
+    except (TypeError, ValueError):
+        return None
+
+
+async def _backoff_sleep(attempt: int):
+    # jittered exponential backoff
+    base = settings.HTTP_BACKOFF_BASE
+    delay = min(60.0, (base ** attempt) + random.random())
+    await asyncio.sleep(delay)
+
+
+async def _fetch_page(client: httpx.AsyncClient, limiter: AdaptiveLimiter, match_id: str,
+                      after_seq: int, limit: int) -> Optional[list]:
+    """One page of events with seq > after_seq; None when the match should be abandoned for now."""
+    url = f"/matches/{match_id}/events"
+    params = {"after_seq": after_seq, "limit": limit}
+    attempt = 0
+    while True:
+        try:
+            async with limiter.slot() as epoch:
+                resp = await client.get(url, params=params)
+                # Handle rate limit explicitly
+                if resp.status_code == 429:
+                    limiter.on_throttle(epoch, _retry_after(resp))
+                else:
+                    resp.raise_for_status()
+                    limiter.on_success()
+            if resp.status_code == 429:
+                attempt += 1
+                BACKFILL_THROTTLED_TOTAL.inc()
+                logger.warning(f"[REST] 429 for match {match_id}; concurrency now {int(limiter.limit)} (attempt {attempt})")
+                if attempt >= settings.HTTP_MAX_RETRIES:
+                    logger.error(f"[REST] Max retries reached for match {match_id} (429)")
+                    return None
+                if not _retry_after(resp):
+                    await _backoff_sleep(attempt)
+                continue
+
+            try:
+                body = loads(resp.content)
+            except Exception as e:
+                logger.error(f"[REST] JSON parse error for match {match_id}: {e}", exc_info=True)
+                return None
+            # accept a bare list or an envelope {"events": [...]}
+            events = body.get("events") if isinstance(body, dict) else body
+            if not isinstance(events, list):
+                logger.warning(f"[REST] Expected list of events for match {match_id}, got {type(events)}")
+                return None
+            return events
+        except httpx.TimeoutException as e:
+            attempt += 1
+            logger.warning(f"[REST] Timeout for match {match_id} (attempt {attempt}): {e}")
+            if attempt >= settings.HTTP_MAX_RETRIES:
+                logger.error(f"[REST] Max retries reached for match {match_id} (timeout)")
+                return None
+            await _backoff_sleep(attempt)
+        except httpx.HTTPStatusError as e:
+            # Non-429 HTTP errors after raise_for_status
+            attempt += 1
+            status = e.response.status_code if e.response else 'unknown'
+            logger.error(f"[REST] HTTP {status} for match {match_id} (attempt {attempt}): {e}")
+            if attempt >= settings.HTTP_MAX_RETRIES or (400 <= (status or 0) < 500):
+                # Do not retry 4xx except 429 handled above
+                return None
+            await _backoff_sleep(attempt)
+        except httpx.RequestError as e:
+            attempt += 1
+            logger.error(f"[REST] Network error for match {match_id} (attempt {attempt}): {e}")
+            if attempt >= settings.HTTP_MAX_RETRIES:
+                return None
+            await _backoff_sleep(attempt)
+
+
+async def _backfill_match(client: httpx.AsyncClient, limiter: AdaptiveLimiter, match_id: str):
+    """
+    Page through a match from its checkpoint. Each page goes to the ingest pipeline in one
+    submit_many call; the checkpoint only advances past events whose raw rows are stored.
+    """
+    checkpoint = await run_db(load_backfill_checkpoint, match_id)
+    after_seq = checkpoint.last_seq if checkpoint is not None else -1
+    page_size = settings.BACKFILL_PAGE_SIZE
+    total = 0
+    if after_seq >= 0:
+        logger.info(f"[REST] Resuming backfill for match {match_id} after seq {after_seq}")
+
+    while True:
+        events = await _fetch_page(client, limiter, match_id, after_seq, page_size)
+        if events is None:
+            return
+        # servers that ignore after_seq would otherwise make us re-ingest (and loop on) old pages
+        fresh = [raw for raw in events if isinstance(raw, dict) and (_seq_of(raw) is None or _seq_of(raw) > after_seq)]
+        for raw in fresh:
+            raw.setdefault("match_id", match_id)
+
+        futures = await ingest_pipeline.submit_many(fresh)
+        results = await asyncio.gather(*futures, return_exceptions=True)
+
+        last_seq = after_seq
+        stored = 0
+        failed = None
+        for raw, result in zip(fresh, results):
+            if isinstance(result, ValueError):
+                # unusable event (no id/seq to dedupe on); retrying the page won't fix it
+                BACKFILL_EVENTS_TOTAL.labels(outcome="rejected").inc()
+                continue
+            if isinstance(result, Exception):
+                failed = result
+                break
+            stored += 1
+            BACKFILL_EVENTS_TOTAL.labels(outcome="inserted" if result else "duplicate").inc()
+            seq = _seq_of(raw)
+            if seq is not None and seq > last_seq:
+                last_seq = seq
+
+        done = failed is None and (len(events) < page_size or last_seq <= after_seq)
+        if last_seq > after_seq or done:
+            await run_db(save_backfill_checkpoint, match_id, last_seq, stored, done)
+        total += stored
+        after_seq = last_seq
+
+        if failed is not None:
+            logger.error(f"[REST] Persisting page for match {match_id} failed; checkpoint kept at seq {last_seq}: {failed}")
+            return
+        if done:
+            logger.info(f"[REST] Successfully backfilled {total} events for match {match_id} (last seq {last_seq})")
+            return
+
+
+async def rest_backfill(matches: list[str], max_parallel: Optional[int] = None):
     """
-    Poll GRID REST endpoints for missing/late events with parallel processing.
-    Includes retries and rate-limit handling.
+    Fetch missing/late events for `matches` from GRID REST, resuming from stored checkpoints.
+    Requests share one pooled client; `max_parallel` is the starting concurrency, which then
+    adapts to 429/Retry-After between BACKFILL_MIN_CONCURRENCY and BACKFILL_MAX_CONCURRENCY.
     """
     if not matches:
         logger.warning("[REST] rest_backfill called with empty matches list")
@@ -116,101 +353,80 @@ async def rest_backfill(matches: list[str], max_parallel: int = 5):
         logger.error("[REST] GRID_API_KEY is not configured")
         raise ValueError("GRID_API_KEY is not configured")
 
-    semaphore = asyncio.Semaphore(max_parallel)
+    limiter = AdaptiveLimiter(
+        initial=max_parallel or settings.BACKFILL_INITIAL_CONCURRENCY,
+        minimum=settings.BACKFILL_MIN_CONCURRENCY,
+        maximum=settings.BACKFILL_MAX_CONCURRENCY,
+    )
+    client = rest_client()
+    pending: asyncio.Queue = asyncio.Queue()
+    for match_id in dict.fromkeys(m for m in matches if m):
+        pending.put_nowait(match_id)
 
-    async def backoff_sleep(attempt: int, retry_after: Optional[float] = None):
-        if retry_after and retry_after > 0:
-            await asyncio.sleep(retry_after)
-            return
-        # jittered exponential backoff
-        base = settings.HTTP_BACKOFF_BASE
-        delay = min(60.0, (base ** attempt) + random.random())
-        await asyncio.sleep(delay)
+    async def worker():
+        while True:
+            try:
+                match_id = pending.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            try:
+                await _backfill_match(client, limiter, match_id)
+            except Exception as e:
+                logger.error(f"[REST] Error processing match {match_id}: {e}", exc_info=True)
 
-    async def fetch_and_process_match(client: httpx.AsyncClient, match_id: str):
-        if not match_id:
-            return
+    # enough workers to saturate the limiter at its ceiling; pages of one match stay sequential
+    workers = min(pending.qsize(), settings.BACKFILL_MAX_CONCURRENCY)
+    await asyncio.gather(*(worker() for _ in range(workers)))
 
-        async with semaphore:
-            url = f"/matches/{match_id}/events"
-            headers = {"Authorization": f"Bearer {settings.GRID_API_KEY}"}
 
-            attempt = 0
-            while True:
-                try:
-                    resp = await client.get(url, headers=headers)
-                    # Handle rate limit explicitly
-                    if resp.status_code == 429:
-                        attempt += 1
-                        retry_after = None
-                        try:
-                            retry_after = float(resp.headers.get("Retry-After", "0"))
-                        except Exception:
-                            retry_after = None
-                        logger.warning(f"[REST] 429 for match {match_id}; backing off (attempt {attempt})")
-                        if attempt >= settings.HTTP_MAX_RETRIES:
-                            logger.error(f"[REST] Max retries reached for match {match_id} (429)")
-                            return
-                        await backoff_sleep(attempt, retry_after)
-                        continue
+# ---------------------------------------------------------------------------
+# Live seq gap recovery
+# ---------------------------------------------------------------------------
 
-                    resp.raise_for_status()
+_gap_limiter: Optional[AdaptiveLimiter] = None
 
-                    try:
-                        events = resp.json()
-                    except Exception as e:
-                        logger.error(f"[REST] JSON parse error for match {match_id}: {e}", exc_info=True)
-                        return
-
-                    if not isinstance(events, list):
-                        logger.warning(f"[REST] Expected list of events for match {match_id}, got {type(events)}")
-                        return
-
-                    # Process events in sub-batches to avoid blocking too long
-                    for i in range(0, len(events), 50):
-                        batch = events[i:i + 50]
-                        tasks = [process_single_event(raw, match_id) for raw in batch]
-                        await asyncio.gather(*tasks, return_exceptions=True)
-
-                    logger.info(f"[REST] Successfully backfilled {len(events)} events for match {match_id}")
-                    return
-                except httpx.TimeoutException as e:
-                    attempt += 1
-                    logger.warning(f"[REST] Timeout for match {match_id} (attempt {attempt}): {e}")
-                    if attempt >= settings.HTTP_MAX_RETRIES:
-                        logger.error(f"[REST] Max retries reached for match {match_id} (timeout)")
-                        return
-                    await backoff_sleep(attempt)
-                except httpx.HTTPStatusError as e:
-                    # Non-429 HTTP errors after raise_for_status
-                    attempt += 1
-                    status = e.response.status_code if e.response else 'unknown'
-                    logger.error(f"[REST] HTTP {status} for match {match_id} (attempt {attempt}): {e}")
-                    if attempt >= settings.HTTP_MAX_RETRIES or (400 <= (status or 0) < 500):
-                        # Do not retry 4xx except 429 handled above
-                        return
-                    await backoff_sleep(attempt)
-                except httpx.RequestError as e:
-                    attempt += 1
-                    logger.error(f"[REST] Network error for match {match_id} (attempt {attempt}): {e}")
-                    if attempt >= settings.HTTP_MAX_RETRIES:
-                        return
-                    await backoff_sleep(attempt)
-                except Exception as e:
-                    logger.error(f"[REST] Error processing match {match_id}: {e}", exc_info=True)
-                    return
 
-    async def process_single_event(raw: dict, match_id: str):
-        try:
-            persist_raw_event(raw)
-            canonical = await normalize_grid_event(raw)
-            await publish_canonical(canonical.dict())
-        except Exception as e:
-            logger.error(f"[REST] Error in single event processing for match {match_id}: {e}")
-
-    timeout = httpx.Timeout(settings.HTTP_TIMEOUT)
-    async with httpx.AsyncClient(base_url=settings.GRID_REST_BASE, timeout=timeout) as client:
-        tasks = [fetch_and_process_match(client, m) for m in matches]
-        await asyncio.gather(*tasks)
+async def backfill_range(match_id: str, first_seq: int, last_seq: int) -> list[int]:
+    """
+    Fetch only seqs first_seq..last_seq of a match (a live gap) and submit them.
+    Returns the seqs whose raw rows were stored. Does not touch full-backfill checkpoints.
+    """
+    global _gap_limiter
+    if _gap_limiter is None:
+        _gap_limiter = AdaptiveLimiter(
+            initial=settings.BACKFILL_INITIAL_CONCURRENCY,
+            minimum=settings.BACKFILL_MIN_CONCURRENCY,
+            maximum=settings.BACKFILL_MAX_CONCURRENCY,
+        )
+    client = rest_client()
+    after_seq = first_seq - 1
+    stored: list[int] = []
+    while after_seq < last_seq:
+        limit = min(settings.BACKFILL_PAGE_SIZE, last_seq - after_seq)
+        events = await _fetch_page(client, _gap_limiter, match_id, after_seq, limit)
+        if not events:
+            break
+        in_range = [raw for raw in events if isinstance(raw, dict) and _seq_of(raw) is not None
+                    and after_seq < _seq_of(raw) <= last_seq]
+        if not in_range:
+            break
+        for raw in in_range:
+            raw.setdefault("match_id", match_id)
+        futures = await ingest_pipeline.submit_many(in_range)
+        results = await asyncio.gather(*futures, return_exceptions=True)
+        stored.extend(_seq_of(raw) for raw, result in zip(in_range, results) if not isinstance(result, Exception))
+        after_seq = max(_seq_of(raw) for raw in in_range)
+        if len(events) < limit:
+            break
+    BACKFILL_EVENTS_TOTAL.labels(outcome="gap_fill").inc(len(stored))
+    logger.info(f"[REST] Gap backfill {first_seq}..{last_seq} for match {match_id} stored {len(stored)} events")
+    return stored
 
 
+seq_tracker = SequenceTracker(
+    recover=backfill_range,
+    grace=settings.SEQ_GAP_GRACE,
+    max_gap=settings.SEQ_MAX_GAP,
+    max_matches=settings.SEQ_TRACKER_MAX_MATCHES,
+    attempts=settings.SEQ_GAP_RECOVERY_ATTEMPTS,
+)
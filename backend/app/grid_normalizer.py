@@ -1,16 +1,167 @@
 # app/grid_normalizer.py
-from app.schemas import GridRawEvent, CanonicalEvent
+from app.schemas import GridRawEvent, CanonicalEvent, CanonicalRecord
+from app.settings import settings
 from pydantic import ValidationError
 from datetime import datetime, timezone
-from app.enricher import enrich_canonical
+from app.enricher import enrich_canonical, enrich_batch
+from typing import Any, Callable, Dict, List, Optional, Tuple
 import uuid
 import logging
 
 logger = logging.getLogger(__name__)
 
-async def normalize_grid_event(raw: dict) -> CanonicalEvent:
+# ---------------------------------------------------------------------------
+# Compiled field extractors
+# ---------------------------------------------------------------------------
+# Each game branch is reduced to (actor, target, team) getter functions built once at
+# import time, so per-event work is a few dict lookups instead of model construction.
+
+Extractor = Callable[[Dict[str, Any]], Any]
+
+
+def _first_of(*keys: str) -> Extractor:
+    """Same semantics as `p.get(k1) or p.get(k2) or ...`."""
+    if len(keys) == 1:
+        (a,) = keys
+        return lambda p: p.get(a)
+    if len(keys) == 2:
+        a, b = keys
+        return lambda p: p.get(a) or p.get(b)
+    if len(keys) == 3:
+        a, b, c = keys
+        return lambda p: p.get(a) or p.get(b) or p.get(c)
+
+    def get(p):
+        value = None
+        for k in keys:
+            value = p.get(k)
+            if value:
+                return value
+        return value
+    return get
+
+
+_VALORANT_FIELDS: Tuple[Extractor, Extractor, Extractor] = (
+    _first_of("killer", "player_id", "activator"),
+    _first_of("victim", "damaged_player"),
+    _first_of("team", "attacker_team"),
+)
+
+_LOL_FIELDS: Tuple[Extractor, Extractor, Extractor] = (
+    _first_of("killerId", "participantId", "creatorId"),
+    _first_of("victimId", "targetId"),
+    _first_of("teamId", "side"),
+)
+
+
+def _extract_fields(p: Dict[str, Any]) -> Tuple[Optional[str], Optional[str], Optional[str]]:
+    """Attempt to extract actor/target/team from GRID payloads (game-specific)."""
+    game = p.get("game")
+    # 1. VALORANT specific
+    if game == "valorant" or "round_id" in p:
+        fields = _VALORANT_FIELDS
+    # 2. League of Legends specific
+    elif game == "lol" or "participantId" in p:
+        fields = _LOL_FIELDS
+    # 3. Common/Generic fallbacks
+    else:
+        actor = p.get("killer")
+        if actor is None:
+            actor = p.get("player_id")
+        return actor, p.get("victim"), p.get("team")
+    return fields[0](p), fields[1](p), fields[2](p)
+
+
+def _as_int(value) -> Optional[int]:
+    if value is None or isinstance(value, int):
+        return value
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _build_record(raw: dict, timestamp: Optional[datetime] = None, timestamp_iso: Optional[str] = None) -> CanonicalRecord:
+    grid_event_id = raw.get("id") or raw.get("grid_event_id")
+    match_id = raw.get("match_id")
+    if match_id is None:
+        match_id = "unknown"
+    elif not isinstance(match_id, str):
+        match_id = str(match_id)
+    event_type = raw.get("type") or raw.get("event_type") or "UNKNOWN"
+    p = raw.get("payload", raw)
+    if not isinstance(p, dict):
+        p = raw
+    seq = _as_int(raw.get("seq"))
+
+    # build canonical structure (choose event_id deterministically if possible)
+    event_id = grid_event_id or f"{match_id}:{event_type}:{uuid.uuid4().hex}"
+    if timestamp is None:
+        timestamp = datetime.now(timezone.utc)
+        timestamp_iso = timestamp.isoformat()
+    actor, target, team = _extract_fields(p)
+
+    return CanonicalRecord(
+        event_id=str(event_id),
+        match_id=match_id,
+        event_type=str(event_type).upper(),
+        timestamp=timestamp,
+        timestamp_iso=timestamp_iso,
+        actor=actor,
+        target=target,
+        team=team,
+        payload=p,
+        ingestion_meta={
+            "source": "GRID",
+            "grid_seq": seq,
+            "ingested_at": timestamp_iso
+        }
+    )
+
+
+async def normalize_grid_event(raw: dict):
     """
     Convert GRID raw payload into canonical event, then run enrichment.
+    Returns a slotted CanonicalRecord; with settings.NORMALIZER_STRICT the Pydantic
+    CanonicalEvent path validates every event instead. Both expose `.dict()` for publishing.
+    """
+    if settings.NORMALIZER_STRICT:
+        return await normalize_grid_event_strict(raw)
+
+    canonical = _build_record(raw)
+
+    # run enrichment (compute speeds, econ deltas, opening kills, etc.)
+    try:
+        canonical.enriched = await enrich_canonical(canonical)
+    except Exception as e:
+        logger.warning(f"Enrichment failed for event_id={canonical.event_id}: {e}", exc_info=True)
+        canonical.enriched = {}
+    return canonical
+
+
+async def normalize_grid_batch(raws: List[dict]) -> list:
+    """
+    Normalize a list of raw events in order (REST backfill pages, replay, drained ingest queues).
+    Runs of POSITION_UPDATE events are enriched with vectorized NumPy ops via enrich_batch.
+    """
+    if settings.NORMALIZER_STRICT:
+        return [await normalize_grid_event_strict(raw) for raw in raws]
+
+    # one ingestion timestamp per batch: the events were received together
+    timestamp = datetime.now(timezone.utc)
+    timestamp_iso = timestamp.isoformat()
+    records = [_build_record(raw, timestamp, timestamp_iso) for raw in raws]
+    # enrich_batch handles failures per event: re-enriching the batch would apply events twice
+    enriched = await enrich_batch(records)
+    for rec, extra in zip(records, enriched):
+        rec.enriched = extra
+    return records
+
+
+async def normalize_grid_event_strict(raw: dict) -> CanonicalEvent:
+    """
+    Pydantic-validated normalization (opt-in via settings.NORMALIZER_STRICT).
+    Slower, but rejects malformed payloads with field-level errors.
     """
     # validate shape minimally
     try:
@@ -37,35 +188,7 @@ async def normalize_grid_event(raw: dict) -> CanonicalEvent:
     # build canonical structure (choose event_id deterministically if possible)
     event_id = grid_evt.grid_event_id or f"{grid_evt.match_id}:{grid_evt.event_type}:{uuid.uuid4().hex}"
     timestamp = datetime.now(timezone.utc)
-    # attempt to extract actor/target/team from GRID payloads (game-specific)
-    actor = None
-    target = None
-    team = None
-    p = grid_evt.payload
-
-    # Improved Extraction Logic
-    # 1. VALORANT specific
-    if p.get("game") == "valorant" or "round_id" in p:
-        actor = p.get("killer") or p.get("player_id") or p.get("activator")
-        target = p.get("victim") or p.get("damaged_player")
-        team = p.get("team") or p.get("attacker_team")
-
-    # 2. League of Legends specific
-    elif p.get("game") == "lol" or "participantId" in p:
-        actor = p.get("killerId") or p.get("participantId") or p.get("creatorId")
-        target = p.get("victimId") or p.get("targetId")
-        team = p.get("teamId") or p.get("side")
-
-    # 3. Common/Generic fallbacks
-    else:
-        if "killer" in p:
-            actor = p.get("killer")
-        if "victim" in p:
-            target = p.get("victim")
-        if "team" in p:
-            team = p.get("team")
-        if "player_id" in p and actor is None:
-            actor = p.get("player_id")
+    actor, target, team = _extract_fields(grid_evt.payload)
 
     canonical = CanonicalEvent(
         event_id=event_id,
@@ -92,5 +215,3 @@ async def normalize_grid_event(raw: dict) -> CanonicalEvent:
         logger.warning(f"Enrichment failed for event_id={event_id}: {e}", exc_info=True)
         canonical.enriched = {}
     return canonical
-
-
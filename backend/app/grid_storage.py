@@ -1,13 +1,23 @@
 # app/grid_storage.py
-import json
+import asyncio
+import time
+import uuid
 import aioredis
+from typing import Optional
+from sqlalchemy import func
 from sqlalchemy.exc import IntegrityError, SQLAlchemyError
-from app.db import SessionLocal
-from app.models import RawEvent, CanonicalEventIndex
+from app.db import SessionLocal, engine, run_db
+from app.models import RawEvent, CanonicalEventIndex, BackfillCheckpoint
+from app.metrics import (
+    DB_WRITER_BATCH_SIZE, DB_WRITER_FLUSH_SECONDS, DB_WRITER_DUPLICATES_TOTAL,
+    PUBLISH_BATCH_SIZE, PUBLISH_BATCH_SECONDS
+)
 from app.settings import settings
+from app.stream_shards import stream_for_match
+from app.utils.serialization import dumps_bytes
 from datetime import datetime
 import logging
-from tenacity import retry, wait_exponential, stop_after_attempt
+from tenacity import retry, wait_exponential, stop_after_attempt, retry_if_exception_type
 
 logger = logging.getLogger(__name__)
 
@@ -24,16 +34,21 @@ async def redis() -> aioredis.Redis:
             raise
     return _redis
 
+def _grid_event_id(grid_event: dict) -> Optional[str]:
+    """GRID-provided id, falling back to match_id:seq when the payload carries no id."""
+    return grid_event.get("grid_event_id") or grid_event.get("id") or (f"{grid_event.get('match_id')}:{grid_event.get('seq')}" if grid_event.get('match_id') and grid_event.get('seq') is not None else None)
+
 def persist_raw_event(grid_event: dict, source: str = "GRID"):
     """
     Persist raw JSON to Postgres (append-only). Uses grid_event_id uniqueness for idempotency.
+    Single-event path; hot ingest loops should use `enqueue_raw_event` instead.
     """
     db = SessionLocal()
     try:
         if not grid_event:
             raise ValueError("grid_event cannot be empty")
 
-        grid_event_id = grid_event.get("grid_event_id") or grid_event.get("id") or (f"{grid_event.get('match_id')}:{grid_event.get('seq')}" if grid_event.get('match_id') and grid_event.get('seq') is not None else None)
+        grid_event_id = _grid_event_id(grid_event)
         if not grid_event_id:
             logger.error(f"Unable to determine grid_event_id from event: {grid_event}")
             raise ValueError("Unable to determine grid_event_id from event")
@@ -53,7 +68,7 @@ def persist_raw_event(grid_event: dict, source: str = "GRID"):
         db.rollback()
         # already exists -> fetch and return existing
         try:
-            grid_event_id = grid_event.get("grid_event_id") or grid_event.get("id")
+            grid_event_id = _grid_event_id(grid_event)
             existing = db.query(RawEvent).filter(
                 RawEvent.grid_event_id == grid_event_id
             ).first()
@@ -72,64 +87,398 @@ def persist_raw_event(grid_event: dict, source: str = "GRID"):
     finally:
         db.close()
 
-@retry(wait=wait_exponential(multiplier=1, min=1, max=30), stop=stop_after_attempt(5))
-async def _xadd_with_retry(r: aioredis.Redis, stream: str, data: dict):
-    return await r.xadd(stream, data)
+def _insert_ignore(model, rows: list[dict], conflict_cols: list[str]) -> set:
+    """
+    Multi-row INSERT ... ON CONFLICT DO NOTHING.
+    Returns the conflict-key tuples that were actually inserted (duplicates are skipped).
+    Dialects without ON CONFLICT fall back to per-row ORM inserts (`_insert_each`).
+    """
+    if engine.dialect.name == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    elif engine.dialect.name == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert
+    else:
+        return _insert_each(model, rows, conflict_cols)
+
+    stmt = (
+        insert(model)
+        .values(rows)
+        .on_conflict_do_nothing(index_elements=conflict_cols)
+        .returning(*[getattr(model, col) for col in conflict_cols])
+    )
+    with engine.begin() as conn:
+        return {tuple(row) for row in conn.execute(stmt)}
 
-async def publish_canonical(event: dict):
+def _insert_each(model, rows: list[dict], conflict_cols: list[str]) -> set:
     """
-    Publish canonical event JSON to Redis Stream `settings.CANONICAL_STREAM`.
+    Portable `_insert_ignore`: one ORM insert per row, as `persist_raw_event` does.
+    A row that hits the unique constraint is rolled back and treated as a duplicate.
     """
+    inserted = set()
+    db = SessionLocal()
     try:
-        if not event:
-            raise ValueError("event cannot be empty")
+        for row in rows:
+            db.add(model(**row))
+            try:
+                db.commit()
+            except IntegrityError:
+                db.rollback()
+                continue
+            inserted.add(tuple(row[col] for col in conflict_cols))
+        return inserted
+    except SQLAlchemyError:
+        db.rollback()
+        raise
+    finally:
+        db.close()
 
-        r = await redis()
-        # store as single 'data' field
+def load_backfill_checkpoint(match_id: str) -> Optional[BackfillCheckpoint]:
+    """Stored REST backfill cursor for `match_id`, or None if the match was never backfilled."""
+    db = SessionLocal()
+    try:
+        checkpoint = db.get(BackfillCheckpoint, match_id)
+        if checkpoint is not None:
+            db.expunge(checkpoint)
+        return checkpoint
+    finally:
+        db.close()
+
+def save_backfill_checkpoint(match_id: str, last_seq: int, ingested: int, completed: bool = False):
+    """Upsert the cursor for `match_id`; `ingested` is added to the running event count."""
+    if engine.dialect.name == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    elif engine.dialect.name == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert
+    else:
+        _merge_backfill_checkpoint(match_id, last_seq, ingested, completed)
+        return
+
+    stmt = insert(BackfillCheckpoint).values(
+        match_id=match_id, last_seq=last_seq, events_ingested=ingested, completed=completed
+    )
+    stmt = stmt.on_conflict_do_update(
+        index_elements=["match_id"],
+        set_={
+            "last_seq": stmt.excluded.last_seq,
+            "events_ingested": BackfillCheckpoint.events_ingested + stmt.excluded.events_ingested,
+            "completed": stmt.excluded.completed,
+            "updated_at": func.now(),
+        },
+    )
+    with engine.begin() as conn:
+        conn.execute(stmt)
+
+def _merge_backfill_checkpoint(match_id: str, last_seq: int, ingested: int, completed: bool):
+    """ORM read-modify-write for dialects without ON CONFLICT DO UPDATE."""
+    db = SessionLocal()
+    try:
+        checkpoint = db.get(BackfillCheckpoint, match_id, with_for_update=True)
+        if checkpoint is None:
+            checkpoint = BackfillCheckpoint(match_id=match_id, events_ingested=0)
+            db.add(checkpoint)
+        checkpoint.last_seq = last_seq
+        checkpoint.events_ingested = (checkpoint.events_ingested or 0) + ingested
+        checkpoint.completed = completed
+        db.commit()
+    except SQLAlchemyError:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+
+async def _next_batch(queue: asyncio.Queue, batch_size: int, linger: float) -> tuple[list, bool]:
+    """
+    Wait for one item, then keep collecting until `batch_size` items or `linger` seconds.
+    A `None` item is the shutdown sentinel; returns (batch, stop).
+    """
+    item = await queue.get()
+    if item is None:
+        return [], True
+    loop = asyncio.get_running_loop()
+    batch = [item]
+    deadline = loop.time() + linger
+    while len(batch) < batch_size:
+        try:
+            item = queue.get_nowait()
+        except asyncio.QueueEmpty:
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                break
+            try:
+                item = await asyncio.wait_for(queue.get(), remaining)
+            except asyncio.TimeoutError:
+                break
+        if item is None:
+            return batch, True
+        batch.append(item)
+    return batch, False
+
+def _fail_batch(batch: list, exc: Exception):
+    for _item, fut in batch:
+        if not fut.done():
+            fut.set_exception(exc)
+            # mark retrieved so fire-and-forget callers don't trigger asyncio warnings
+            fut.exception()
+
+
+class BufferedInsertWriter:
+    """
+    Collects rows in memory and writes them with one multi-row INSERT ... ON CONFLICT DO NOTHING.
+    A batch is flushed when `batch_size` rows are buffered or the oldest row has waited
+    `flush_interval` seconds. `close()` flushes whatever is still buffered.
+    """
+
+    def __init__(self, name: str, model, conflict_cols: list[str],
+                 batch_size: int, flush_interval: float, max_pending: int):
+        self.name = name
+        self.model = model
+        self.conflict_cols = conflict_cols
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+        self._closing = False
+
+    def _ensure_started(self):
+        if self._task is None or self._task.done():
+            if self._queue is None:
+                self._queue = asyncio.Queue(maxsize=self.max_pending)
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    def qsize(self) -> int:
+        return self._queue.qsize() if self._queue is not None else 0
+
+    async def add(self, row: dict, block: bool = True) -> asyncio.Future:
+        """
+        Buffer a row. Waits only when the buffer is full (backpressure); with block=False a full
+        buffer raises asyncio.QueueFull instead.
+        The returned future resolves to True if the row was inserted, False if it already existed.
+        """
+        if self._closing:
+            raise RuntimeError(f"{self.name} writer is closed")
+        self._ensure_started()
+        fut = asyncio.get_running_loop().create_future()
+        if block:
+            await self._queue.put((row, fut))
+        else:
+            self._queue.put_nowait((row, fut))
+        return fut
+
+    async def _run(self):
+        while True:
+            batch, stop = await _next_batch(self._queue, self.batch_size, self.flush_interval)
+            if batch:
+                await self._flush(batch)
+            if stop:
+                return
+
+    async def _flush(self, batch: list):
+        # de-duplicate within the batch; only the first occurrence of a key can be inserted
+        rows = {}
+        keys = []
+        for row, _fut in batch:
+            key = tuple(row[col] for col in self.conflict_cols)
+            keys.append(key if key not in rows else None)
+            rows.setdefault(key, row)
+        start = time.perf_counter()
         try:
-            event_json = json.dumps(event)
+            # run the blocking INSERT on the DB thread pool so the event loop keeps serving I/O
+            inserted = await run_db(_insert_ignore, self.model, list(rows.values()), self.conflict_cols)
         except Exception as e:
-            logger.error(f"Error serializing event to JSON: {e}", exc_info=True)
-            raise ValueError(f"Failed to serialize event: {str(e)}")
+            logger.error(f"[{self.name}] Bulk insert of {len(rows)} rows failed: {e}", exc_info=True)
+            _fail_batch(batch, e)
+            return
+        DB_WRITER_FLUSH_SECONDS.labels(writer=self.name).observe(time.perf_counter() - start)
+        DB_WRITER_BATCH_SIZE.labels(writer=self.name).observe(len(rows))
+        DB_WRITER_DUPLICATES_TOTAL.labels(writer=self.name).inc(len(batch) - len(inserted))
+        for key, (_row, fut) in zip(keys, batch):
+            if not fut.done():
+                fut.set_result(key is not None and key in inserted)
 
+    async def close(self):
+        """Stop accepting rows and flush everything still buffered."""
+        self._closing = True
+        if self._task is None or self._task.done():
+            return
+        await self._queue.put(None)
+        await self._task
+
+
+raw_event_writer = BufferedInsertWriter(
+    "raw_events",
+    RawEvent,
+    conflict_cols=["grid_event_id", "source"],
+    batch_size=settings.RAW_WRITER_BATCH_SIZE,
+    flush_interval=settings.RAW_WRITER_FLUSH_INTERVAL,
+    max_pending=settings.RAW_WRITER_MAX_PENDING,
+)
+
+async def enqueue_raw_event(grid_event: dict, source: str = "GRID") -> asyncio.Future:
+    """
+    Buffered, idempotent raw persistence for hot ingest paths.
+    Await the returned future only when the caller must know the row is durable.
+    """
+    if not grid_event:
+        raise ValueError("grid_event cannot be empty")
+    grid_event_id = _grid_event_id(grid_event)
+    if not grid_event_id:
+        logger.error(f"Unable to determine grid_event_id from event: {grid_event}")
+        raise ValueError("Unable to determine grid_event_id from event")
+    return await raw_event_writer.add({
+        "id": str(uuid.uuid4()),
+        "grid_event_id": grid_event_id,
+        "source": source,
+        "match_id": grid_event.get("match_id"),
+        "payload": grid_event,
+        "ingested_by": settings.INGESTOR_NAME,
+    })
+
+canonical_index_writer = BufferedInsertWriter(
+    "canonical_index",
+    CanonicalEventIndex,
+    conflict_cols=["event_id"],
+    batch_size=settings.CANONICAL_INDEX_BATCH_SIZE,
+    flush_interval=settings.CANONICAL_INDEX_FLUSH_INTERVAL,
+    max_pending=settings.CANONICAL_INDEX_MAX_PENDING,
+)
+
+@retry(wait=wait_exponential(multiplier=1, min=1, max=30), stop=stop_after_attempt(5),
+       retry=retry_if_exception_type((aioredis.ConnectionError, aioredis.TimeoutError)))
+async def _execute_pipeline_with_retry(r: aioredis.Redis, entries: list[tuple[str, bytes]], maxlen: Optional[int]):
+    # MULTI/EXEC in one round trip; entries are (stream, data). A connection lost before EXEC
+    # applies none of the XADDs, so retrying the batch cannot publish an entry twice (only a
+    # reply lost after EXEC ran can). Errors Redis returns for single XADDs are not retried:
+    # the other entries of the transaction were applied.
+    pipe = r.pipeline(transaction=True)
+    for stream, data in entries:
+        if maxlen:
+            pipe.xadd(stream, {"data": data}, maxlen=maxlen, approximate=True)
+        else:
+            pipe.xadd(stream, {"data": data})
+    return await pipe.execute()
+
+
+class CanonicalPublisher:
+    """
+    Batches canonical events into pipelined XADDs, trimming with MAXLEN ~ when configured.
+    With `shards` > 1 each event goes to its match's shard stream (app.stream_shards); one
+    MULTI/EXEC pipeline still carries the whole batch and keeps per-match order.
+    Index rows are handed to `canonical_index_writer` after a successful publish.
+    """
+
+    def __init__(self, stream: str, batch_size: int, linger: float, max_pending: int,
+                 maxlen: Optional[int] = None, shards: int = 1):
+        self.stream = stream
+        self.shards = shards
+        self.batch_size = batch_size
+        self.linger = linger
+        self.max_pending = max_pending
+        self.maxlen = maxlen
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+        self._closing = False
+
+    def _ensure_started(self):
+        if self._task is None or self._task.done():
+            if self._queue is None:
+                self._queue = asyncio.Queue(maxsize=self.max_pending)
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    def qsize(self) -> int:
+        return self._queue.qsize() if self._queue is not None else 0
+
+    async def publish(self, event: dict, event_json: bytes) -> asyncio.Future:
+        """Queue an already-serialized event; the future resolves to its stream entry id."""
+        if self._closing:
+            raise RuntimeError(f"publisher for {self.stream} is closed")
+        self._ensure_started()
+        fut = asyncio.get_running_loop().create_future()
+        await self._queue.put(((event, event_json), fut))
+        return fut
+
+    async def _run(self):
+        while True:
+            batch, stop = await _next_batch(self._queue, self.batch_size, self.linger)
+            if batch:
+                await self._flush(batch)
+            if stop:
+                return
+
+    async def _flush(self, batch: list):
+        start = time.perf_counter()
         try:
-            await _xadd_with_retry(r, settings.CANONICAL_STREAM, {"data": event_json})
+            r = await redis()
+            entries = [(stream_for_match(self.stream, evt.get("match_id"), self.shards), data) for (evt, data), _fut in batch]
+            ids = await _execute_pipeline_with_retry(r, entries, self.maxlen)
         except Exception as e:
-            logger.error(f"Error publishing canonical event to Redis: {e}", exc_info=True)
-            raise
-    except Exception as e:
-        logger.error(f"Error in publish_canonical: {e}", exc_info=True)
-        raise
+            logger.error(f"Error publishing {len(batch)} canonical events to Redis: {e}", exc_info=True)
+            _fail_batch(batch, e)
+            return
+        PUBLISH_BATCH_SECONDS.labels(stream=self.stream).observe(time.perf_counter() - start)
+        PUBLISH_BATCH_SIZE.labels(stream=self.stream).observe(len(batch))
 
-    # also persist a small index record (optional; non-blocking for speed)
-    db = SessionLocal()
-    try:
-        if not event.get("event_id"):
-            logger.warning("Event missing event_id, skipping index persistence")
+        for ((event, _data), fut), entry_id in zip(batch, ids):
+            if not fut.done():
+                fut.set_result(entry_id)
+            # small relational index record; written in bulk off the event loop
+            if not event.get("event_id"):
+                logger.warning("Event missing event_id, skipping index persistence")
+                continue
+            try:
+                await canonical_index_writer.add({
+                    "id": str(uuid.uuid4()),
+                    "event_id": event["event_id"],
+                    "match_id": event.get("match_id"),
+                    "event_type": event.get("event_type"),
+                    "payload": event,
+                    "enriched": bool(event.get("enriched")),
+                }, block=False)
+            except asyncio.QueueFull:
+                # the index is best-effort; never stall Redis publishing behind Postgres
+                logger.warning("Canonical index writer is full, dropping index row")
+            except Exception as e:
+                # Don't fail the publish if index fails
+                logger.warning(f"Unable to queue canonical event index row: {e}")
+
+    async def close(self):
+        """Stop accepting events and publish everything still queued."""
+        self._closing = True
+        if self._task is None or self._task.done():
             return
+        await self._queue.put(None)
+        await self._task
 
-        idx = CanonicalEventIndex(
-            event_id=event["event_id"],
-            match_id=event.get("match_id"),
-            event_type=event.get("event_type"),
-            payload=event,
-            enriched=bool(event.get("enriched"))
-        )
-        db.add(idx)
-        db.commit()
-    except IntegrityError:
-        db.rollback()
-        # Index entry already exists, that's okay
-        logger.debug("Canonical event index entry already exists")
-    except SQLAlchemyError as e:
-        db.rollback()
-        logger.warning(f"Database error persisting canonical event index: {e}", exc_info=True)
-        # Don't fail the publish if index fails
+
+canonical_publisher = CanonicalPublisher(
+    settings.CANONICAL_STREAM,
+    batch_size=settings.CANONICAL_PUBLISH_BATCH_SIZE,
+    linger=settings.CANONICAL_PUBLISH_LINGER,
+    max_pending=settings.CANONICAL_PUBLISH_MAX_PENDING,
+    maxlen=settings.CANONICAL_STREAM_MAXLEN,
+    shards=settings.CANONICAL_STREAM_SHARDS,
+)
+
+async def publish_canonical(event: dict) -> asyncio.Future:
+    """
+    Publish canonical event JSON to Redis Stream `settings.CANONICAL_STREAM` (or its match's shard).
+    Events are pipelined in batches; await the returned future to wait for the XADD.
+    """
+    if not event:
+        raise ValueError("event cannot be empty")
+
+    # store as single 'data' field
+    try:
+        event_json = dumps_bytes(event)
     except Exception as e:
-        db.rollback()
-        logger.warning(f"Unexpected error persisting canonical event index: {e}", exc_info=True)
-        # Don't fail the publish if index fails
-    finally:
-        db.close()
+        logger.error(f"Error serializing event to JSON: {e}", exc_info=True)
+        raise ValueError(f"Failed to serialize event: {str(e)}")
 
+    return await canonical_publisher.publish(event, event_json)
 
+async def close_writers():
+    """Flush buffered publishers and writers (publisher first: it feeds the index writer); call on shutdown."""
+    await canonical_publisher.close()
+    await canonical_index_writer.close()
+    await raw_event_writer.close()
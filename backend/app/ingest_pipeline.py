@@ -0,0 +1,176 @@
+# app/ingest_pipeline.py
+"""
+Staged GRID ingest pipeline.
+
+    socket/webhook/backfill --submit()--> [raw queue] --normalize--> [canonical queue] --publish--> Redis
+                              \\--> raw_event_writer (bulk INSERT on the DB thread pool)
+
+Every hand-off is a bounded asyncio.Queue, so a slow stage pushes back on the producer
+instead of growing memory, and no stage ever runs blocking DB work on the event loop.
+"""
+import asyncio
+import logging
+from typing import Optional
+from app.grid_normalizer import normalize_grid_event, normalize_grid_batch
+from app.grid_storage import (
+    enqueue_raw_event, publish_canonical,
+    raw_event_writer, canonical_publisher, canonical_index_writer
+)
+from app.metrics import INGEST_QUEUE_DEPTH
+from app.settings import settings
+
+logger = logging.getLogger("ingest_pipeline")
+
+
+class IngestPipeline:
+    """
+    Normalization runs in a single task so per-match enrichment state sees events in
+    arrival order; persistence and publishing batch independently behind it.
+    """
+
+    def __init__(self, raw_maxsize: int, canonical_maxsize: int, normalize_batch: int = 256):
+        self.raw_maxsize = raw_maxsize
+        self.normalize_batch = normalize_batch
+        self.canonical_maxsize = canonical_maxsize
+        self._raw_queue: Optional[asyncio.Queue] = None
+        self._canonical_queue: Optional[asyncio.Queue] = None
+        self._tasks: list[asyncio.Task] = []
+        self._closing = False
+
+    def _ensure_started(self):
+        if self._tasks and not any(t.done() for t in self._tasks):
+            return
+        if self._raw_queue is None:
+            self._raw_queue = asyncio.Queue(maxsize=self.raw_maxsize)
+            self._canonical_queue = asyncio.Queue(maxsize=self.canonical_maxsize)
+            # gauges read queue sizes at scrape time; nothing to update per event
+            INGEST_QUEUE_DEPTH.labels(stage="normalize").set_function(self._raw_queue.qsize)
+            INGEST_QUEUE_DEPTH.labels(stage="publish").set_function(self._canonical_queue.qsize)
+            INGEST_QUEUE_DEPTH.labels(stage="raw_persist").set_function(raw_event_writer.qsize)
+            INGEST_QUEUE_DEPTH.labels(stage="redis_pipeline").set_function(canonical_publisher.qsize)
+            INGEST_QUEUE_DEPTH.labels(stage="canonical_index").set_function(canonical_index_writer.qsize)
+        # restart only stages whose task finished: a second consumer on the same queue
+        # would interleave events and break per-match order
+        loop = asyncio.get_running_loop()
+        stages = (self._normalize_stage, self._publish_stage)
+        tasks = self._tasks or [None] * len(stages)
+        for i, (task, stage) in enumerate(zip(tasks, stages)):
+            if task is not None and not task.done():
+                continue
+            if task is not None and not task.cancelled() and task.exception():
+                logger.error(f"[PIPELINE] Stage task died: {task.exception()!r}; restarting")
+            tasks[i] = loop.create_task(stage())
+        self._tasks = tasks
+
+    async def submit(self, raw: dict) -> asyncio.Future:
+        """
+        Hand a raw GRID event to the pipeline. Waits only while downstream queues are full.
+        Returns the raw-persistence future; await it when the caller must ack durably.
+        """
+        if self._closing:
+            raise RuntimeError("ingest pipeline is closed")
+        self._ensure_started()
+        persisted = await enqueue_raw_event(raw)
+        await self._raw_queue.put(raw)
+        return persisted
+
+    async def submit_many(self, raws: list) -> list:
+        """
+        Hand over a page of raw events (REST backfill) in order.
+        Returns one raw-persistence future per event; events the writer rejects up front
+        (e.g. no usable id) get an already-failed future so results line up with `raws`.
+        """
+        if self._closing:
+            raise RuntimeError("ingest pipeline is closed")
+        self._ensure_started()
+        loop = asyncio.get_running_loop()
+        futures = []
+        for raw in raws:
+            try:
+                persisted = await enqueue_raw_event(raw)
+            except ValueError as e:
+                persisted = loop.create_future()
+                persisted.set_exception(e)
+                futures.append(persisted)
+                continue
+            futures.append(persisted)
+            await self._raw_queue.put(raw)
+        return futures
+
+    async def _normalize_stage(self):
+        while True:
+            # take whatever has queued up (at least one event) and normalize it as a batch;
+            # under load this lets runs of POSITION_UPDATEs use the vectorized enricher
+            raws, stop = [], False
+            item = await self._raw_queue.get()
+            while True:
+                if item is None:
+                    # close() sent the sentinel; a submit() that was blocked on a full queue
+                    # may still land behind it
+                    stop = True
+                    break
+                raws.append(item)
+                if len(raws) >= self.normalize_batch or self._raw_queue.empty():
+                    break
+                item = self._raw_queue.get_nowait()
+            if stop:
+                self._drop_after_close()
+            if raws:
+                try:
+                    canonicals = await normalize_grid_batch(raws)
+                except Exception as e:
+                    logger.error(f"[PIPELINE] Batch normalization of {len(raws)} events failed: {e}", exc_info=True)
+                    canonicals = await self._normalize_each(raws)
+                for canonical in canonicals:
+                    await self._canonical_queue.put(canonical)
+            if stop:
+                await self._canonical_queue.put(None)
+                return
+
+    def _drop_after_close(self):
+        """Discard events queued behind the close() sentinel: their submit() raced close()."""
+        dropped = 0
+        while not self._raw_queue.empty():
+            if self._raw_queue.get_nowait() is not None:
+                dropped += 1
+        if dropped:
+            logger.warning(f"[PIPELINE] Dropped {dropped} events submitted while closing (raw rows are persisted)")
+
+    async def _normalize_each(self, raws: list) -> list:
+        canonicals = []
+        for raw in raws:
+            try:
+                canonicals.append(await normalize_grid_event(raw))
+            except Exception as e:
+                evt_ctx = {
+                    "match_id": raw.get("match_id"),
+                    "type": raw.get("type") or raw.get("event_type"),
+                    "seq": raw.get("seq"),
+                }
+                logger.error(f"[PIPELINE] Error normalizing event ctx={evt_ctx}: {e}", exc_info=True)
+        return canonicals
+
+    async def _publish_stage(self):
+        while True:
+            canonical = await self._canonical_queue.get()
+            if canonical is None:
+                return
+            try:
+                await publish_canonical(canonical.dict())
+            except Exception as e:
+                logger.error(f"[PIPELINE] Error publishing event_id={canonical.event_id}: {e}", exc_info=True)
+
+    async def close(self):
+        """Stop accepting events and drain the normalize/publish stages."""
+        self._closing = True
+        if not self._tasks or all(t.done() for t in self._tasks):
+            return
+        await self._raw_queue.put(None)
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+
+
+ingest_pipeline = IngestPipeline(
+    raw_maxsize=settings.INGEST_RAW_QUEUE_SIZE,
+    canonical_maxsize=settings.INGEST_CANONICAL_QUEUE_SIZE,
+    normalize_batch=settings.INGEST_NORMALIZE_BATCH,
+)
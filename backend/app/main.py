@@ -7,10 +7,11 @@ from app.api_predictions import router as predictions_router
 from app.analytics.api import router as analytics_router
 from app.api_opensource import router as opensource_router
 from app.db import init_db
-from app.grid_client import connect_ws, rest_backfill
-from app.grid_storage import persist_raw_event, publish_canonical
-from app.grid_normalizer import normalize_grid_event
+from app.grid_client import connect_ws, rest_backfill, close_rest_client
+from app.grid_storage import close_writers
+from app.ingest_pipeline import ingest_pipeline
 from app.settings import settings
+from app.utils.serialization import loads
 import os
 import asyncio
 import logging
@@ -69,6 +70,13 @@ async def shutdown_event():
             logger.error(f"Error cancelling WebSocket task: {e}", exc_info=True)
         finally:
             _ws_task = None
+    # drain the ingest stages, then flush buffered writers so nothing acknowledged is lost
+    try:
+        await ingest_pipeline.close()
+        await close_writers()
+    except Exception as e:
+        logger.error(f"Error flushing buffered writers: {e}", exc_info=True)
+    await close_rest_client()
 
 @app.get("/")
 async def root():
@@ -87,11 +95,11 @@ async def health_v1():
 async def grid_webhook(req: Request):
     """
     GRID can POST events to this endpoint. We persist raw, normalize & publish.
-    Keep lightweight to ack quickly (store raw, enqueue to worker to normalize).
+    Keep lightweight to ack quickly (store raw, enqueue to the ingest pipeline to normalize).
     """
     try:
         try:
-            raw = await req.json()
+            raw = loads(await req.body())
         except Exception as e:
             logger.error(f"Failed to parse JSON payload: {e}")
             raise HTTPException(status_code=400, detail=f"Invalid JSON payload: {str(e)}")
@@ -99,27 +107,15 @@ async def grid_webhook(req: Request):
         if not raw:
             raise HTTPException(status_code=400, detail="empty payload")
         
-        # persist raw (idempotent)
+        # persist raw (idempotent); concurrent webhook hits share one bulk INSERT on the DB
+        # thread pool. Normalize & publish continue in the background pipeline stages.
         try:
-            persist_raw_event(raw)
+            persisted = await ingest_pipeline.submit(raw)
+            await persisted
         except Exception as e:
             logger.error(f"Failed to persist raw event: {e}", exc_info=True)
             raise HTTPException(status_code=500, detail="Failed to persist raw event")
         
-        # synchronous normalize & publish (or push to Celery for heavy pipelines)
-        try:
-            canonical = await normalize_grid_event(raw)
-        except Exception as e:
-            logger.error(f"Failed to normalize grid event: {e}", exc_info=True)
-            raise HTTPException(status_code=500, detail="Failed to normalize event")
-        
-        try:
-            await publish_canonical(canonical.dict())
-        except Exception as e:
-            logger.error(f"Failed to publish canonical event: {e}", exc_info=True)
-            # Don't fail the request if publish fails - event is already persisted
-            logger.warning("Event persisted but publish failed, continuing")
-        
         return {"ok": True}
     except HTTPException:
         raise
@@ -25,6 +25,193 @@ STREAM_LAG_MS = Gauge(
     ["consumer_group"]
 )
 
+STREAM_LAG_ENTRIES = Gauge(
+    "stream_lag_entries",
+    "Entries not yet delivered to the consumer group (XINFO GROUPS lag, Redis 7+)",
+    ["consumer_group"]
+)
+
+STREAM_PENDING_ENTRIES = Gauge(
+    "stream_pending_entries",
+    "Delivered but unacknowledged entries (PEL size)",
+    ["consumer_group"]
+)
+
+STREAM_CLAIMED_TOTAL = Counter(
+    "stream_claimed_total",
+    "Stale pending entries reclaimed with XAUTOCLAIM",
+    ["consumer_group"]
+)
+
+STREAM_DEAD_LETTERED_TOTAL = Counter(
+    "stream_dead_lettered_total",
+    "Entries moved to the dead-letter stream",
+    ["consumer_group"]
+)
+
+STREAM_OWNED_SHARDS = Gauge(
+    "stream_owned_shards",
+    "Canonical stream shards this worker currently consumes",
+    ["consumer_group"]
+)
+
+CONSUMER_EVENTS_TOTAL = Counter(
+    "consumer_events_total",
+    "Stream entries handled by a registered consumer handler",
+    ["handler", "outcome"]
+)
+
+CONSUMER_HANDLER_SECONDS = Histogram(
+    "consumer_handler_seconds",
+    "Handler latency per call (one event, or one batch for batch handlers)",
+    ["handler"],
+    buckets=[0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 30.0]
+)
+
+CONSUMER_INFLIGHT = Gauge(
+    "consumer_inflight",
+    "Handler calls currently in flight",
+    ["handler"]
+)
+
+ROUNDS_OPEN = Gauge(
+    "rounds_open",
+    "Rounds started but not yet ended, held in memory by the rounds materializer"
+)
+
+ROUNDS_FLUSH_SECONDS = Histogram(
+    "rounds_flush_seconds",
+    "Time to upsert one batch of rounds and macro outcomes",
+    buckets=[0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0]
+)
+
+ROUNDS_REJECTED_TOTAL = Counter(
+    "rounds_rejected_total",
+    "Rounds dropped by the rounds materializer because Postgres rejected their data"
+)
+
+INGEST_QUEUE_DEPTH = Gauge(
+    "ingest_queue_depth",
+    "Items waiting between ingest pipeline stages",
+    ["stage"]
+)
+
+ENRICHER_TRACKED_MATCHES = Gauge(
+    "enricher_tracked_matches",
+    "Matches with live enrichment state in this process"
+)
+
+ENRICHER_STATE_ENTRIES = Gauge(
+    "enricher_state_entries",
+    "Entries held in enrichment state across matches",
+    ["kind"]
+)
+
+ENRICHER_EVICTIONS_TOTAL = Counter(
+    "enricher_evictions_total",
+    "Match states evicted from the enricher",
+    ["reason"]
+)
+
+DB_WRITER_BATCH_SIZE = Histogram(
+    "db_writer_batch_size",
+    "Rows per bulk INSERT flushed by a buffered writer",
+    ["writer"],
+    buckets=[1, 5, 10, 50, 100, 250, 500, 1000, 2500]
+)
+
+DB_WRITER_FLUSH_SECONDS = Histogram(
+    "db_writer_flush_seconds",
+    "Time to flush one batch from a buffered writer",
+    ["writer"],
+    buckets=[0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0]
+)
+
+DB_WRITER_DUPLICATES_TOTAL = Counter(
+    "db_writer_duplicates_total",
+    "Rows skipped by ON CONFLICT DO NOTHING",
+    ["writer"]
+)
+
+PUBLISH_BATCH_SIZE = Histogram(
+    "publish_batch_size",
+    "Events per pipelined XADD batch",
+    ["stream"],
+    buckets=[1, 5, 10, 25, 50, 100, 200, 500]
+)
+
+PUBLISH_BATCH_SECONDS = Histogram(
+    "publish_batch_seconds",
+    "Round-trip time of one pipelined XADD batch",
+    ["stream"],
+    buckets=[0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0]
+)
+
+BACKFILL_CONCURRENCY = Gauge(
+    "backfill_concurrency_limit",
+    "Current AIMD limit on in-flight REST backfill requests"
+)
+
+BACKFILL_EVENTS_TOTAL = Counter(
+    "backfill_events_total",
+    "Events fetched by REST backfill",
+    ["outcome"]
+)
+
+BACKFILL_THROTTLED_TOTAL = Counter(
+    "backfill_throttled_total",
+    "REST backfill responses that asked us to slow down (429)"
+)
+
+SEQ_GAPS_TOTAL = Counter(
+    "ingest_seq_gaps_total",
+    "Sequence gaps detected on the live GRID stream"
+)
+
+SEQ_GAP_EVENTS_TOTAL = Counter(
+    "ingest_seq_gap_events_total",
+    "Events missing from detected sequence gaps"
+)
+
+SEQ_DUPLICATES_TOTAL = Counter(
+    "ingest_seq_duplicates_total",
+    "Live events dropped because their seq was already received"
+)
+
+SEQ_GAPS_UNRECOVERED_TOTAL = Counter(
+    "ingest_seq_gaps_unrecovered_total",
+    "Sequence gaps still incomplete after range backfill gave up"
+)
+
+SEQ_GAP_RECOVERY_SECONDS = Histogram(
+    "ingest_seq_gap_recovery_seconds",
+    "Time from gap detection until every missing seq was received",
+    buckets=[0.1, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0]
+)
+
+SEQ_OPEN_GAPS = Gauge(
+    "ingest_seq_open_gaps",
+    "Sequence gaps currently waiting for recovery"
+)
+
+WS_FANOUT_DROPPED_TOTAL = Counter(
+    "ws_fanout_dropped_total",
+    "WebSocket frames not delivered as published (coalesced into a newer one, or evicted on overflow)",
+    ["hub", "reason"]
+)
+
+WS_FANOUT_CLIENTS_DROPPED_TOTAL = Counter(
+    "ws_fanout_clients_dropped_total",
+    "WebSocket clients disconnected by a fan-out hub",
+    ["hub", "reason"]
+)
+
+WS_FANOUT_QUEUE_DEPTH = Gauge(
+    "ws_fanout_queue_depth",
+    "Frames waiting in per-client outbound queues (deepest client, and total)",
+    ["hub", "stat"]
+)
+
 # Match metrics
 EVENTS_PER_MINUTE = Gauge(
     "events_per_minute",
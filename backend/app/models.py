@@ -190,3 +190,16 @@ class CanonicalEventIndex(Base):
     payload = Column(JSON, nullable=True)
     enriched = Column(Boolean, default=False)
 
+
+
+class BackfillCheckpoint(Base):
+    """
+    Per-match REST backfill cursor: the highest GRID seq whose raw rows are durably stored.
+    A restarted backfill resumes after `last_seq` instead of refetching the whole match.
+    """
+    __tablename__ = "backfill_checkpoints"
+    match_id = Column(String(128), primary_key=True)
+    last_seq = Column(Integer, nullable=False, default=-1)
+    events_ingested = Column(Integer, nullable=False, default=0)
+    completed = Column(Boolean, default=False, nullable=False)
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
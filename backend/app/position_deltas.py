@@ -0,0 +1,99 @@
+# app/position_deltas.py
+"""
+Tick-based position frames for replay viewers.
+
+Instead of forwarding every POSITION_UPDATE as its own JSON object, the replay endpoint
+folds them into per-match state and, every 1 / REPLAY_POSITION_TICK_HZ seconds, sends one
+frame per match holding only the players that moved since the last tick:
+
+    {"type": "POSITION_DELTA", "match_id": "m1", "tick": 412, "q": 0.1,
+     "p": {"p1": [1234, 56, -789], "p4": [...]}}
+
+Coordinates are integers in units of `q` (multiply to get world units). They are absolute,
+so a client that missed a frame is only stale until that player's next move; a full
+POSITION_KEYFRAME (every player) goes out when a client subscribes and every
+REPLAY_KEYFRAME_SECONDS. A player whose quantized position did not change is not sent.
+"""
+import time
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+Quantized = Tuple[int, ...]
+
+
+def quantize(pos, quantum: float) -> Optional[Quantized]:
+    """[x, y, z] (or {"x":..,"y":..,"z":..}) -> integer multiples of `quantum`; None if malformed."""
+    if isinstance(pos, dict):
+        pos = [pos.get("x"), pos.get("y"), pos.get("z", 0.0)]
+    try:
+        return tuple(int(round(float(v) / quantum)) for v in pos)
+    except (TypeError, ValueError):
+        return None
+
+
+def position_of(event: dict) -> Tuple[Optional[str], Any]:
+    """(player id, raw position) of a POSITION_UPDATE, following the enricher's field names."""
+    payload = event.get("payload") or {}
+    player = payload.get("player_id") or event.get("actor")
+    return player, payload.get("pos") or payload.get("position")
+
+
+class MatchPositions:
+    __slots__ = ("latest", "changed", "updated_at")
+
+    def __init__(self):
+        self.latest: Dict[str, Quantized] = {}
+        self.changed: Dict[str, Quantized] = {}  # moved since the last tick
+        self.updated_at = time.monotonic()
+
+    def update(self, player: str, q: Quantized):
+        self.updated_at = time.monotonic()
+        if self.latest.get(player) != q:
+            self.latest[player] = q
+            self.changed[player] = q
+
+
+class PositionTicker:
+    """Per-match quantized positions, drained into delta frames once per tick."""
+
+    def __init__(self, quantum: float, idle_seconds: float = 60.0):
+        self.quantum = quantum
+        self.idle_seconds = idle_seconds
+        self.matches: Dict[str, MatchPositions] = {}
+        self.tick = 0
+
+    def update(self, event: dict) -> bool:
+        """Fold one POSITION_UPDATE in; returns False if it carried no usable position."""
+        player, pos = position_of(event)
+        q = quantize(pos, self.quantum) if player is not None and pos is not None else None
+        if q is None:
+            return False
+        match_id = event.get("match_id")
+        st = self.matches.get(match_id)
+        if st is None:
+            st = self.matches[match_id] = MatchPositions()
+        st.update(str(player), q)
+        return True
+
+    def _frame(self, kind: str, match_id: str, players: Dict[str, Quantized]) -> dict:
+        return {"type": kind, "match_id": match_id, "tick": self.tick, "q": self.quantum,
+                "p": {pid: list(q) for pid, q in players.items()}}
+
+    def deltas(self) -> List[dict]:
+        """Advance one tick; returns a POSITION_DELTA per match with movement."""
+        self.tick += 1
+        frames = []
+        for match_id, st in self.matches.items():
+            if st.changed:
+                frames.append(self._frame("POSITION_DELTA", match_id, st.changed))
+                st.changed = {}
+        return frames
+
+    def keyframes(self, match_ids: Optional[Iterable[str]] = None) -> List[dict]:
+        """Full POSITION_KEYFRAME for the given matches (all tracked matches when None)."""
+        ids = self.matches.keys() if match_ids is None else [m for m in match_ids if m in self.matches]
+        return [self._frame("POSITION_KEYFRAME", m, self.matches[m].latest) for m in ids if self.matches[m].latest]
+
+    def evict_idle(self):
+        cutoff = time.monotonic() - self.idle_seconds
+        for match_id in [m for m, st in self.matches.items() if st.updated_at < cutoff]:
+            del self.matches[match_id]
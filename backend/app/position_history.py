@@ -0,0 +1,135 @@
+# app/position_history.py
+"""
+Per-player position history stored in fixed-size NumPy ring buffers.
+
+Each row is (ts, x, y, z, vx, vy, vz). `push` handles one live sample with scalar math;
+`extend` derives speed / acceleration / heading change for a whole run of samples with
+vectorized operations (REST backfill, replay ingestion). Both produce the same values.
+"""
+import math
+from typing import Optional, Sequence, Tuple
+
+import numpy as np
+
+TS, X, Y, Z, VX, VY, VZ = range(7)
+NAN = float("nan")
+
+Motion = Tuple[Optional[float], Optional[float], Optional[float]]  # speed, accel, heading change (deg)
+
+
+def to_xyz(pos: Sequence[float]) -> Tuple[float, float, float]:
+    """Coerce [x, y] / [x, y, z] to a float triple (z defaults to 0)."""
+    return float(pos[0]), float(pos[1]), float(pos[2]) if len(pos) > 2 else 0.0
+
+
+def to_ts(ts) -> float:
+    if ts is None:
+        return NAN
+    try:
+        return float(ts)
+    except (TypeError, ValueError):
+        return NAN
+
+
+def _opt(value: float) -> Optional[float]:
+    return None if value != value else float(value)  # NaN -> None, numpy scalar -> float
+
+
+class PositionRing:
+    __slots__ = ("data", "head", "size")
+
+    def __init__(self, capacity: int = 64):
+        self.data = np.full((capacity, 7), np.nan)
+        self.head = 0  # next slot to write
+        self.size = 0
+
+    @property
+    def capacity(self) -> int:
+        return self.data.shape[0]
+
+    def last(self) -> Optional[np.ndarray]:
+        if not self.size:
+            return None
+        return self.data[(self.head - 1) % self.capacity]
+
+    def history(self) -> np.ndarray:
+        """Samples oldest -> newest (copy)."""
+        if self.size < self.capacity:
+            return self.data[:self.size].copy()
+        return np.roll(self.data, -self.head, axis=0)
+
+    def _write(self, rows: np.ndarray):
+        cap = self.capacity
+        if len(rows) >= cap:
+            self.data[:] = rows[-cap:]
+            self.head = 0
+            self.size = cap
+            return
+        end = self.head + len(rows)
+        if end <= cap:
+            self.data[self.head:end] = rows
+        else:
+            split = cap - self.head
+            self.data[self.head:] = rows[:split]
+            self.data[:end - cap] = rows[split:]
+        self.head = end % cap
+        self.size = min(cap, self.size + len(rows))
+
+    def push(self, ts: float, pos: Sequence[float]) -> Motion:
+        """Append one sample and return its (speed, accel, heading change)."""
+        x, y, z = to_xyz(pos)
+        speed = accel = heading = NAN
+        vx = vy = vz = NAN
+        if self.size:
+            # plain Python floats: scalar NumPy arithmetic is several times slower
+            pts, px, py, pz, pvx, pvy, pvz = self.data[(self.head - 1) % self.capacity].tolist()
+            dt = ts - pts
+            if dt > 0:
+                vx, vy, vz = (x - px) / dt, (y - py) / dt, (z - pz) / dt
+                speed = math.sqrt(vx * vx + vy * vy + vz * vz)
+                prev_speed = math.sqrt(pvx * pvx + pvy * pvy + pvz * pvz)
+                accel = (speed - prev_speed) / dt
+                norms = speed * prev_speed
+                if norms > 0:
+                    cos = (vx * pvx + vy * pvy + vz * pvz) / norms
+                    heading = math.degrees(math.acos(min(1.0, max(-1.0, cos))))
+            elif dt <= 0:
+                speed = 0.0
+        self.data[self.head] = (ts, x, y, z, vx, vy, vz)
+        self.head = (self.head + 1) % self.capacity
+        self.size = min(self.capacity, self.size + 1)
+        return _opt(speed), _opt(accel), _opt(heading)
+
+    def extend(self, ts: np.ndarray, pos: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Append n samples (ts: (n,), pos: (n, 3)) and return speed, accel and heading change
+        arrays of length n (NaN where undefined).
+        """
+        n = len(ts)
+        prev = self.last()
+        if prev is None:
+            prev = np.full(7, np.nan)
+        all_ts = np.concatenate(([prev[TS]], ts))
+        all_pos = np.vstack((prev[X:Z + 1], pos))
+        dt = np.diff(all_ts)
+        disp = np.diff(all_pos, axis=0)
+
+        moving = dt > 0
+        with np.errstate(divide="ignore", invalid="ignore"):
+            vel = np.where(moving[:, None], disp / dt[:, None], np.nan)
+            vnorm = np.sqrt(np.einsum("ij,ij->i", vel, vel))
+            speed = np.where(moving, vnorm, np.where(dt <= 0, 0.0, np.nan))
+
+            prev_vel = np.vstack((prev[VX:VZ + 1], vel[:-1]))
+            prev_norm = np.sqrt(np.einsum("ij,ij->i", prev_vel, prev_vel))
+            accel = (vnorm - prev_norm) / dt
+            norms = vnorm * prev_norm
+            cos = np.einsum("ij,ij->i", vel, prev_vel) / norms
+            heading = np.where(norms > 0, np.degrees(np.arccos(np.clip(cos, -1.0, 1.0))), np.nan)
+
+        rows = np.empty((n, 7))
+        rows[:, TS] = ts
+        rows[:, X:Z + 1] = pos
+        rows[:, VX:VZ + 1] = vel
+        self._write(rows)
+        return speed, accel, heading
@@ -82,3 +82,41 @@ class CanonicalEvent(BaseModel):
     enriched: Dict[str, Any] = {}
     ingestion_meta: Dict[str, Any] = {}
 
+
+
+class CanonicalRecord:
+    """
+    Slotted, validation-free counterpart of CanonicalEvent used on the hot ingest path.
+    `dict()` returns the wire format directly (timestamp already ISO-8601).
+    """
+    __slots__ = ("event_id", "match_id", "event_type", "timestamp", "timestamp_iso",
+                 "actor", "target", "team", "payload", "enriched", "ingestion_meta")
+
+    def __init__(self, event_id: str, match_id: str, event_type: str, timestamp: datetime, timestamp_iso: str,
+                 actor: Optional[str], target: Optional[str], team: Optional[str],
+                 payload: Dict[str, Any], ingestion_meta: Dict[str, Any]):
+        self.event_id = event_id
+        self.match_id = match_id
+        self.event_type = event_type
+        self.timestamp = timestamp
+        self.timestamp_iso = timestamp_iso
+        self.actor = actor
+        self.target = target
+        self.team = team
+        self.payload = payload
+        self.enriched: Dict[str, Any] = {}
+        self.ingestion_meta = ingestion_meta
+
+    def dict(self) -> Dict[str, Any]:
+        return {
+            "event_id": self.event_id,
+            "match_id": self.match_id,
+            "event_type": self.event_type,
+            "timestamp": self.timestamp_iso,
+            "actor": self.actor,
+            "target": self.target,
+            "team": self.team,
+            "payload": self.payload,
+            "enriched": self.enriched,
+            "ingestion_meta": self.ingestion_meta,
+        }
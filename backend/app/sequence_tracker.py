@@ -0,0 +1,162 @@
+# app/sequence_tracker.py
+"""
+Per-match GRID `seq` tracking for the live websocket.
+
+Every observed seq is classified against the match's high-water mark:
+
+    seq == next expected            -> in order
+    seq >  next expected            -> gap [expected, seq - 1] opened; event accepted
+    seq inside an open gap          -> late arrival; fills the gap
+    seq <  first seq seen           -> untracked (predates this process; passed through)
+    seq <  next expected otherwise  -> duplicate (caller drops it)
+
+A gap that is still open after `grace` seconds (reordering tolerance) is handed to the
+`recover(match_id, first_seq, last_seq)` callback, a range-limited REST backfill that
+returns the seqs it stored. Time from detection to the last missing seq arriving is
+recorded as recovery latency.
+"""
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from typing import Awaitable, Callable, Iterable, List, Optional, Set
+
+from app.metrics import (
+    SEQ_GAPS_TOTAL, SEQ_GAP_EVENTS_TOTAL, SEQ_DUPLICATES_TOTAL,
+    SEQ_GAPS_UNRECOVERED_TOTAL, SEQ_GAP_RECOVERY_SECONDS, SEQ_OPEN_GAPS
+)
+
+logger = logging.getLogger("sequence_tracker")
+
+IN_ORDER, GAP, LATE, DUPLICATE, UNTRACKED = "in_order", "gap", "late", "duplicate", "untracked"
+
+Recover = Callable[[str, int, int], Awaitable[Iterable[int]]]
+
+
+class _Gap:
+    __slots__ = ("first", "last", "missing", "detected_at", "task")
+
+    def __init__(self, first: int, last: int):
+        self.first = first
+        self.last = last
+        self.missing: Set[int] = set(range(first, last + 1))
+        self.detected_at = time.monotonic()
+        self.task: Optional[asyncio.Task] = None
+
+
+class _MatchSeq:
+    __slots__ = ("base_seq", "next_seq", "gaps")
+
+    def __init__(self, base_seq: int):
+        self.base_seq = base_seq  # first seq seen; anything older is outside what we track
+        self.next_seq = base_seq + 1
+        self.gaps: List[_Gap] = []
+
+
+class SequenceTracker:
+    def __init__(self, recover: Optional[Recover] = None, grace: float = 0.5, max_gap: int = 10_000,
+                 max_matches: int = 512, attempts: int = 3):
+        self.recover = recover
+        self.grace = grace
+        self.max_gap = max_gap
+        self.max_matches = max_matches
+        self.attempts = attempts
+        self._matches: "OrderedDict[str, _MatchSeq]" = OrderedDict()  # least recently used first
+        SEQ_OPEN_GAPS.set_function(lambda: sum(len(m.gaps) for m in list(self._matches.values())))
+
+    def observe(self, raw: dict) -> str:
+        """Classify one live event's seq; opens gaps and schedules their recovery."""
+        match_id = raw.get("match_id")
+        seq = raw.get("seq")
+        if match_id is None or seq is None:
+            return UNTRACKED
+        if not isinstance(seq, int):
+            try:
+                seq = int(seq)
+            except (TypeError, ValueError):
+                return UNTRACKED
+        match_id = str(match_id)
+
+        st = self._matches.get(match_id)
+        if st is None:
+            # first event we see for a match sets the baseline; earlier history is rest_backfill's job
+            self._matches[match_id] = _MatchSeq(seq)
+            while len(self._matches) > self.max_matches:
+                _mid, dropped = self._matches.popitem(last=False)
+                self._cancel(dropped)
+            return IN_ORDER
+        self._matches.move_to_end(match_id)
+
+        if seq == st.next_seq:
+            st.next_seq += 1
+            return IN_ORDER
+        if seq > st.next_seq:
+            if seq - st.next_seq > self.max_gap:
+                # more than we are willing to track seq by seq: treat as a new stream
+                logger.warning(f"[SEQ] match {match_id} jumped from {st.next_seq - 1} to {seq}; resetting tracker")
+                self._cancel(st)
+                self._matches[match_id] = _MatchSeq(seq)
+                return GAP
+            gap = _Gap(st.next_seq, seq - 1)
+            st.gaps.append(gap)
+            st.next_seq = seq + 1
+            SEQ_GAPS_TOTAL.inc()
+            SEQ_GAP_EVENTS_TOTAL.inc(len(gap.missing))
+            logger.info(f"[SEQ] match {match_id} gap {gap.first}..{gap.last} ({len(gap.missing)} events)")
+            if self.recover is not None:
+                gap.task = asyncio.get_running_loop().create_task(self._recover(match_id, st, gap))
+            return GAP
+        if self._fill(st, seq):
+            return LATE
+        if seq < st.base_seq:
+            # from before we started tracking (e.g. reordered around a restart); the raw
+            # writer's unique key still de-duplicates it
+            return UNTRACKED
+        SEQ_DUPLICATES_TOTAL.inc()
+        return DUPLICATE
+
+    def _fill(self, st: _MatchSeq, seq: int) -> bool:
+        for gap in st.gaps:
+            if gap.first <= seq <= gap.last and seq in gap.missing:
+                gap.missing.discard(seq)
+                if not gap.missing:
+                    SEQ_GAP_RECOVERY_SECONDS.observe(time.monotonic() - gap.detected_at)
+                    st.gaps.remove(gap)
+                return True
+        return False
+
+    def mark_received(self, match_id: str, seqs: Iterable[int]):
+        """Record seqs that arrived out of band (range backfill)."""
+        st = self._matches.get(match_id)
+        if st is None:
+            return
+        for seq in seqs:
+            self._fill(st, seq)
+
+    async def _recover(self, match_id: str, st: _MatchSeq, gap: _Gap):
+        try:
+            await asyncio.sleep(self.grace)
+            for attempt in range(1, self.attempts + 1):
+                if not gap.missing:
+                    return
+                first, last = min(gap.missing), max(gap.missing)
+                try:
+                    received = await self.recover(match_id, first, last)
+                    self.mark_received(match_id, received)
+                except Exception as e:
+                    logger.error(f"[SEQ] Range backfill {first}..{last} for match {match_id} failed (attempt {attempt}): {e}", exc_info=True)
+                if gap.missing and attempt < self.attempts:
+                    await asyncio.sleep(self.grace * 2 ** attempt)
+            if gap.missing:
+                logger.warning(f"[SEQ] match {match_id}: {len(gap.missing)} events of gap {gap.first}..{gap.last} not recovered")
+                SEQ_GAPS_UNRECOVERED_TOTAL.inc()
+                if gap in st.gaps:
+                    st.gaps.remove(gap)
+        except asyncio.CancelledError:
+            pass
+
+    def _cancel(self, st: _MatchSeq):
+        for gap in st.gaps:
+            if gap.task is not None and not gap.task.done():
+                gap.task.cancel()
+        st.gaps.clear()
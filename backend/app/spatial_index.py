@@ -0,0 +1,104 @@
+# app/spatial_index.py
+"""
+Uniform-grid spatial index over last-known entity positions.
+
+Cells are cubes of `cell_size` metres; a radius query with radius <= cell_size only
+touches the 27 cells around the centre, so cost scales with local density rather than
+the number of tracked entities (10 Valorant players or 100+ LoL champions/minions/wards).
+Below `linear_max` entities a plain scan is cheaper than visiting 27 cells, so queries
+fall back to it.
+"""
+import math
+from typing import Dict, Iterable, List, Optional, Sequence, Set, Tuple
+
+Cell = Tuple[int, int, int]
+
+
+class SpatialGrid:
+    def __init__(self, cell_size: float, linear_max: int = 32):
+        self.cell_size = float(cell_size)
+        self.linear_max = linear_max
+        self._cells: Dict[Cell, Set[str]] = {}
+        self._positions: Dict[str, Tuple[float, float, float]] = {}
+        self._cell_of: Dict[str, Cell] = {}
+        self._teams: Dict[str, str] = {}
+
+    def _cell(self, pos: Sequence[float]) -> Cell:
+        s = self.cell_size
+        return (math.floor(pos[0] / s), math.floor(pos[1] / s), math.floor(pos[2] / s) if len(pos) > 2 else 0)
+
+    def update(self, entity_id: str, pos: Sequence[float], team: Optional[str] = None):
+        """Move `entity_id` to `pos` (x, y[, z]); remembers its team when given."""
+        p = (float(pos[0]), float(pos[1]), float(pos[2]) if len(pos) > 2 else 0.0)
+        cell = self._cell(p)
+        old = self._cell_of.get(entity_id)
+        if old != cell:
+            if old is not None:
+                bucket = self._cells.get(old)
+                if bucket is not None:
+                    bucket.discard(entity_id)
+                    if not bucket:
+                        del self._cells[old]
+            self._cells.setdefault(cell, set()).add(entity_id)
+            self._cell_of[entity_id] = cell
+        self._positions[entity_id] = p
+        if team is not None:
+            self._teams[entity_id] = team
+
+    def set_team(self, entity_id: str, team: str):
+        self._teams[entity_id] = team
+
+    def team_of(self, entity_id: str) -> Optional[str]:
+        return self._teams.get(entity_id)
+
+    def position_of(self, entity_id: str) -> Optional[Tuple[float, float, float]]:
+        return self._positions.get(entity_id)
+
+    def remove(self, entity_id: str):
+        cell = self._cell_of.pop(entity_id, None)
+        self._positions.pop(entity_id, None)
+        self._teams.pop(entity_id, None)
+        if cell is not None:
+            bucket = self._cells.get(cell)
+            if bucket is not None:
+                bucket.discard(entity_id)
+                if not bucket:
+                    del self._cells[cell]
+
+    def query_radius(self, center: Sequence[float], radius: float, exclude: Iterable[str] = (),
+                     team: Optional[str] = None, exclude_team: Optional[str] = None) -> List[str]:
+        """
+        Entities strictly within `radius` of `center`.
+        `team` keeps only that team's members; `exclude_team` drops that team's members.
+        """
+        cx, cy = float(center[0]), float(center[1])
+        cz = float(center[2]) if len(center) > 2 else 0.0
+        r2 = radius * radius
+        skip = set(exclude)
+        if len(self._positions) <= self.linear_max:
+            candidates = self._positions.keys()
+        else:
+            reach = max(1, math.ceil(radius / self.cell_size))
+            bx, by, bz = self._cell((cx, cy, cz))
+            candidates = []
+            for ix in range(bx - reach, bx + reach + 1):
+                for iy in range(by - reach, by + reach + 1):
+                    for iz in range(bz - reach, bz + reach + 1):
+                        bucket = self._cells.get((ix, iy, iz))
+                        if bucket:
+                            candidates.extend(bucket)
+        found = []
+        for eid in candidates:
+            if eid in skip:
+                continue
+            if team is not None and self._teams.get(eid) != team:
+                continue
+            if exclude_team is not None and self._teams.get(eid) == exclude_team:
+                continue
+            x, y, z = self._positions[eid]
+            if (x - cx) ** 2 + (y - cy) ** 2 + (z - cz) ** 2 < r2:
+                found.append(eid)
+        return found
+
+    def __len__(self) -> int:
+        return len(self._positions)
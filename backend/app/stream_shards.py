@@ -0,0 +1,210 @@
+# app/stream_shards.py
+"""
+Match-partitioned canonical streams.
+
+With CANONICAL_STREAM_SHARDS = N > 1 the publisher writes each event to
+`<CANONICAL_STREAM>:<crc32(match_id) % N>`, so every event of a match lands in one shard in
+publish order. Consumer groups scale out by giving each shard to exactly one worker:
+
+- workers heartbeat into a sorted set per group (`<stream>:<group>:workers`);
+- each shard goes to the live worker with the highest rendezvous hash that still has room
+  (at most ceil(N / workers) each), so load is even and a join/leave moves few shards;
+- ownership is a Redis lease (`SET NX PX`) renewed every heartbeat. A shard is only picked
+  up after its previous owner stopped reading it and released the lease, and the new owner
+  first drains the shard's pending entries, so per-match order holds across rebalances.
+
+With N = 1 the plain stream name is used and consumers run as a competing group as before.
+"""
+import asyncio
+import hashlib
+import logging
+import os
+import socket
+import time
+import zlib
+from typing import Callable, Dict, List, Optional, Set
+
+import aioredis
+
+from app.metrics import STREAM_OWNED_SHARDS
+from app.settings import settings
+from app.utils.stream_consumer import StreamConsumer
+
+logger = logging.getLogger("stream_shards")
+
+# compare-and-delete / compare-and-extend so a worker never touches a lease it lost
+_RELEASE = "if redis.call('get', KEYS[1]) == ARGV[1] then return redis.call('del', KEYS[1]) else return 0 end"
+_RENEW = "if redis.call('get', KEYS[1]) == ARGV[1] then return redis.call('pexpire', KEYS[1], ARGV[2]) else return 0 end"
+
+
+def shard_for(match_id, shards: int) -> int:
+    """Stable (cross-process, cross-language) shard index for a match."""
+    if shards <= 1:
+        return 0
+    return zlib.crc32(str(match_id).encode("utf-8")) % shards
+
+
+def shard_stream(base: str, index: int, shards: int) -> str:
+    return base if shards <= 1 else f"{base}:{index}"
+
+
+def stream_for_match(base: str, match_id, shards: int) -> str:
+    return shard_stream(base, shard_for(match_id, shards), shards)
+
+
+def _rendezvous(worker: str, shard: int) -> int:
+    return int.from_bytes(hashlib.blake2b(f"{worker}|{shard}".encode(), digest_size=8).digest(), "big")
+
+
+def assign_shards(workers: List[str], shards: int) -> Dict[str, Set[int]]:
+    """
+    Rendezvous (highest-random-weight) assignment capped at ceil(shards / workers) per worker,
+    so load stays even while a membership change only moves a few shards.
+    """
+    owners: Dict[str, Set[int]] = {w: set() for w in workers}
+    if not workers:
+        return owners
+    cap = -(-shards // len(workers))
+    for i in range(shards):
+        for w in sorted(workers, key=lambda w: _rendezvous(w, i), reverse=True):
+            if len(owners[w]) < cap:
+                owners[w].add(i)
+                break
+    return owners
+
+
+def worker_id() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+class ShardedConsumerGroup:
+    """
+    Runs a StreamConsumer for consumer group `group` on every shard of `base` this worker owns.
+    `consumer_kwargs` (handler, count, block_ms, ...) are passed to each StreamConsumer.
+    Unsharded (N = 1) it runs a single consumer named `consumer` on `base`, as before.
+    """
+
+    def __init__(self, base: str, group: str, consumer: str, shards: Optional[int] = None,
+                 redis_factory: Optional[Callable] = None, heartbeat: Optional[float] = None,
+                 lease_ttl: Optional[float] = None, worker: Optional[str] = None, **consumer_kwargs):
+        self.base = base
+        self.group = group
+        self.consumer = consumer
+        self.consumer_kwargs = consumer_kwargs
+        self.shards = shards if shards is not None else settings.CANONICAL_STREAM_SHARDS
+        self.redis_factory = redis_factory
+        self.heartbeat = heartbeat if heartbeat is not None else settings.SHARD_HEARTBEAT_SECONDS
+        self.lease_ttl_ms = int(1000 * (lease_ttl if lease_ttl is not None else settings.SHARD_LEASE_SECONDS))
+        self.worker = worker or worker_id()
+        self.members_key = f"{base}:{group}:workers"
+        self._running: Dict[int, tuple] = {}  # shard -> (StreamConsumer, task)
+        self._single: Optional[StreamConsumer] = None
+        self._stopping = asyncio.Event()
+
+    def _lease_key(self, shard: int) -> str:
+        return f"{self.base}:{self.group}:lease:{shard}"
+
+    async def _connect(self) -> aioredis.Redis:
+        if self.redis_factory is not None:
+            return await self.redis_factory()
+        return await aioredis.from_url(settings.REDIS_URL, decode_responses=True)
+
+    async def run(self):
+        if self.shards <= 1:
+            self._single = StreamConsumer(self.base, self.group, self.consumer,
+                                          redis_factory=self.redis_factory, **self.consumer_kwargs)
+            if self._stopping.is_set():
+                return
+            await self._single.run()
+            return
+        r = await self._connect()
+        logger.info(f"[{self.group}] worker {self.worker} joining {self.shards} shards of {self.base}")
+        try:
+            while not self._stopping.is_set():
+                try:
+                    await self.rebalance(r)
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    logger.exception(f"[{self.group}] Shard rebalance failed: {e}")
+                try:
+                    await asyncio.wait_for(self._stopping.wait(), timeout=self.heartbeat)
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            await self.shutdown(r)
+
+    def stop(self):
+        """Stop reading; owned shards finish their batch in hand and release their leases."""
+        self._stopping.set()
+        if self._single is not None:
+            self._single.stop()
+
+    async def members(self, r: aioredis.Redis) -> List[str]:
+        now_ms = int(time.time() * 1000)
+        await r.zadd(self.members_key, {self.worker: now_ms})
+        await r.zremrangebyscore(self.members_key, "-inf", now_ms - self.lease_ttl_ms)
+        return list(await r.zrange(self.members_key, 0, -1))
+
+    async def rebalance(self, r: aioredis.Redis):
+        workers = await self.members(r)
+        wanted = assign_shards(workers, self.shards).get(self.worker, set())
+
+        # renew every lease we keep before stopping anything: a stop waits for an in-flight batch
+        stops = [(shard, "reassigned", True) for shard in sorted(set(self._running) - wanted)]
+        for shard in sorted(wanted & set(self._running)):
+            if not await r.eval(_RENEW, 1, self._lease_key(shard), self.worker, self.lease_ttl_ms):
+                # we stalled past the TTL and someone else may own it now: stop reading immediately
+                stops.append((shard, "lease lost", False))
+            elif self._running[shard][1].done():
+                stops.append((shard, "consumer exited", True))
+        await self._stop_many(r, stops)
+        for shard in sorted(wanted - set(self._running)):
+            # NX: the previous owner still holds it until it has drained and released
+            if await r.set(self._lease_key(shard), self.worker, nx=True, px=self.lease_ttl_ms):
+                self._start(shard)
+        STREAM_OWNED_SHARDS.labels(consumer_group=self.group).set(len(self._running))
+
+    def _start(self, shard: int):
+        stream = shard_stream(self.base, shard, self.shards)
+        consumer = StreamConsumer(
+            stream, self.group, f"{self.consumer}@{self.worker}",
+            redis_factory=self.redis_factory,
+            claim_on_start=True,  # drain what the previous owner left pending before new entries
+            metrics_label=f"{self.group}:{shard}",
+            **self.consumer_kwargs,
+        )
+        task = asyncio.get_running_loop().create_task(consumer.run())
+        self._running[shard] = (consumer, task)
+        logger.info(f"[{self.group}] {self.worker} now owns {stream}")
+
+    async def _stop(self, r: aioredis.Redis, shard: int, reason: str, release: bool = True):
+        consumer, task = self._running.pop(shard)
+        consumer.stop()
+        if not release:
+            task.cancel()
+        try:
+            # let the in-flight batch finish and ack, but well inside the TTL of the leases we keep;
+            # a batch cut short stays pending and the next owner claims it first
+            await asyncio.wait_for(asyncio.gather(task, return_exceptions=True), timeout=self.lease_ttl_ms / 3000)
+        except asyncio.TimeoutError:
+            pass  # wait_for cancelled it
+        if release:
+            await r.eval(_RELEASE, 1, self._lease_key(shard), self.worker)
+        logger.info(f"[{self.group}] {self.worker} released {shard_stream(self.base, shard, self.shards)} ({reason})")
+
+    async def _stop_many(self, r: aioredis.Redis, stops: List[tuple]):
+        """Stop (shard, reason, release) concurrently, so n stops cost one drain wait, not n."""
+        results = await asyncio.gather(*(self._stop(r, shard, reason, release) for shard, reason, release in stops),
+                                       return_exceptions=True)
+        for (shard, _reason, _release), result in zip(stops, results):
+            if isinstance(result, Exception):
+                logger.warning(f"[{self.group}] Unable to stop shard {shard} cleanly: {result}")
+
+    async def shutdown(self, r: aioredis.Redis):
+        await self._stop_many(r, [(shard, "shutdown", True) for shard in sorted(self._running)])
+        try:
+            await r.zrem(self.members_key, self.worker)
+        except Exception as e:
+            logger.warning(f"[{self.group}] Unable to leave worker set: {e}")
+        STREAM_OWNED_SHARDS.labels(consumer_group=self.group).set(0)
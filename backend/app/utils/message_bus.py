@@ -1,6 +1,6 @@
 # app/utils/message_bus.py
 import threading
-import json
+from app.utils.serialization import loads, dumps
 from app.utils.redis_client import get_redis
 
 class MessageBus:
@@ -12,7 +12,7 @@ class MessageBus:
 
     def publish(self, payload: dict):
         r = get_redis()
-        r.publish(self.CHANNEL, json.dumps(payload))
+        r.publish(self.CHANNEL, dumps(payload))
 
     def subscribe(self, callback):
         r = get_redis()
@@ -23,7 +23,7 @@ class MessageBus:
             for msg in pubsub.listen():
                 data = msg["data"]
                 try:
-                    payload = json.loads(data)
+                    payload = loads(data)
                 except Exception:
                     payload = {"raw": data}
                 callback(payload)
@@ -0,0 +1,104 @@
+# app/utils/serialization.py
+"""
+Pluggable JSON codec for the ingest and fan-out hot paths.
+
+Uses orjson or msgspec when installed and falls back to the stdlib `json` module.
+Force a backend with JSON_BACKEND=orjson|msgspec|json (default: auto).
+
+All backends emit compact separators, UTF-8 text, non-string dict keys coerced
+to strings and datetimes as ISO-8601 strings. The datetime spelling is not
+byte-identical: msgspec encodes datetimes natively (its enc_hook is never
+called for them) and writes a UTC offset as `Z`, where orjson and json write
+`+00:00`. Both forms parse with `datetime.fromisoformat` and JavaScript `Date`;
+callers that need identical bytes pre-format timestamps (as CanonicalRecord
+does with `timestamp_iso`).
+"""
+import json
+import os
+from datetime import date, datetime
+from typing import Any, Callable
+
+# Every backend raises a ValueError subclass on malformed input
+# (json.JSONDecodeError and orjson.JSONDecodeError already are).
+JSONDecodeError = ValueError
+
+
+def _default(obj: Any):
+    if isinstance(obj, (datetime, date)):
+        return obj.isoformat()
+    if isinstance(obj, (set, frozenset, tuple)):
+        return list(obj)
+    if hasattr(obj, "model_dump"):
+        return obj.model_dump(mode="json")
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+def _stdlib_codec() -> tuple[Callable[[Any], bytes], Callable[[Any], Any]]:
+    encoder = json.JSONEncoder(separators=(",", ":"), ensure_ascii=False, default=_default)
+
+    def _dumps(obj: Any) -> bytes:
+        return encoder.encode(obj).encode("utf-8")
+
+    return _dumps, json.loads
+
+
+def _orjson_codec():
+    import orjson
+
+    option = orjson.OPT_NON_STR_KEYS
+
+    def _dumps(obj: Any) -> bytes:
+        return orjson.dumps(obj, default=_default, option=option)
+
+    return _dumps, orjson.loads
+
+
+def _msgspec_codec():
+    import msgspec
+
+    encoder = msgspec.json.Encoder(enc_hook=_default)
+    decoder = msgspec.json.Decoder()
+
+    def _loads(data):
+        try:
+            return decoder.decode(data.encode("utf-8") if isinstance(data, str) else data)
+        except msgspec.DecodeError as e:
+            raise JSONDecodeError(str(e)) from e
+
+    return encoder.encode, _loads
+
+
+_CODECS = {
+    "orjson": _orjson_codec,
+    "msgspec": _msgspec_codec,
+    "json": _stdlib_codec,
+}
+
+
+def _select_backend(name: str):
+    if name != "auto":
+        return name, _CODECS[name]()
+    for candidate in ("orjson", "msgspec"):
+        try:
+            return candidate, _CODECS[candidate]()
+        except ImportError:
+            continue
+    return "json", _stdlib_codec()
+
+
+BACKEND, (_dumps_bytes, _loads) = _select_backend(os.getenv("JSON_BACKEND", "auto").lower())
+
+
+def loads(data: str | bytes | bytearray) -> Any:
+    """Decode a JSON document (str or bytes)."""
+    return _loads(data)
+
+
+def dumps_bytes(obj: Any) -> bytes:
+    """Encode to compact UTF-8 JSON bytes (cheapest for Redis and binary sinks)."""
+    return _dumps_bytes(obj)
+
+
+def dumps(obj: Any) -> str:
+    """Encode to compact JSON text (for WebSocket send_text and text columns)."""
+    return _dumps_bytes(obj).decode("utf-8")
@@ -0,0 +1,312 @@
+# app/utils/stream_consumer.py
+"""
+Shared Redis Streams consumer-group loop.
+
+    XREADGROUP ">"  -> handler -> one XACK for every entry handled
+    every claim_interval:
+        XAUTOCLAIM entries idle > claim_idle_ms (crashed consumers, failed handlers)
+        -> retried through the same handler, or moved to `<stream>:dlq` once they have
+           been delivered more than max_deliveries times
+        -> PEL size / group lag gauges refreshed
+
+Handlers either take one decoded payload (`handler`) or a whole read batch
+(`batch_handler(payloads, ids) -> ids to ack`). An entry that raises is left pending and
+comes back through XAUTOCLAIM; undecodable entries go to the dead-letter stream at once.
+`on_start(r, stream)` runs once before the first read, e.g. to rebuild in-memory state.
+With concurrency > 1 a per-event handler works through up to that many matches of a batch
+at once; events of one match are still handled in stream order.
+"""
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+import aioredis
+
+from app.metrics import (
+    STREAM_LAG_MS, STREAM_LAG_ENTRIES, STREAM_PENDING_ENTRIES,
+    STREAM_CLAIMED_TOTAL, STREAM_DEAD_LETTERED_TOTAL
+)
+from app.settings import settings
+from app.utils.serialization import loads
+
+logger = logging.getLogger("stream_consumer")
+
+Entry = Tuple[str, Optional[Dict[str, Any]]]
+Handler = Callable[[Any], Awaitable[Any]]
+BatchHandler = Callable[[List[Any], List[str]], Awaitable[List[str]]]
+StartHook = Callable[[aioredis.Redis, str], Awaitable[Any]]
+
+
+class AdaptiveReadSize:
+    """
+    XREADGROUP `count`/`block` tuned from observed stream lag (age of the newest entry read).
+    Falling behind doubles the batch and shortens the block; once caught up with small
+    batches it halves the batch and blocks longer so idle consumers don't spin.
+    """
+
+    def __init__(self, min_count: int, max_count: int, min_block_ms: int, max_block_ms: int,
+                 high_lag_ms: float, low_lag_ms: float):
+        self.min_count = min_count
+        self.max_count = max_count
+        self.min_block_ms = min_block_ms
+        self.max_block_ms = max_block_ms
+        self.high_lag_ms = high_lag_ms
+        self.low_lag_ms = low_lag_ms
+        self.count = min_count
+        self.block_ms = max_block_ms
+
+    def update(self, lag_ms: float, n_read: int):
+        if lag_ms > self.high_lag_ms or n_read >= self.count:
+            self.count = min(self.max_count, self.count * 2)
+            self.block_ms = self.min_block_ms
+        elif lag_ms < self.low_lag_ms and n_read < self.count // 2:
+            self.count = max(self.min_count, self.count // 2)
+            self.block_ms = self.max_block_ms
+
+
+def entry_lag_ms(message_id: str) -> float:
+    """Age of a stream entry from its id (`<ms>-<seq>`)."""
+    return max(0.0, time.time() * 1000 - int(message_id.split("-", 1)[0]))
+
+
+def _id_key(message_id: str) -> Tuple[int, int]:
+    """Stream id `<ms>-<seq>` -> (ms, seq); ids order numerically, not as strings."""
+    ms, _, seq = message_id.partition("-")
+    return int(ms), int(seq or 0)
+
+
+def _fields(raw) -> Optional[Dict[str, Any]]:
+    if raw is None or isinstance(raw, dict):
+        return raw
+    return dict(zip(raw[::2], raw[1::2]))
+
+
+def _parse_autoclaim(resp) -> Tuple[str, List[Entry]]:
+    """XAUTOCLAIM reply (raw or client-parsed) -> (next start id, [(id, fields or None)])."""
+    next_id, claimed = resp[0], resp[1]
+    return next_id, [(entry[0], _fields(entry[1])) for entry in claimed]
+
+
+class StreamConsumer:
+    def __init__(self, stream: str, group: str, consumer: str,
+                 handler: Optional[Handler] = None,
+                 batch_handler: Optional[BatchHandler] = None,
+                 redis_factory: Optional[Callable[[], Awaitable[aioredis.Redis]]] = None,
+                 count: int = 10, block_ms: int = 1000,
+                 sizing: Optional[AdaptiveReadSize] = None,
+                 claim_idle_ms: Optional[int] = None,
+                 claim_interval: Optional[float] = None,
+                 max_deliveries: Optional[int] = None,
+                 dlq_stream: Optional[str] = None,
+                 start_id: str = "$",
+                 claim_on_start: bool = False,
+                 metrics_label: Optional[str] = None,
+                 on_start: Optional[StartHook] = None,
+                 concurrency: int = 1):
+        if (handler is None) == (batch_handler is None):
+            raise ValueError("pass exactly one of handler / batch_handler")
+        self.stream = stream
+        self.group = group
+        self.consumer = consumer
+        self.handler = handler
+        self.batch_handler = batch_handler
+        self.redis_factory = redis_factory
+        self.count = count
+        self.block_ms = block_ms
+        self.sizing = sizing
+        self.claim_idle_ms = claim_idle_ms if claim_idle_ms is not None else settings.STREAM_CLAIM_IDLE_MS
+        self.claim_interval = claim_interval if claim_interval is not None else settings.STREAM_CLAIM_INTERVAL
+        self.max_deliveries = max_deliveries if max_deliveries is not None else settings.STREAM_MAX_DELIVERIES
+        self.dlq_stream = dlq_stream or f"{stream}:dlq"
+        self.start_id = start_id
+        # exclusive owners (sharded streams) take over everything pending at start, in id order,
+        # before reading new entries; competing consumers must wait for claim_idle_ms instead
+        self.claim_on_start = claim_on_start
+        self._stopping = False
+        self._errors: "OrderedDict[str, str]" = OrderedDict()  # last handler error per pending id
+        self.metrics_label = metrics_label or group  # shards of one group report separately
+        self.on_start = on_start
+        self.concurrency = max(1, concurrency)
+        self._lag_ms = STREAM_LAG_MS.labels(consumer_group=self.metrics_label)
+
+    async def _connect(self) -> aioredis.Redis:
+        if self.redis_factory is not None:
+            return await self.redis_factory()
+        return await aioredis.from_url(settings.REDIS_URL, decode_responses=True)
+
+    async def ensure_group(self, r: aioredis.Redis):
+        try:
+            await r.xgroup_create(self.stream, self.group, id=self.start_id, mkstream=True)
+        except Exception:
+            pass  # group already exists
+
+    async def run(self):
+        r = await self._connect()
+        await self.ensure_group(r)
+        if self.on_start is not None:
+            await self.on_start(r, self.stream)
+        logger.info(f"Starting consumer {self.consumer} on {self.stream} (group {self.group})")
+        loop = asyncio.get_running_loop()
+        next_claim = 0.0
+        first_sweep = self.claim_on_start
+        while not self._stopping:
+            try:
+                if loop.time() >= next_claim:
+                    await self.recover_pending(r, min_idle_ms=0 if first_sweep else None)
+                    first_sweep = False
+                    await self.report(r)
+                    next_claim = loop.time() + self.claim_interval
+                await self.poll(r)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.exception(f"[{self.group}] Error in consumer loop: {e}")
+                await asyncio.sleep(1)
+
+    def stop(self):
+        """Finish the batch in hand, then return from `run()`."""
+        self._stopping = True
+
+    async def poll(self, r: aioredis.Redis) -> int:
+        """Read and handle one batch of new entries; returns how many were read."""
+        count, block = (self.sizing.count, self.sizing.block_ms) if self.sizing else (self.count, self.block_ms)
+        msgs = await r.xreadgroup(self.group, self.consumer, streams={self.stream: ">"}, count=count, block=block)
+        entries = [(mid, data) for _stream, stream_entries in (msgs or []) for mid, data in stream_entries]
+        lag_ms = entry_lag_ms(entries[-1][0]) if entries else 0.0
+        self._lag_ms.set(lag_ms)
+        if self.sizing:
+            self.sizing.update(lag_ms, len(entries))
+        if entries:
+            await self.process(r, entries)
+        return len(entries)
+
+    async def process(self, r: aioredis.Redis, entries: List[Entry]):
+        acked, ids, payloads, poison = [], [], [], []
+        for message_id, data in entries:
+            if data is None:
+                # entry was trimmed/deleted while pending; nothing left to process
+                acked.append(message_id)
+                continue
+            try:
+                payloads.append(loads(data.get("data", "{}")))
+                ids.append(message_id)
+            except Exception as e:
+                self._remember_error(message_id, f"undecodable: {e!r}")
+                poison.append((message_id, data))
+        if poison:
+            await self.dead_letter(r, poison)
+        if ids:
+            if self.batch_handler is not None:
+                acked.extend(await self.batch_handler(payloads, ids))
+            else:
+                acked.extend(await self._handle_each(payloads, ids))
+        if acked:
+            await r.xack(self.stream, self.group, *acked)
+            for message_id in acked:
+                self._errors.pop(message_id, None)
+
+    async def _handle_each(self, payloads: List[Any], ids: List[str]) -> List[str]:
+        acked: List[str] = []
+        if self.concurrency == 1:
+            await self._handle_lane(list(zip(ids, payloads)), acked)
+            return acked
+        # one lane per match keeps per-match order; lanes run concurrency at a time
+        lanes: Dict[Any, List[Tuple[str, Any]]] = {}
+        for message_id, payload in zip(ids, payloads):
+            key = payload.get("match_id") if isinstance(payload, dict) else None
+            lanes.setdefault(key, []).append((message_id, payload))
+        limit = asyncio.Semaphore(self.concurrency)
+
+        async def run_lane(lane):
+            async with limit:
+                await self._handle_lane(lane, acked)
+
+        await asyncio.gather(*(run_lane(lane) for lane in lanes.values()))
+        return acked
+
+    async def _handle_lane(self, lane: List[Tuple[str, Any]], acked: List[str]):
+        for message_id, payload in lane:
+            try:
+                await self.handler(payload)
+                acked.append(message_id)
+            except Exception as e:
+                # left pending; XAUTOCLAIM retries it after claim_idle_ms
+                self._remember_error(message_id, repr(e))
+                logger.exception(f"[{self.group}] Failed to process entry {message_id}: {e}")
+
+    def _remember_error(self, message_id: str, error: str):
+        self._errors[message_id] = error[:500]
+        self._errors.move_to_end(message_id)
+        while len(self._errors) > 1_000:
+            self._errors.popitem(last=False)
+
+    async def recover_pending(self, r: aioredis.Redis, min_idle_ms: Optional[int] = None):
+        """Claim entries idle longer than claim_idle_ms; retry them or dead-letter poison ones."""
+        start = "0-0"
+        idle = self.claim_idle_ms if min_idle_ms is None else min_idle_ms
+        for _ in range(settings.STREAM_CLAIM_MAX_PAGES):
+            resp = await r.execute_command(
+                "XAUTOCLAIM", self.stream, self.group, self.consumer,
+                idle, start, "COUNT", settings.STREAM_CLAIM_COUNT,
+            )
+            start, claimed = _parse_autoclaim(resp)
+            if claimed:
+                STREAM_CLAIMED_TOTAL.labels(consumer_group=self.metrics_label).inc(len(claimed))
+                deliveries = await self._deliveries(r, [mid for mid, _ in claimed])
+                poison = [(mid, data) for mid, data in claimed if deliveries.get(mid, 0) > self.max_deliveries]
+                retry = [(mid, data) for mid, data in claimed if deliveries.get(mid, 0) <= self.max_deliveries]
+                if poison:
+                    await self.dead_letter(r, poison, deliveries)
+                if retry:
+                    logger.info(f"[{self.group}] Retrying {len(retry)} stale pending entries")
+                    await self.process(r, retry)
+            if start in ("0-0", "0"):
+                return
+
+    async def _deliveries(self, r: aioredis.Redis, ids: List[str]) -> Dict[str, int]:
+        """Delivery count per claimed id, paging this consumer's PEL over the ids' numeric range."""
+        wanted = set(ids)
+        found: Dict[str, int] = {}
+        start, end = min(ids, key=_id_key), max(ids, key=_id_key)
+        page_size = max(len(ids), 100)
+        while len(found) < len(wanted):
+            pending = await r.xpending_range(self.stream, self.group, min=start, max=end, count=page_size,
+                                             consumername=self.consumer)
+            for p in pending:
+                if p["message_id"] in wanted:
+                    found[p["message_id"]] = p["times_delivered"]
+            if len(pending) < page_size:
+                break
+            ms, seq = _id_key(pending[-1]["message_id"])
+            start = f"{ms}-{seq + 1}"
+        return found
+
+    async def dead_letter(self, r: aioredis.Redis, entries: List[Entry], deliveries: Optional[Dict[str, int]] = None):
+        """Copy poison entries to the DLQ stream (with why and where from), then ack them."""
+        pipe = r.pipeline(transaction=False)
+        for message_id, data in entries:
+            pipe.xadd(self.dlq_stream, {
+                "data": (data or {}).get("data", ""),
+                "stream": self.stream,
+                "group": self.group,
+                "message_id": message_id,
+                "deliveries": (deliveries or {}).get(message_id, 1),
+                "error": self._errors.pop(message_id, "unknown"),
+            })
+        await pipe.execute()
+        await r.xack(self.stream, self.group, *[mid for mid, _ in entries])
+        STREAM_DEAD_LETTERED_TOTAL.labels(consumer_group=self.metrics_label).inc(len(entries))
+        logger.warning(f"[{self.group}] Moved {len(entries)} entries to {self.dlq_stream}")
+
+    async def report(self, r: aioredis.Redis):
+        """Refresh PEL size and (Redis 7+) entries-behind lag for this group."""
+        try:
+            summary = await r.xpending(self.stream, self.group)
+            STREAM_PENDING_ENTRIES.labels(consumer_group=self.metrics_label).set(summary.get("pending", 0) or 0)
+            for info in await r.xinfo_groups(self.stream):
+                if info.get("name") == self.group and info.get("lag") is not None:
+                    STREAM_LAG_ENTRIES.labels(consumer_group=self.metrics_label).set(info["lag"])
+        except Exception as e:
+            logger.warning(f"[{self.group}] Unable to read PEL/lag stats: {e}")
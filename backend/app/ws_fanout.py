@@ -0,0 +1,175 @@
+# app/ws_fanout.py
+"""
+WebSocket fan-out with one bounded outbound queue and one writer task per client.
+
+Publishing never awaits a socket: `FanoutHub.publish` encodes once and offers the frame
+to every subscriber's queue, so one slow viewer cannot stall the others.
+
+- coalescing: a frame published with a `key` replaces that key's frame if it is still
+  queued for a client (latest state wins, queue does not grow); the new frame goes to the
+  tail, so it never overtakes frames published before it;
+- overflow: when a client's queue is full it is either disconnected ("disconnect", the
+  client reconnects and gets the replay) or loses its oldest queued frame ("drop_oldest");
+- replay: the last `replay_size` frames are kept in a ring buffer and queued for every
+  new subscriber before live traffic.
+
+Frames are `str` (sent as text) or `bytes` (sent as binary). Publishing a `Payload`
+(app/ws_protocol.py) instead encodes it once per wire format in use and gives each client
+the frame for the codec it negotiated.
+"""
+import asyncio
+import itertools
+import logging
+from collections import OrderedDict, deque
+from typing import Hashable, Iterable, Optional, Set, Union
+
+from fastapi import WebSocket
+
+from app.metrics import WS_FANOUT_DROPPED_TOTAL, WS_FANOUT_CLIENTS_DROPPED_TOTAL, WS_FANOUT_QUEUE_DEPTH
+from app.ws_protocol import JSON, Codec, Payload
+
+logger = logging.getLogger("ws_fanout")
+
+Frame = Union[str, bytes]
+Message = Union[Frame, Payload]
+
+DISCONNECT, DROP_OLDEST = "disconnect", "drop_oldest"
+
+
+class Subscriber:
+    """One connected client: bounded queue of pending frames drained by `writer()`."""
+
+    def __init__(self, ws: WebSocket, hub: "FanoutHub", maxsize: int, overflow: str, codec: Codec = JSON):
+        self.ws = ws
+        self.codec = codec
+        self.hub = hub
+        self.maxsize = maxsize
+        self.overflow = overflow
+        self.closed = False
+        self._queue: "OrderedDict[Hashable, Frame]" = OrderedDict()
+        self._ready = asyncio.Event()
+        self._seq = itertools.count()
+        self.task: Optional[asyncio.Task] = None
+
+    def __len__(self) -> int:
+        return len(self._queue)
+
+    def offer(self, frame: Message, key: Optional[Hashable] = None) -> bool:
+        """Queue a frame without blocking; returns False if it (or the client) was dropped."""
+        if self.closed:
+            return False
+        if isinstance(frame, Payload):
+            frame = frame.encode(self.codec)
+        if key is not None and key in self._queue:
+            # coalesce at the tail: the old frame's slot would put this one ahead of frames
+            # published after that one (e.g. a position before the KILL that preceded it)
+            del self._queue[key]
+            self._queue[key] = frame
+            WS_FANOUT_DROPPED_TOTAL.labels(hub=self.hub.name, reason="coalesced").inc()
+            return True
+        if len(self._queue) >= self.maxsize:
+            if self.overflow == DROP_OLDEST:
+                self._queue.popitem(last=False)
+                WS_FANOUT_DROPPED_TOTAL.labels(hub=self.hub.name, reason="overflow").inc()
+            else:
+                WS_FANOUT_CLIENTS_DROPPED_TOTAL.labels(hub=self.hub.name, reason="slow").inc()
+                logger.info(f"[{self.hub.name}] Disconnecting slow client ({len(self._queue)} frames queued)")
+                self.close(code=1013, reason="client too slow")
+                return False
+        self._queue[key if key is not None else ("_", next(self._seq))] = frame
+        self._ready.set()
+        return True
+
+    async def writer(self):
+        try:
+            while not self.closed:
+                if not self._queue:
+                    self._ready.clear()
+                    await self._ready.wait()
+                    continue
+                _key, frame = self._queue.popitem(last=False)
+                if isinstance(frame, bytes):
+                    await self.ws.send_bytes(frame)
+                else:
+                    await self.ws.send_text(frame)
+        except asyncio.CancelledError:
+            pass
+        except Exception as e:
+            WS_FANOUT_CLIENTS_DROPPED_TOTAL.labels(hub=self.hub.name, reason="send_error").inc()
+            logger.debug(f"[{self.hub.name}] Send failed, dropping client: {e}")
+        finally:
+            self.closed = True
+            self._queue.clear()
+            self.hub.unsubscribe(self)
+
+    def stop(self):
+        """Stop the writer; queued frames are discarded."""
+        self.closed = True
+        self._ready.set()
+        if self.task is not None and self.task is not asyncio.current_task() and not self.task.done():
+            self.task.cancel()
+
+    def close(self, code: int = 1000, reason: str = ""):
+        """Stop the writer and close the socket (safe to call more than once)."""
+        if self.closed:
+            return
+        self.stop()
+        asyncio.get_running_loop().create_task(self._close_ws(code, reason))
+
+    async def _close_ws(self, code: int, reason: str):
+        try:
+            await self.ws.close(code=code, reason=reason)
+        except Exception:
+            pass
+
+
+class FanoutHub:
+    def __init__(self, name: str, queue_size: int = 256, overflow: str = DISCONNECT, replay_size: int = 0):
+        self.name = name
+        self.queue_size = queue_size
+        self.overflow = overflow
+        self.subscribers: Set[Subscriber] = set()
+        self._ring: deque = deque(maxlen=replay_size)
+        WS_FANOUT_QUEUE_DEPTH.labels(hub=name, stat="max").set_function(
+            lambda: max((len(s) for s in list(self.subscribers)), default=0)
+        )
+        WS_FANOUT_QUEUE_DEPTH.labels(hub=name, stat="total").set_function(
+            lambda: sum(len(s) for s in list(self.subscribers))
+        )
+
+    def remember(self, frame: Message, key: Optional[Hashable] = None):
+        """Add a frame to the replay ring without sending it (e.g. history loaded at start)."""
+        if self._ring.maxlen:
+            self._ring.append((frame, key))
+
+    def subscribe(self, ws: WebSocket, replay: bool = True, codec: Codec = JSON) -> Subscriber:
+        """Register an accepted socket, queue the replay, and start its writer task."""
+        sub = Subscriber(ws, self, max(self.queue_size, len(self._ring)), self.overflow, codec)
+        if replay:
+            for frame, key in self._ring:
+                sub.offer(frame, key)
+        self.subscribers.add(sub)
+        sub.task = asyncio.get_running_loop().create_task(sub.writer())
+        return sub
+
+    def unsubscribe(self, sub: Subscriber):
+        self.subscribers.discard(sub)
+        sub.stop()
+
+    def publish(self, frame: Message, key: Optional[Hashable] = None, replay: bool = True) -> int:
+        """Offer one encoded frame to every subscriber; returns how many accepted it."""
+        if replay:
+            self.remember(frame, key)
+        return sum(sub.offer(frame, key) for sub in list(self.subscribers))
+
+    def publish_to(self, subs: Iterable[Subscriber], frame: Message, key: Optional[Hashable] = None) -> int:
+        """Offer a frame to some subscribers only (e.g. those filtered to one match)."""
+        return sum(sub.offer(frame, key) for sub in subs)
+
+    async def close(self):
+        subs = list(self.subscribers)
+        for sub in subs:
+            sub.close(code=1001, reason="server shutdown")
+        tasks = [s.task for s in subs if s.task is not None]
+        if tasks:
+            await asyncio.gather(*tasks, return_exceptions=True)
@@ -1,36 +1,125 @@
 # app/ws_insights.py
+"""
+/ws/insights fan-out.
+
+One reader task per process tails `events:insights` (XREAD on the shared Redis pool) and
+hands each entry to a FanoutHub: every client has its own bounded queue and writer task,
+repeated updates of one insight are coalesced, clients that fall a full queue behind are
+handled per WS_OVERFLOW_POLICY, and new clients first get the last INSIGHTS_REPLAY_SIZE insights.
+Each entry is decoded once and re-encoded at most once per negotiated wire format.
+"""
 from fastapi import WebSocket, WebSocketDisconnect
 import asyncio
 import aioredis
-import json
+from app.utils.serialization import loads
+from app import ws_protocol
+from app.consumer_runtime import shared_redis
+from app.metrics import WEBSOCKET_CONNECTIONS
 from app.settings import settings
-from typing import Set, Optional
+from app.ws_fanout import FanoutHub
+from app.ws_protocol import Payload
+from typing import Optional, Tuple
 import logging
 
 logger = logging.getLogger("ws_insights")
 
-clients: Set[WebSocket] = set()
-redis_client: Optional[aioredis.Redis] = None
+INSIGHTS_STREAM = "events:insights"
+_PING = {"type": "ping"}
 
 
-async def init_redis():
-    """Initialize Redis client."""
-    global redis_client
-    if redis_client is None:
-        try:
-            redis_client = await aioredis.from_url(settings.REDIS_URL, decode_responses=True)
-        except Exception as e:
-            logger.error(f"Failed to connect to Redis: {e}", exc_info=True)
-            raise
-    return redis_client
+async def init_redis() -> aioredis.Redis:
+    """Redis client on the process-wide pool shared with the stream consumers."""
+    try:
+        return await shared_redis()
+    except Exception as e:
+        logger.error(f"Failed to connect to Redis: {e}", exc_info=True)
+        raise
+
+
+def _insight_id(msg) -> Optional[str]:
+    """Coalescing key: the insight id, so a client that is behind only gets its latest version."""
+    if not isinstance(msg, dict):
+        return None
+    data = msg.get("data")
+    return (data.get("id") if isinstance(data, dict) else None) or msg.get("id")
+
+
+def _insight_entry(text: str) -> Tuple[Payload, Optional[str]]:
+    """Stream entry -> (payload parsed once, coalescing key)."""
+    try:
+        msg = loads(text)
+    except Exception:
+        return Payload(obj=text, text=text), None
+    return Payload(obj=msg, text=text), _insight_id(msg)
+
+
+class InsightsHub:
+    def __init__(self, stream: str = INSIGHTS_STREAM):
+        self.stream = stream
+        self.fanout = FanoutHub(
+            "insights",
+            queue_size=settings.WS_CLIENT_QUEUE_SIZE,
+            overflow=settings.WS_OVERFLOW_POLICY,
+            replay_size=settings.INSIGHTS_REPLAY_SIZE,
+        )
+        self._task: Optional[asyncio.Task] = None
+
+    def ensure_started(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def _run(self):
+        last_id = None
+        while True:
+            try:
+                r = await init_redis()
+                if last_id is None:
+                    last_id = await self._load_history(r)
+                # smaller than a client queue, so one read burst cannot overflow a healthy client
+                count = max(1, min(100, self.fanout.queue_size // 2))
+                msgs = await r.xread({self.stream: last_id}, block=2000, count=count)
+                if not msgs:
+                    # keepalive; coalesced so an idle client never queues more than one
+                    self.fanout.publish(Payload(obj=_PING), key="ping", replay=False)
+                    continue
+                for _stream, entries in msgs:
+                    for msg_id, data in entries:
+                        last_id = msg_id
+                        payload = data.get("data")
+                        if payload:
+                            self.fanout.publish(*_insight_entry(payload))
+                            await asyncio.sleep(0)  # let client writers drain between entries
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Error reading {self.stream}: {e}", exc_info=True)
+                await asyncio.sleep(1)
+
+    async def _load_history(self, r: aioredis.Redis) -> str:
+        """Seed the replay ring from the stream tail; returns the id to tail from."""
+        size = settings.INSIGHTS_REPLAY_SIZE
+        entries = await r.xrevrange(self.stream, count=size) if size else []
+        for _msg_id, data in reversed(entries):
+            payload = data.get("data")
+            if payload:
+                self.fanout.remember(*_insight_entry(payload))
+        return entries[0][0] if entries else "$"
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        await self.fanout.close()
+
+
+hub = InsightsHub()
 
 
 async def insights_ws(ws: WebSocket):
     """WebSocket endpoint for insights streaming."""
     try:
-        await ws.accept()
-        clients.add(ws)
-        logger.info(f"Insights WebSocket client connected. Total clients: {len(clients)}")
+        codec = await ws_protocol.accept(ws)
     except Exception as e:
         logger.error(f"Error accepting insights WebSocket connection: {e}", exc_info=True)
         try:
@@ -38,102 +127,39 @@ async def insights_ws(ws: WebSocket):
         except Exception:
             pass
         return
-    
+
+    hub.ensure_started()
     try:
-        # Send recent insights snapshot (optional)
-        # Listen to stream (blocking) and forward entries
-        try:
-            r = await init_redis()
-        except Exception as e:
-            logger.error(f"Failed to initialize Redis for insights WebSocket: {e}", exc_info=True)
-            try:
-                await ws.send_text(json.dumps({"type": "error", "message": "Failed to connect to data stream"}))
-            except Exception:
-                pass
-            return
-        
-        last_id = "$"  # Start from newest messages
-        
-        # Send initial connection message
-        try:
-            await ws.send_text(json.dumps({"type": "connected", "message": "Connected to insights stream"}))
-        except Exception as e:
-            logger.warning(f"Error sending initial connection message: {e}")
-        
-        while True:
-            try:
-                # Read from stream with timeout
-                msgs = await r.xread({"events:insights": last_id}, block=2000, count=5)
-                
-                if msgs:
-                    for stream, entries in msgs:
-                        for msg_id, data in entries:
-                            last_id = msg_id
-                            payload = data.get("data")
-                            if payload:
-                                try:
-                                    await ws.send_text(payload)
-                                except WebSocketDisconnect:
-                                    raise
-                                except Exception as e:
-                                    logger.warning(f"Error sending insight message: {e}")
-                                    raise
-                else:
-                    # Send keepalive ping
-                    try:
-                        await ws.send_text(json.dumps({"type": "ping"}))
-                    except WebSocketDisconnect:
-                        raise
-                    except Exception as e:
-                        logger.warning(f"Error sending keepalive: {e}")
-                    
-            except asyncio.TimeoutError:
-                # Send keepalive
-                try:
-                    await ws.send_text(json.dumps({"type": "ping"}))
-                except WebSocketDisconnect:
-                    raise
-                except Exception as e:
-                    logger.warning(f"Error sending keepalive after timeout: {e}")
-            except WebSocketDisconnect:
-                logger.info("Insights WebSocket client disconnected")
-                break
-            except Exception as e:
-                logger.error(f"Error in insights WebSocket loop: {e}", exc_info=True)
-                break
-                
+        hello = codec.encode(Payload(obj={"type": "connected", "message": "Connected to insights stream"}))
+        await (ws.send_bytes(hello) if isinstance(hello, bytes) else ws.send_text(hello))
     except Exception as e:
-        logger.error(f"WebSocket error: {e}", exc_info=True)
+        logger.warning(f"Error sending initial connection message: {e}")
+        return
+    # replay is queued ahead of live insights; the writer task owns sends from here on
+    sub = hub.fanout.subscribe(ws, codec=codec)
+    WEBSOCKET_CONNECTIONS.labels(endpoint="insights").inc()
+    logger.info(f"Insights WebSocket client connected. Total clients: {len(hub.fanout.subscribers)}")
+    try:
+        while not sub.closed:
+            # client messages are ignored; receiving is how a disconnect is noticed
+            await ws.receive_text()
+    except WebSocketDisconnect:
+        pass
+    except Exception as e:
+        logger.debug(f"Insights WebSocket receive ended: {e}")
     finally:
-        clients.discard(ws)
-        logger.info(f"Insights WebSocket client disconnected. Total clients: {len(clients)}")
+        hub.fanout.unsubscribe(sub)
+        WEBSOCKET_CONNECTIONS.labels(endpoint="insights").dec()
+        logger.info(f"Insights WebSocket client disconnected. Total clients: {len(hub.fanout.subscribers)}")
 
 
 async def broadcast_insight(insight_data: dict):
-    """Broadcast insight to all connected WebSocket clients."""
-    if not clients:
-        return
-    
+    """Broadcast an insight to all connected WebSocket clients of this process."""
     if not insight_data:
         logger.warning("Attempted to broadcast empty insight data")
         return
-    
+
     try:
-        payload = json.dumps(insight_data)
+        hub.fanout.publish(Payload(obj=insight_data), key=_insight_id(insight_data))
     except Exception as e:
         logger.error(f"Error serializing insight data for broadcast: {e}", exc_info=True)
-        return
-    
-    disconnected = []
-    
-    for client in list(clients):
-        try:
-            await client.send_text(payload)
-        except Exception as e:
-            logger.debug(f"Failed to send insight to client: {e}")
-            disconnected.append(client)
-    
-    # Remove disconnected clients
-    for client in disconnected:
-        clients.discard(client)
-
@@ -0,0 +1,187 @@
+# app/ws_protocol.py
+"""
+Wire formats for the live WebSocket feeds (/ws/replay, /ws/agents, /ws/insights).
+
+JSON text frames stay the default. A client opts into binary frames by offering the
+`esports.v1.msgpack` subprotocol (Sec-WebSocket-Protocol) or with `?format=msgpack`.
+Every binary frame starts with a 2-byte header:
+
+    uint8 version (= 1) | uint8 kind
+
+    kind 1  EVENT            MessagePack map (any event / control message)
+    kind 2  POSITION_DELTA   packed ticks, little endian:
+    kind 3  POSITION_KEYFRAME    uint8 len | match_id utf-8 | uint32 tick | float32 q |
+                                 uint16 n | n x (uint8 len | player_id utf-8 | 3 x int32)
+
+Position payloads are the quantized frames from app/position_deltas.py, so multiply the
+ints by q to get world units. Without msgpack installed, binary requests fall back to JSON.
+Client -> server messages (subscribe, keepalive) stay JSON text in either format.
+
+A message is wrapped once in `Payload` and encoded at most once per format, however
+many clients receive it.
+"""
+import logging
+import struct
+from datetime import date, datetime
+from typing import Any, Dict, Optional, Union
+
+from fastapi import WebSocket
+
+from app.utils.serialization import dumps, loads
+
+try:
+    import msgpack
+except ImportError:  # optional: JSON only
+    msgpack = None
+
+logger = logging.getLogger("ws_protocol")
+
+PROTOCOL_VERSION = 1
+KIND_EVENT, KIND_POSITION_DELTA, KIND_POSITION_KEYFRAME = 1, 2, 3
+_POSITION_KINDS = {"POSITION_DELTA": KIND_POSITION_DELTA, "POSITION_KEYFRAME": KIND_POSITION_KEYFRAME}
+
+_HEADER = struct.Struct("<BB")
+_TICK = struct.Struct("<IfH")  # tick, quantum, player count
+_COORDS = struct.Struct("<iii")
+
+Frame = Union[str, bytes]
+
+
+class Payload:
+    """A message to fan out: a dict and/or its JSON text, encoded lazily per codec."""
+    __slots__ = ("_obj", "_text", "_encoded")
+
+    def __init__(self, obj: Any = None, text: Optional[str] = None):
+        self._obj = obj
+        self._text = text
+        self._encoded: Dict[str, Frame] = {}
+
+    @property
+    def obj(self) -> Any:
+        if self._obj is None and self._text is not None:
+            self._obj = loads(self._text)
+        return self._obj
+
+    @property
+    def text(self) -> str:
+        if self._text is None:
+            self._text = dumps(self._obj)
+        return self._text
+
+    def encode(self, codec: "Codec") -> Frame:
+        frame = self._encoded.get(codec.name)
+        if frame is None:
+            frame = self._encoded[codec.name] = codec.encode(self)
+        return frame
+
+
+class Codec:
+    name = "json"
+    subprotocol: Optional[str] = None
+
+    def encode(self, payload: Payload) -> Frame:
+        return payload.text
+
+
+def _msgpack_default(obj: Any):
+    if isinstance(obj, (datetime, date)):
+        return obj.isoformat()
+    if isinstance(obj, (set, frozenset)):
+        return list(obj)
+    if hasattr(obj, "model_dump"):
+        return obj.model_dump(mode="json")
+    raise TypeError(f"Object of type {type(obj).__name__} is not MessagePack serializable")
+
+
+_prefixed: Dict[Any, bytes] = {}  # id -> length-prefixed utf-8 (match and player ids repeat every tick)
+
+
+def _short_utf8(value: Any) -> bytes:
+    out = _prefixed.get(value)
+    if out is None:
+        raw = str(value).encode("utf-8")[:255]
+        out = bytes((len(raw),)) + raw
+        if len(_prefixed) < 65536:
+            _prefixed[value] = out
+    return out
+
+
+def pack_positions(frame: dict) -> bytes:
+    """POSITION_DELTA / POSITION_KEYFRAME dict -> versioned struct frame."""
+    players = frame.get("p") or {}
+    parts = [
+        _HEADER.pack(PROTOCOL_VERSION, _POSITION_KINDS[frame["type"]]),
+        _short_utf8(frame.get("match_id") or ""),
+        _TICK.pack(frame.get("tick", 0) & 0xFFFFFFFF, float(frame.get("q", 1.0)), len(players)),
+    ]
+    pack = _COORDS.pack
+    for player_id, coords in players.items():
+        parts.append(_short_utf8(player_id))
+        parts.append(pack(*coords) if len(coords) == 3 else pack(*(list(coords) + [0, 0])[:3]))
+    return b"".join(parts)
+
+
+def unpack_frame(data: bytes) -> dict:
+    """Decode a binary frame (used by tests, benchmarks and Python clients)."""
+    version, kind = _HEADER.unpack_from(data, 0)
+    if version != PROTOCOL_VERSION:
+        raise ValueError(f"unsupported frame version {version}")
+    if kind == KIND_EVENT:
+        return msgpack.unpackb(data[_HEADER.size:], raw=False)
+    offset = _HEADER.size
+    n = data[offset]
+    match_id = data[offset + 1:offset + 1 + n].decode("utf-8")
+    offset += 1 + n
+    tick, quantum, count = _TICK.unpack_from(data, offset)
+    offset += _TICK.size
+    players = {}
+    for _ in range(count):
+        n = data[offset]
+        player_id = data[offset + 1:offset + 1 + n].decode("utf-8")
+        offset += 1 + n
+        players[player_id] = list(_COORDS.unpack_from(data, offset))
+        offset += _COORDS.size
+    kind_name = "POSITION_DELTA" if kind == KIND_POSITION_DELTA else "POSITION_KEYFRAME"
+    return {"type": kind_name, "match_id": match_id, "tick": tick, "q": round(quantum, 6), "p": players}
+
+
+class MsgpackCodec(Codec):
+    name = "msgpack"
+    subprotocol = "esports.v1.msgpack"
+
+    _event_header = _HEADER.pack(PROTOCOL_VERSION, KIND_EVENT)
+
+    def encode(self, payload: Payload) -> bytes:
+        obj = payload.obj
+        if isinstance(obj, dict) and obj.get("type") in _POSITION_KINDS:
+            return pack_positions(obj)
+        return self._event_header + msgpack.packb(obj, default=_msgpack_default, use_bin_type=True)
+
+
+JSON = Codec()
+MSGPACK = MsgpackCodec() if msgpack is not None else None
+JSON_SUBPROTOCOL = "esports.v1.json"
+
+
+def negotiate(ws: WebSocket) -> Codec:
+    """Pick the codec a connecting client asked for; JSON unless it offered msgpack."""
+    offered = list(ws.scope.get("subprotocols") or [])
+    wanted = ws.query_params.get("format")
+    if MsgpackCodec.subprotocol in offered or wanted == "msgpack":
+        if MSGPACK is not None:
+            return MSGPACK
+        logger.warning("Client asked for msgpack frames but msgpack is not installed; using JSON")
+    return JSON
+
+
+async def accept(ws: WebSocket) -> Codec:
+    """Accept the socket with the negotiated subprotocol (if the client offered one)."""
+    codec = negotiate(ws)
+    offered = list(ws.scope.get("subprotocols") or [])
+    if codec.subprotocol in offered:
+        await ws.accept(subprotocol=codec.subprotocol)
+    elif JSON_SUBPROTOCOL in offered:
+        await ws.accept(subprotocol=JSON_SUBPROTOCOL)
+    else:
+        await ws.accept()
+    return codec
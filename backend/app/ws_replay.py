@@ -1,27 +1,185 @@
 """
 WebSocket endpoint for live 3D replay viewer.
 Broadcasts canonical events to connected clients.
+
+Each event is serialized once and queued per client (app/ws_fanout.py); a lagging viewer
+only keeps the newest POSITION_UPDATE per actor (WS_COALESCE_POSITIONS) and is otherwise
+handled by WS_OVERFLOW_POLICY, so it never delays other viewers or the ingest path.
+
+Clients may narrow what they receive, either with query parameters
+
+    /ws/replay?match_id=m1&match_id=m2&event_types=KILL,ROUND_END&positions=delta
+
+or at any time with a message
+
+    {"type": "subscribe", "match_ids": ["m1"], "event_types": ["KILL"], "positions": "delta"}
+
+(omitted / null = everything). Subscribed clients get positions as tick-based
+POSITION_DELTA / POSITION_KEYFRAME frames (app/position_deltas.py) unless they ask for
+"positions": "raw". Clients that never subscribe keep receiving every event as before.
+
+Frames are JSON text unless the client negotiated binary frames (app/ws_protocol.py).
+
+Events reach the viewers from CANONICAL_STREAM: the first replay client starts one reader
+task per process that tails every canonical shard with plain XREAD (not a consumer group:
+each API process serves its own viewers and needs every event) and hands each entry to
+broadcast_event; it stops when the last viewer leaves. REPLAY_TAIL_CANONICAL = False turns the reader off for deployments that
+call broadcast_event from their own ingest path instead.
 """
 from fastapi import APIRouter, WebSocket, WebSocketDisconnect
-from typing import Set
-import json
+from typing import Dict, Iterable, List, Optional, Set
+from app.utils.serialization import loads
 import asyncio
 import logging
+from app.consumer_runtime import shared_redis
 from app.metrics import WEBSOCKET_CONNECTIONS
+from app.position_deltas import PositionTicker
+from app.settings import settings
+from app.stream_shards import shard_stream
+from app import ws_protocol
+from app.ws_fanout import FanoutHub, Subscriber
+from app.ws_protocol import Payload
 
 logger = logging.getLogger(__name__)
 
 router = APIRouter()
-clients: Set[WebSocket] = set()
+hub = FanoutHub("replay", queue_size=settings.WS_CLIENT_QUEUE_SIZE, overflow=settings.WS_OVERFLOW_POLICY)
+
+POSITION_UPDATE = "POSITION_UPDATE"
+
+
+class Subscription:
+    __slots__ = ("match_ids", "event_types", "delta")
+
+    def __init__(self, match_ids: Optional[Iterable[str]] = None, event_types: Optional[Iterable[str]] = None,
+                 delta: bool = False):
+        self.match_ids: Optional[Set[str]] = set(match_ids) if match_ids else None
+        self.event_types: Optional[Set[str]] = {t.upper() for t in event_types} if event_types else None
+        self.delta = delta and self.wants(POSITION_UPDATE)  # only meaningful if positions are wanted
+
+    def wants(self, event_type: Optional[str]) -> bool:
+        return self.event_types is None or (event_type or "").upper() in self.event_types
+
+    def describe(self) -> dict:
+        return {
+            "type": "subscribed",
+            "match_ids": sorted(self.match_ids) if self.match_ids is not None else None,
+            "event_types": sorted(self.event_types) if self.event_types is not None else None,
+            "positions": "delta" if self.delta else "raw",
+        }
+
+
+def _split(values: Iterable[str]) -> List[str]:
+    return [v.strip() for value in values for v in str(value).split(",") if v.strip()]
+
+
+def _from_query(ws: WebSocket) -> Optional[Subscription]:
+    params = ws.query_params
+    match_ids = _split(params.getlist("match_id") + params.getlist("match_ids"))
+    event_types = _split(params.getlist("event_types") + params.getlist("event_type"))
+    positions = params.get("positions")
+    if not (match_ids or event_types or positions):
+        return None
+    return Subscription(match_ids, event_types, delta=positions != "raw")
+
+
+def _from_message(msg: dict) -> Subscription:
+    match_ids = msg.get("match_ids") or ([msg["match_id"]] if msg.get("match_id") else None)
+    return Subscription(match_ids, msg.get("event_types"), delta=msg.get("positions", "delta") != "raw")
+
+
+class _Subscriptions:
+    """Subscriber -> Subscription, indexed by match so a broadcast only visits interested clients."""
+
+    def __init__(self):
+        self.by_sub: Dict[Subscriber, Optional[Subscription]] = {}
+        self.by_match: Dict[str, Set[Subscriber]] = {}
+        self.any_match: Set[Subscriber] = set()  # unfiltered by match (incl. legacy clients)
+        self.delta_count = 0  # subscribers taking positions as delta frames
+
+    def set(self, sub: Subscriber, subscription: Optional[Subscription]):
+        self.remove(sub)
+        self.by_sub[sub] = subscription
+        if subscription is not None and subscription.delta:
+            self.delta_count += 1
+        if subscription is None or subscription.match_ids is None:
+            self.any_match.add(sub)
+        else:
+            for match_id in subscription.match_ids:
+                self.by_match.setdefault(match_id, set()).add(sub)
+
+    def remove(self, sub: Subscriber):
+        subscription = self.by_sub.pop(sub, None)
+        self.any_match.discard(sub)
+        if subscription is not None and subscription.delta:
+            self.delta_count -= 1
+        if subscription is not None and subscription.match_ids is not None:
+            for match_id in subscription.match_ids:
+                subs = self.by_match.get(match_id)
+                if subs is not None:
+                    subs.discard(sub)
+                    if not subs:
+                        del self.by_match[match_id]
+
+    def for_match(self, match_id) -> List[Subscriber]:
+        subs = self.by_match.get(match_id)
+        return list(self.any_match | subs) if subs else list(self.any_match)
+
+
+_subs = _Subscriptions()
+_ticker = PositionTicker(quantum=settings.REPLAY_POSITION_QUANTUM)
+_ticker_task: Optional[asyncio.Task] = None
+
+
+def _delta_targets(match_id) -> List[Subscriber]:
+    out = []
+    for sub in _subs.for_match(match_id):
+        subscription = _subs.by_sub.get(sub)
+        if subscription is not None and subscription.delta:
+            out.append(sub)
+    return out
+
+
+async def _run_ticker():
+    """Send position deltas every tick (and keyframes periodically) while delta clients exist."""
+    interval = 1.0 / max(0.1, settings.REPLAY_POSITION_TICK_HZ)
+    keyframe_every = max(1, int(settings.REPLAY_KEYFRAME_SECONDS / interval))
+    while _subs.delta_count:
+        await asyncio.sleep(interval)
+        frames = _ticker.deltas()
+        if _ticker.tick % keyframe_every == 0:
+            frames.extend(_ticker.keyframes())
+            _ticker.evict_idle()
+        for frame in frames:
+            targets = _delta_targets(frame["match_id"])
+            if targets:
+                hub.publish_to(targets, Payload(obj=frame))
+
+
+def _subscribe(sub: Subscriber, subscription: Optional[Subscription]):
+    global _ticker_task
+    _subs.set(sub, subscription)
+    if subscription is None:
+        return
+    sub.offer(Payload(obj=subscription.describe()))
+    if subscription.delta:
+        # current positions first, so deltas apply to a full picture
+        for frame in _ticker.keyframes(subscription.match_ids):
+            sub.offer(Payload(obj=frame))
+        if _ticker_task is None or _ticker_task.done():
+            _ticker_task = asyncio.get_running_loop().create_task(_run_ticker())
 
 
 @router.websocket("/ws/replay")
 async def replay_ws(ws: WebSocket):
     """WebSocket endpoint for 3D replay viewer."""
-    
+
     try:
-        await ws.accept()
-        clients.add(ws)
+        codec = await ws_protocol.accept(ws)
+        sub = hub.subscribe(ws, replay=False, codec=codec)
+        _subscribe(sub, _from_query(ws))
+        if settings.REPLAY_TAIL_CANONICAL:
+            canonical_tail.ensure_started()
         WEBSOCKET_CONNECTIONS.labels(endpoint="replay").inc()
         logger.info("Replay WebSocket client connected")
     except Exception as e:
@@ -31,57 +189,138 @@ async def replay_ws(ws: WebSocket):
         except Exception:
             pass
         return
-    
+
     try:
         while True:
-            # Keep connection alive, allow client pings
+            # Keep connection alive, allow client pings and subscription changes
             try:
-                await ws.receive_text()
+                text = await ws.receive_text()
             except WebSocketDisconnect:
                 logger.info("Replay WebSocket client disconnected")
                 break
             except Exception as e:
                 logger.error(f"Error receiving replay WebSocket message: {e}", exc_info=True)
                 break
+            try:
+                msg = loads(text)
+            except ValueError:
+                continue  # plain-text keepalive
+            if isinstance(msg, dict) and msg.get("type") == "subscribe":
+                _subscribe(sub, _from_message(msg))
     except WebSocketDisconnect:
         logger.info("Replay WebSocket client disconnected")
     except Exception as e:
         logger.error(f"Unexpected error in replay WebSocket handler: {e}", exc_info=True)
     finally:
-        clients.discard(ws)
+        _subs.remove(sub)
+        hub.unsubscribe(sub)
         WEBSOCKET_CONNECTIONS.labels(endpoint="replay").dec()
 
 
+def _coalesce_key(event: dict) -> Optional[tuple]:
+    """Position updates supersede each other per actor; everything else is delivered."""
+    if settings.WS_COALESCE_POSITIONS and event.get("event_type") == POSITION_UPDATE:
+        actor = event.get("actor") or (event.get("payload") or {}).get("player_id")
+        if actor is not None:
+            return ("pos", event.get("match_id"), actor)
+    return None
+
+
 async def broadcast_event(event: dict):
     """
-    Broadcast a canonical event to all connected replay clients.
-    Called from ingestion pipeline.
+    Broadcast a canonical event to the replay clients subscribed to its match and type.
+    Called from ingestion pipeline; never waits on a client socket.
     """
-    if not clients:
+    if not hub.subscribers:
         return
-    
+
     if not event:
         logger.warning("Attempted to broadcast empty event")
         return
-    
+
+    match_id = event.get("match_id")
+    event_type = event.get("event_type") or event.get("type")
+    if event_type == POSITION_UPDATE and _subs.delta_count:
+        # tracked for every match so a client subscribing later starts from a keyframe
+        _ticker.update(event)
+    raw_targets = []
+    for sub in _subs.for_match(match_id):
+        subscription = _subs.by_sub.get(sub)
+        if subscription is None:
+            raw_targets.append(sub)
+        elif subscription.wants(event_type) and not (event_type == POSITION_UPDATE and subscription.delta):
+            raw_targets.append(sub)
+    if not raw_targets:
+        return
+
     try:
-        message = json.dumps(event)
+        hub.publish_to(raw_targets, Payload(obj=event), key=_coalesce_key(event))
     except Exception as e:
         logger.error(f"Error serializing event for broadcast: {e}", exc_info=True)
-        return
-    
-    dead_clients = []
-    
-    for ws in list(clients):
-        try:
-            await ws.send_text(message)
-        except Exception as e:
-            logger.debug(f"Error sending event to replay client: {e}")
-            dead_clients.append(ws)
-    
-    # Clean up dead connections
-    for ws in dead_clients:
-        clients.discard(ws)
-        WEBSOCKET_CONNECTIONS.labels(endpoint="replay").dec()
 
 
+class CanonicalTail:
+    """
+    Tails every shard of the canonical stream into broadcast_event. Started by the first
+    replay client; the task ends once the process has no viewers and the next client
+    starts it again.
+    """
+
+    def __init__(self, base: str = settings.CANONICAL_STREAM, shards: int = settings.CANONICAL_STREAM_SHARDS):
+        self.streams = [shard_stream(base, i, shards) for i in range(max(1, shards))]
+        self._task: Optional[asyncio.Task] = None
+
+    def ensure_started(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def _start_ids(self, r) -> Dict[str, str]:
+        """
+        Current last id per shard, resolved once: XREAD re-resolves "$" on every call, so a
+        quiet shard left at "$" would lose whatever is written to it between two reads.
+        """
+        ids = {}
+        for stream in self.streams:
+            last = await r.xrevrange(stream, count=1)
+            ids[stream] = last[0][0] if last else "0-0"
+        return ids
+
+    async def _run(self):
+        # live view: start at the tail, earlier events are not replayed to new viewers
+        last_ids: Optional[Dict[str, str]] = None
+        while hub.subscribers:
+            try:
+                r = await shared_redis()
+                if last_ids is None:
+                    last_ids = await self._start_ids(r)
+                # smaller than a client queue, so one read burst cannot overflow a healthy client
+                count = max(1, min(100, hub.queue_size // 2))
+                msgs = await r.xread(last_ids, block=2000, count=count)
+                for stream, entries in msgs or []:
+                    for msg_id, data in entries:
+                        last_ids[stream] = msg_id
+                        payload = data.get("data")
+                        if not payload:
+                            continue
+                        try:
+                            event = loads(payload)
+                        except Exception:
+                            logger.warning(f"Skipping undecodable canonical entry {stream} {msg_id}")
+                            continue
+                        if isinstance(event, dict):
+                            await broadcast_event(event)
+                    await asyncio.sleep(0)  # let client writers drain between batches
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Error tailing canonical stream for replay viewers: {e}", exc_info=True)
+                await asyncio.sleep(1)
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+
+canonical_tail = CanonicalTail()
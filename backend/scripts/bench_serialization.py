@@ -0,0 +1,97 @@
+# scripts/bench_serialization.py
+"""
+Micro-benchmark for app.utils.serialization on a recorded match.
+
+Replays every event of the sample archive through the JSON hops one canonical event
+takes through the platform and reports CPU time per event for each available backend:
+
+    ws recv (loads raw) -> publish_canonical (dumps) -> 3 stream consumers (loads)
+    -> replay broadcast (dumps)
+
+Usage:
+    python scripts/bench_serialization.py [--archive PATH] [--repeat 200]
+"""
+import argparse
+import os
+import sys
+import time
+import uuid
+from datetime import datetime, timezone
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from app.utils.serialization import _CODECS
+
+DEFAULT_ARCHIVE = os.path.join(
+    os.path.dirname(__file__), '..', '..', 'assets', 'data', 'sample-data', 'mock_esports_match_archive.json'
+)
+CONSUMER_HOPS = 3  # canonical_ingest, micro_analysis, integration/replay consumer
+
+
+def load_events(path: str) -> list[tuple[str, dict]]:
+    """Flatten the archive into (raw wire text, canonical dict) pairs."""
+    _dumps, _loads = _CODECS["json"]()
+    with open(path, 'rb') as f:
+        archive = _loads(f.read())
+    match_id = archive["match"]["match_id"]
+    pairs = []
+    for map_data in archive["maps"]:
+        for round_data in map_data["rounds"]:
+            for seq, event in enumerate(round_data["events"]):
+                raw = {**event, "match_id": match_id, "map_id": map_data["map_id"],
+                       "round": round_data["round_number"], "seq": seq}
+                canonical = {
+                    "event_id": str(uuid.uuid4()),
+                    "match_id": match_id,
+                    "event_type": str(event.get("event_type", event.get("type", "UNKNOWN"))).upper(),
+                    "timestamp": datetime.now(timezone.utc),
+                    "actor": event.get("actor"),
+                    "target": event.get("target"),
+                    "team": event.get("team"),
+                    "payload": raw,
+                    "enriched": {"heuristic_confidence": 0.5},
+                    "ingestion_meta": {"source": "GRID", "grid_seq": seq},
+                }
+                pairs.append((_dumps(raw).decode("utf-8"), canonical))
+    return pairs
+
+
+def run_hops(pairs, dumps_bytes, loads, repeat: int) -> float:
+    start = time.process_time()
+    for _ in range(repeat):
+        for raw_text, canonical in pairs:
+            loads(raw_text)
+            wire = dumps_bytes(canonical)
+            for _hop in range(CONSUMER_HOPS):
+                loads(wire)
+            dumps_bytes(canonical).decode("utf-8")
+    return time.process_time() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark JSON backends on a recorded match")
+    parser.add_argument("--archive", default=DEFAULT_ARCHIVE)
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+
+    pairs = load_events(args.archive)
+    n = len(pairs) * args.repeat
+    print(f"{len(pairs)} events x {args.repeat} repeats = {n} events, {CONSUMER_HOPS + 3} JSON hops each\n")
+
+    results = {}
+    for name, factory in _CODECS.items():
+        try:
+            dumps_bytes, loads = factory()
+        except ImportError:
+            print(f"{name:8s} not installed")
+            continue
+        results[name] = run_hops(pairs, dumps_bytes, loads, args.repeat) / n * 1e6
+
+    baseline = results["json"]
+    for name, us in results.items():
+        saved = baseline - us
+        print(f"{name:8s} {us:8.2f} us/event   saved {saved:6.2f} us/event ({baseline / us:4.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
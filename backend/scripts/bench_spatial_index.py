@@ -0,0 +1,69 @@
+# scripts/bench_spatial_index.py
+"""
+Benchmark trade-potential radius queries: linear scan (previous enricher code) vs SpatialGrid.
+
+Scales: 10 players (Valorant) and 150 entities (LoL champions + minions + wards).
+
+Usage:
+    python scripts/bench_spatial_index.py [--queries 20000]
+"""
+import argparse
+import math
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from app.spatial_index import SpatialGrid
+
+RADIUS = 15.0
+
+
+def linear_count(positions: dict, teams: dict, victim: str, killer: str) -> int:
+    v = positions[victim]
+    team = teams[victim]
+    n = 0
+    for pid, p in positions.items():
+        if pid in (victim, killer) or teams[pid] != team:
+            continue
+        if math.sqrt((v[0] - p[0]) ** 2 + (v[1] - p[1]) ** 2 + (v[2] - p[2]) ** 2) < RADIUS:
+            n += 1
+    return n
+
+
+def run(n_entities: int, map_size: float, queries: int, seed: int = 7):
+    rng = random.Random(seed)
+    ids = [f"e{i}" for i in range(n_entities)]
+    positions = {eid: (rng.uniform(0, map_size), rng.uniform(0, map_size), 0.0) for eid in ids}
+    teams = {eid: ("blue" if i % 2 else "red") for i, eid in enumerate(ids)}
+    grid = SpatialGrid(cell_size=RADIUS)
+    for eid in ids:
+        grid.update(eid, positions[eid], team=teams[eid])
+    pairs = [(rng.choice(ids), rng.choice(ids)) for _ in range(queries)]
+
+    start = time.perf_counter()
+    expected = [linear_count(positions, teams, v, k) for v, k in pairs]
+    linear_s = time.perf_counter() - start
+
+    start = time.perf_counter()
+    got = [len(grid.query_radius(grid.position_of(v), RADIUS, exclude=(v, k), team=grid.team_of(v))) for v, k in pairs]
+    grid_s = time.perf_counter() - start
+
+    assert got == expected, "grid and linear scan disagree"
+    print(f"{n_entities:5d} entities  linear {linear_s / queries * 1e6:7.2f} us/query   "
+          f"grid {grid_s / queries * 1e6:7.2f} us/query   ({linear_s / grid_s:4.1f}x)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark SpatialGrid radius queries")
+    parser.add_argument("--queries", type=int, default=20000)
+    args = parser.parse_args()
+    run(10, map_size=120.0, queries=args.queries)       # Valorant-sized site
+    run(150, map_size=300.0, queries=args.queries)      # LoL lane + jungle entities
+    run(1000, map_size=600.0, queries=args.queries)     # stress
+
+
+if __name__ == "__main__":
+    main()
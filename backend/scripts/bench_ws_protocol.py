@@ -0,0 +1,132 @@
+# scripts/bench_ws_protocol.py
+"""
+Encode cost and wire size of the WebSocket frame formats (app/ws_protocol.py).
+
+Two workloads:
+
+- events: every event of the sample archive, as the canonical dict the replay feed
+  broadcasts, encoded with stdlib json.dumps (the old path), app dumps, and MessagePack;
+- positions: POSITION_DELTA frames for the archive's players (the archive carries no
+  position samples, so a deterministic random walk stands in for them), JSON vs the
+  packed struct layout.
+
+Usage:
+    python scripts/bench_ws_protocol.py [--archive PATH] [--repeat 2000] [--ticks 500]
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+import uuid
+from datetime import datetime, timezone
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from app.position_deltas import PositionTicker
+from app.utils.serialization import dumps
+from app.ws_protocol import JSON, MSGPACK, Payload, unpack_frame
+
+DEFAULT_ARCHIVE = os.path.join(
+    os.path.dirname(__file__), '..', '..', 'assets', 'data', 'sample-data', 'mock_esports_match_archive.json'
+)
+
+
+def load_archive(path: str) -> dict:
+    with open(path, 'rb') as f:
+        return json.loads(f.read())
+
+
+def canonical_events(archive: dict) -> list[dict]:
+    match_id = archive["match"]["match_id"]
+    events = []
+    for map_data in archive["maps"]:
+        for round_data in map_data["rounds"]:
+            for seq, event in enumerate(round_data["events"]):
+                events.append({
+                    "event_id": str(uuid.uuid4()),
+                    "match_id": match_id,
+                    "event_type": str(event.get("event_type", "UNKNOWN")).upper(),
+                    "timestamp": datetime.now(timezone.utc).isoformat(),
+                    "actor": event.get("actor"),
+                    "target": event.get("target"),
+                    "team": event.get("team"),
+                    "payload": {**event, "map_id": map_data["map_id"], "round": round_data["round_number"]},
+                    "enriched": {"heuristic_confidence": 0.5},
+                    "ingestion_meta": {"source": "GRID", "grid_seq": seq},
+                })
+    return events
+
+
+def position_frames(archive: dict, ticks: int, quantum: float = 0.1) -> list[dict]:
+    """POSITION_DELTA frames for a random walk of every archive player (seeded)."""
+    rng = random.Random(7)
+    match_id = archive["match"]["match_id"]
+    players = [p["player_id"] for team in archive["teams"] for p in team["players"]]
+    pos = {p: [rng.uniform(-2000, 2000), rng.uniform(-2000, 2000), rng.uniform(0, 300)] for p in players}
+    ticker = PositionTicker(quantum=quantum)
+    frames = []
+    for _ in range(ticks):
+        for p in players:
+            if rng.random() < 0.8:  # most players move every tick
+                pos[p] = [v + rng.uniform(-25, 25) for v in pos[p]]
+            ticker.update({"match_id": match_id, "event_type": "POSITION_UPDATE",
+                           "payload": {"player_id": p, "pos": pos[p]}})
+        frames.extend(ticker.deltas())
+    return frames
+
+
+def measure(frames: list[dict], encode, repeat: int) -> tuple[float, float]:
+    """(us per frame, bytes per frame)."""
+    size = sum(len(encode(f)) for f in frames) / len(frames)
+    start = time.process_time()
+    for _ in range(repeat):
+        for f in frames:
+            encode(f)
+    return (time.process_time() - start) / (repeat * len(frames)) * 1e6, size
+
+
+def report(title: str, frames: list[dict], encoders: dict, repeat: int):
+    print(f"{title}: {len(frames)} frames x {repeat} repeats")
+    baseline = None
+    for name, encode in encoders.items():
+        if encode is None:
+            print(f"  {name:16s} not installed")
+            continue
+        us, size = measure(frames, encode, repeat)
+        if baseline is None:
+            baseline = (us, size)
+        print(f"  {name:16s} {us:7.2f} us/frame ({baseline[0] / us:4.1f}x)  "
+              f"{size:7.1f} B/frame ({size / baseline[1] * 100:5.1f}%)")
+    print()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark WebSocket frame encodings on a recorded match")
+    parser.add_argument("--archive", default=DEFAULT_ARCHIVE)
+    parser.add_argument("--repeat", type=int, default=2000)
+    parser.add_argument("--ticks", type=int, default=500)
+    args = parser.parse_args()
+
+    archive = load_archive(args.archive)
+    msgpack_encode = (lambda f: MSGPACK.encode(Payload(obj=f))) if MSGPACK is not None else None
+
+    report("events", canonical_events(archive), {
+        "json.dumps": json.dumps,
+        "app dumps": dumps,
+        "msgpack": msgpack_encode,
+    }, args.repeat)
+
+    frames = position_frames(archive, args.ticks)
+    if MSGPACK is not None:
+        assert unpack_frame(MSGPACK.encode(Payload(obj=frames[-1])))["p"] == frames[-1]["p"]
+    report("position deltas", frames, {
+        "json.dumps": json.dumps,
+        "app dumps": lambda f: JSON.encode(Payload(obj=f)),
+        "packed struct": msgpack_encode,
+    }, max(1, args.repeat // 10))
+
+
+if __name__ == "__main__":
+    main()
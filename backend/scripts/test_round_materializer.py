@@ -0,0 +1,127 @@
+# scripts/test_round_materializer.py
+"""
+RoundMaterializer.handle_batch against an in-memory asyncpg pool double that encodes
+arguments the way asyncpg does (varchar[] takes str only, int[] is int32) and only keeps
+what a committed transaction wrote.
+
+Run with pytest, or directly: python scripts/test_round_materializer.py
+"""
+import asyncio
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+try:
+    from app.analytics import round_materializer
+except (ImportError, TypeError) as e:  # aioredis does not import on every Python version
+    import pytest
+    pytest.skip(f"app.analytics.round_materializer unavailable: {e}", allow_module_level=True)
+
+
+class DataError(ValueError):
+    """Stands in for asyncpg's client-side DataError (a ValueError)."""
+
+
+class FakePool:
+    def __init__(self):
+        self.rounds = {}    # (match_id, round_no) -> winner_team
+        self.outcomes = {}  # (round_id, team) -> round_win
+        self.down = False
+
+    def acquire(self):
+        return _Conn(self)
+
+
+class _Conn:
+    def __init__(self, pool):
+        self.pool = pool
+        self.staged_rounds, self.staged_outcomes = {}, {}
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    def transaction(self):
+        conn = self
+
+        class Transaction:
+            async def __aenter__(self):
+                conn.staged_rounds, conn.staged_outcomes = {}, {}
+
+            async def __aexit__(self, exc_type, *exc):
+                if exc_type is None:
+                    conn.pool.rounds.update(conn.staged_rounds)
+                    conn.pool.outcomes.update(conn.staged_outcomes)
+                return False
+
+        return Transaction()
+
+    async def fetch(self, sql, ids, match_ids, map_ids, round_nos, starts, ends, winners, *rest):
+        if self.pool.down:
+            raise ConnectionError("connection reset")
+        for i, winner in enumerate(winners):
+            if winner is not None and not isinstance(winner, str):
+                raise DataError(f"invalid input for query argument $7: {winners!r} (expected str, got int)")
+            if not -2 ** 31 <= round_nos[i] < 2 ** 31:
+                raise DataError(f"invalid input for query argument $4: {round_nos!r} (value out of int32 range)")
+        out = []
+        for i, key in enumerate(zip(match_ids, round_nos)):
+            self.staged_rounds[key] = winners[i]
+            out.append({"id": f"r:{key[0]}:{key[1]}", "match_id": key[0], "round_no": key[1]})
+        return out
+
+    async def execute(self, sql, ids, round_ids, match_ids, teams, wins, *rest):
+        for round_id, team, win in zip(round_ids, teams, wins):
+            self.staged_outcomes[(round_id, team)] = win
+
+
+def round_end(match_id, round_no, winner):
+    return {"event_type": "ROUND_END", "match_id": match_id, "timestamp": "2024-03-01T12:00:00Z",
+            "payload": {"round": round_no, "winner": winner}}
+
+
+def test_rejected_round_is_dropped_and_later_batches_commit():
+    pool = FakePool()
+    materializer = round_materializer.RoundMaterializer(pool)
+
+    async def scenario():
+        # a winner_team Postgres cannot take next to a good round, in one batch
+        first = await materializer.handle_batch([round_end("m1", 1, "A"), round_end("m1", 2, 7)], ["1-0", "1-1"])
+        # the same bad event redelivered, plus a good round: must not fail because of the first batch
+        second = await materializer.handle_batch([round_end("m1", 2, 7), round_end("m1", 3, "B")], ["2-0", "2-1"])
+        third = await materializer.handle_batch([round_end("m2", 2 ** 40, "A"), round_end("m2", 1, "A")], ["3-0", "3-1"])
+        return first, second, third
+
+    first, second, third = asyncio.run(scenario())
+
+    assert (first, second, third) == (["1-0", "1-1"], ["2-0", "2-1"], ["3-0", "3-1"])
+    assert pool.rounds == {("m1", 1): "A", ("m1", 3): "B", ("m2", 1): "A"}
+    assert pool.outcomes == {("r:m1:1", "A"): True, ("r:m1:3", "B"): True, ("r:m2:1", "A"): True}
+    assert not materializer._dirty and not materializer._dirty_outcomes
+
+
+def test_connection_errors_keep_rounds_staged():
+    pool = FakePool()
+    materializer = round_materializer.RoundMaterializer(pool)
+
+    pool.down = True
+    try:
+        asyncio.run(materializer.handle_batch([round_end("m1", 1, "A")], ["1-0"]))
+    except ConnectionError:
+        pass
+    else:
+        raise AssertionError("a connection error must fail the batch for redelivery")
+    assert list(materializer._dirty) == [("m1", 1)]
+
+    pool.down = False
+    assert asyncio.run(materializer.handle_batch([], [])) == []
+    assert pool.rounds == {("m1", 1): "A"}
+
+
+if __name__ == "__main__":
+    test_rejected_round_is_dropped_and_later_batches_commit()
+    test_connection_errors_keep_rounds_staged()
+    print("ok")
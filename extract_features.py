@@ -1,91 +1,112 @@
 # extract_features.py
 # Produces features.csv with one row per player-round.
-import json
-import csv
-from collections import defaultdict
-import math
+# Usage: python extract_features.py [--in Sample_valorant_rounds.jsonl] [--out features.csv]
+#        [--parquet features.parquet] [--workers 4] [--chunk-lines 200] [--num-shards 4 --shard-index 0]
+# Streams the JSONL input (see feature_stream.py); import round_features() to use it as a library.
+from feature_stream import run_cli
 
 IN_FILE = "Sample_valorant_rounds.jsonl"
 OUT_FILE = "features.csv"
 
-
-def safe_mean(xs):
-    return sum(xs) / len(xs) if xs else 0.0
+FEATURE_SCHEMA = [
+    ("match_id", "string"), ("round_no", "int64"), ("player_id", "string"),
+    ("n_events", "int64"), ("n_shoot", "int64"), ("mean_latency", "float64"), ("min_latency", "float64"),
+    ("fast_shots", "int64"), ("headshots", "int64"), ("n_ability", "int64"),
+    ("execute_smokes", "int64"), ("postplant_smokes", "int64"), ("late_smoke", "int64"),
+    ("n_deaths", "int64"), ("n_kills", "int64"), ("n_trades", "int64"),
+    ("kd_ratio", "float64"), ("accuracy", "float64"), ("headshot_rate", "float64"),
+    ("fast_shot_rate", "float64"), ("ability_rate", "float64"), ("execute_to_postplant_smoke_ratio", "float64"),
+    ("round_total_deaths", "int64"), ("round_late_smokes", "int64"), ("label_dead", "int64"),
+]
 
 
 def safe_div(a, b):
     return a / b if b else 0.0
 
 
-with open(IN_FILE, "r", encoding="utf-8") as fh, open(OUT_FILE, "w", newline='', encoding="utf-8") as outfh:
-    writer = None
-    for line in fh:
-        round_obj = json.loads(line)
-        round_no = round_obj["round_no"]
-        summary = round_obj["round_summary"]
-        for pid, evs in round_obj["player_events"].items():
-            # basic features
-            n_events = len(evs)
-            shoot_events = [e for e in evs if e["event_type"] == "shoot"]
-            n_shoot = len(shoot_events)
-            latencies = [e.get("first_shot_latency_ms", 0) for e in shoot_events]
-            mean_latency = safe_mean(latencies)
-            min_latency = min(latencies) if latencies else 0.0
-            fast_shots = sum(1 for e in shoot_events if e.get("first_shot_latency_ms", 999) < 180)
-            headshots = sum(1 for e in shoot_events if e.get("hit_head", False))
+def player_round_features(round_obj, pid, evs):
+    """Feature row for one player's events in one round; every counter comes from a single pass."""
+    n_shoot = latency_sum = fast_shots = headshots = 0
+    min_latency = None
+    n_ability = execute_smokes = postplant_smokes = 0
+    n_deaths = n_kills = n_trades = 0
+    for e in evs:
+        event_type = e["event_type"]
+        if event_type == "shoot":
+            n_shoot += 1
+            latency = e.get("first_shot_latency_ms", 0)
+            latency_sum += latency
+            min_latency = latency if min_latency is None else min(min_latency, latency)
+            if e.get("first_shot_latency_ms", 999) < 180:
+                fast_shots += 1
+            if e.get("hit_head", False):
+                headshots += 1
+        elif event_type == "ability_cast":
+            n_ability += 1
+            if e.get("ability") == "smoke":
+                phase = e.get("phase")
+                if phase == "execute":
+                    execute_smokes += 1
+                elif phase == "postplant":
+                    postplant_smokes += 1
+        elif event_type == "death":
+            n_deaths += 1
+        elif event_type == "kill":
+            n_kills += 1
+        elif event_type == "trade_attempt":
+            n_trades += 1
 
-            ability_events = [e for e in evs if e["event_type"] == "ability_cast"]
-            n_ability = len(ability_events)
-            execute_smokes = sum(1 for e in ability_events if e.get("ability") == "smoke" and e.get("phase") == "execute")
-            postplant_smokes = sum(1 for e in ability_events if e.get("ability") == "smoke" and e.get("phase") == "postplant")
-            late_smoke_flag = 1 if postplant_smokes > 0 else 0
+    # basic features
+    n_events = len(evs)
+    mean_latency = latency_sum / n_shoot if n_shoot else 0.0
+    min_latency = min_latency if n_shoot else 0.0
+    late_smoke_flag = 1 if postplant_smokes > 0 else 0
 
-            n_deaths = sum(1 for e in evs if e["event_type"] == "death")
-            n_kills = sum(1 for e in evs if e["event_type"] == "kill")  # Added kill count
-            n_trades = sum(1 for e in evs if e["event_type"] == "trade_attempt")
+    # More advanced features
+    kd_ratio = safe_div(n_kills, max(1, n_deaths))
+    accuracy = safe_div(n_kills, n_shoot)  # Rough proxy for accuracy
+    headshot_rate = safe_div(headshots, n_shoot)
+    fast_shot_rate = safe_div(fast_shots, n_shoot)
+    ability_rate = safe_div(n_ability, n_events)
+    execute_to_postplant_smoke_ratio = safe_div(execute_smokes, postplant_smokes) if postplant_smokes else (execute_smokes if execute_smokes else 0.0)
 
-            # More advanced features
-            kd_ratio = safe_div(n_kills, max(1, n_deaths))
-            accuracy = safe_div(n_kills, n_shoot)  # Rough proxy for accuracy
-            headshot_rate = safe_div(headshots, n_shoot)
-            fast_shot_rate = safe_div(fast_shots, n_shoot)
-            ability_rate = safe_div(n_ability, n_events)
-            execute_to_postplant_smoke_ratio = safe_div(execute_smokes, postplant_smokes) if postplant_smokes else (execute_smokes if execute_smokes else 0.0)
+    summary = round_obj["round_summary"]
+    # derived normalizations (per round)
+    return {
+        "match_id": round_obj["match_id"],
+        "round_no": round_obj["round_no"],
+        "player_id": pid,
+        "n_events": n_events,
+        "n_shoot": n_shoot,
+        "mean_latency": mean_latency,
+        "min_latency": min_latency,
+        "fast_shots": fast_shots,
+        "headshots": headshots,
+        "n_ability": n_ability,
+        "execute_smokes": execute_smokes,
+        "postplant_smokes": postplant_smokes,
+        "late_smoke": late_smoke_flag,
+        "n_deaths": n_deaths,
+        "n_kills": n_kills,
+        "n_trades": n_trades,
+        "kd_ratio": kd_ratio,
+        "accuracy": accuracy,
+        "headshot_rate": headshot_rate,
+        "fast_shot_rate": fast_shot_rate,
+        "ability_rate": ability_rate,
+        "execute_to_postplant_smoke_ratio": execute_to_postplant_smoke_ratio,
+        "round_total_deaths": summary["total_deaths"],
+        "round_late_smokes": summary["late_smokes"],
+        # label example: was player dead this round?
+        "label_dead": 1 if n_deaths > 0 else 0,
+    }
 
-            # derived normalizations (per round)
-            feat = {
-                "match_id": round_obj["match_id"],
-                "round_no": round_no,
-                "player_id": pid,
-                "n_events": n_events,
-                "n_shoot": n_shoot,
-                "mean_latency": mean_latency,
-                "min_latency": min_latency,
-                "fast_shots": fast_shots,
-                "headshots": headshots,
-                "n_ability": n_ability,
-                "execute_smokes": execute_smokes,
-                "postplant_smokes": postplant_smokes,
-                "late_smoke": late_smoke_flag,
-                "n_deaths": n_deaths,
-                "n_kills": n_kills,
-                "n_trades": n_trades,
-                "kd_ratio": kd_ratio,
-                "accuracy": accuracy,
-                "headshot_rate": headshot_rate,
-                "fast_shot_rate": fast_shot_rate,
-                "ability_rate": ability_rate,
-                "execute_to_postplant_smoke_ratio": execute_to_postplant_smoke_ratio,
-                "round_total_deaths": summary["total_deaths"],
-                "round_late_smokes": summary["late_smokes"],
-                # label example: was player dead this round?
-                "label_dead": 1 if n_deaths > 0 else 0,
-            }
-            if writer is None:
-                writer = csv.DictWriter(outfh, fieldnames=list(feat.keys()))
-                writer.writeheader()
-            writer.writerow(feat)
 
-print("Wrote features to", OUT_FILE)
+def round_features(round_obj):
+    """One parsed JSONL round -> one feature row per player."""
+    return [player_round_features(round_obj, pid, evs) for pid, evs in round_obj["player_events"].items()]
 
 
+if __name__ == "__main__":
+    run_cli(round_features, FEATURE_SCHEMA, IN_FILE, OUT_FILE,
+            description="Extract per-player-round Valorant features from a rounds JSONL file", label="features")
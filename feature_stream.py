@@ -0,0 +1,142 @@
+# feature_stream.py
+# Streaming driver shared by the JSONL feature extractors (extract_features.py,
+# lol_extract_features.py). Reads the input in chunks of lines, optionally hands the chunks
+# to worker processes, and appends each finished chunk to CSV and/or Parquet in input order.
+# Memory stays bounded by chunk size x in-flight chunks, whatever the file size.
+# Sharding (--num-shards N --shard-index I) keeps every N-th line starting at I, so N
+# machines or processes can split one file and write separate outputs.
+
+import argparse
+import csv
+import json
+import os
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+Schema = List[Tuple[str, str]]  # (column, 'string' | 'int64' | 'float64'), in output order
+RowFn = Callable[[dict], List[dict]]  # one parsed JSONL record -> feature rows
+
+
+def read_chunks(path: str, chunk_lines: int, shard_index: int = 0, num_shards: int = 1) -> Iterator[List[str]]:
+    """Non-blank lines of `path` in lists of up to chunk_lines; only lines i with i % num_shards == shard_index."""
+    chunk = []
+    with open(path, "r", encoding="utf-8") as fh:
+        for i, line in enumerate(fh):
+            if i % num_shards != shard_index or not line.strip():
+                continue
+            chunk.append(line)
+            if len(chunk) >= chunk_lines:
+                yield chunk
+                chunk = []
+    if chunk:
+        yield chunk
+
+
+def extract_chunk(row_fn: RowFn, lines: List[str]) -> List[dict]:
+    return [row for line in lines for row in row_fn(json.loads(line))]
+
+
+def shard_path(path: Optional[str], shard_index: int, num_shards: int) -> Optional[str]:
+    """features.csv -> features.shard-01-of-04.csv when sharding, so shards never share an output."""
+    if not path or num_shards <= 1:
+        return path
+    root, ext = os.path.splitext(path)
+    return f"{root}.shard-{shard_index:02d}-of-{num_shards:02d}{ext}"
+
+
+class FeatureWriter:
+    """Appends row batches to a CSV file and/or a Parquet file (one row group per batch)."""
+
+    def __init__(self, schema: Schema, csv_path: Optional[str] = None, parquet_path: Optional[str] = None):
+        self.fieldnames = [name for name, _type in schema]
+        self.csv_path, self.parquet_path = csv_path, parquet_path
+        self.rows = 0
+        self._csv_fh = open(csv_path, "w", newline="", encoding="utf-8") if csv_path else None
+        self._csv = None
+        self._parquet = None
+        if parquet_path:
+            # imported only for Parquet output: optional dependency, and heavy for CSV-only runs
+            try:
+                import pyarrow as pa
+                import pyarrow.parquet as pq
+            except ImportError:
+                raise RuntimeError("Parquet output needs pyarrow (pip install pyarrow)")
+            self._pa, self._pq = pa, pq
+            self._arrow_schema = pa.schema([(name, getattr(pa, type_)()) for name, type_ in schema])
+
+    def write(self, rows: List[dict]):
+        if not rows:
+            return
+        if self._csv_fh is not None:
+            if self._csv is None:
+                # header with the first row, like the original scripts (no rows -> empty file)
+                self._csv = csv.DictWriter(self._csv_fh, fieldnames=self.fieldnames)
+                self._csv.writeheader()
+            self._csv.writerows(rows)
+        if self.parquet_path:
+            if self._parquet is None:
+                self._parquet = self._pq.ParquetWriter(self.parquet_path, self._arrow_schema)
+            self._parquet.write_table(self._pa.Table.from_pylist(rows, schema=self._arrow_schema))
+        self.rows += len(rows)
+
+    def close(self):
+        if self._csv_fh is not None:
+            self._csv_fh.close()
+        if self.parquet_path:
+            if self._parquet is None:  # still write a valid, empty Parquet file
+                self._parquet = self._pq.ParquetWriter(self.parquet_path, self._arrow_schema)
+            self._parquet.close()
+
+
+def run(row_fn: RowFn, schema: Schema, in_path: str, csv_path: Optional[str] = None,
+        parquet_path: Optional[str] = None, workers: int = 1, chunk_lines: int = 200,
+        shard_index: int = 0, num_shards: int = 1, max_in_flight: Optional[int] = None) -> Dict[str, float]:
+    """Stream `in_path` through row_fn into the outputs; returns line/row counts and elapsed seconds."""
+    if not 0 <= shard_index < num_shards:
+        raise ValueError(f"shard index {shard_index} out of range for {num_shards} shards")
+    start = time.perf_counter()
+    writer = FeatureWriter(schema, csv_path, parquet_path)
+    chunks = read_chunks(in_path, chunk_lines, shard_index, num_shards)
+    lines = 0
+    try:
+        if workers <= 1:
+            for chunk in chunks:
+                lines += len(chunk)
+                writer.write(extract_chunk(row_fn, chunk))
+        else:
+            max_in_flight = max_in_flight or 2 * workers
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                in_flight = deque()
+                for chunk in chunks:
+                    lines += len(chunk)
+                    in_flight.append(pool.submit(extract_chunk, row_fn, chunk))
+                    if len(in_flight) >= max_in_flight:
+                        # oldest first keeps the output in input order
+                        writer.write(in_flight.popleft().result())
+                while in_flight:
+                    writer.write(in_flight.popleft().result())
+    finally:
+        writer.close()
+    return {"lines": lines, "rows": writer.rows, "seconds": time.perf_counter() - start}
+
+
+def run_cli(row_fn: RowFn, schema: Schema, in_file: str, out_file: str, description: str, label: str):
+    """Command line for an extractor: python <script>.py [--in ...] [--out ...] [--parquet ...] [...]."""
+    parser = argparse.ArgumentParser(description=description)
+    parser.add_argument("--in", dest="in_path", default=in_file, help=f"input JSONL (default: {in_file})")
+    parser.add_argument("--out", default=out_file, help=f"output CSV (default: {out_file}; '' for none)")
+    parser.add_argument("--parquet", default=None, help="also write Parquet to this path (needs pyarrow)")
+    parser.add_argument("--workers", type=int, default=1, help="worker processes (default: 1, in-process)")
+    parser.add_argument("--chunk-lines", type=int, default=200, help="JSONL lines per chunk / worker task")
+    parser.add_argument("--num-shards", type=int, default=1, help="split the input into N line-interleaved shards")
+    parser.add_argument("--shard-index", type=int, default=0, help="which shard this run processes (0-based)")
+    args = parser.parse_args()
+
+    csv_path = shard_path(args.out or None, args.shard_index, args.num_shards)
+    parquet_path = shard_path(args.parquet, args.shard_index, args.num_shards)
+    stats = run(row_fn, schema, args.in_path, csv_path, parquet_path, workers=args.workers,
+                chunk_lines=args.chunk_lines, shard_index=args.shard_index, num_shards=args.num_shards)
+    outputs = " and ".join(p for p in (csv_path, parquet_path) if p) or "nowhere (no outputs selected)"
+    print(f"Wrote {label} to {outputs} ({stats['rows']} rows from {stats['lines']} lines in {stats['seconds']:.2f}s)")
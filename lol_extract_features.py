@@ -1,14 +1,25 @@
 # lol_extract_features.py
 # Extract per-player per-match features from Sample_lol_events.jsonl
-# Usage: python lol_extract_features.py
+# Usage: python lol_extract_features.py [--in Sample_lol_events.jsonl] [--out lol_features.csv]
+#        [--parquet lol_features.parquet] [--workers 4] [--chunk-lines 200] [--num-shards 4 --shard-index 0]
+# Streams the JSONL input (see feature_stream.py); import match_features() to use it as a library.
 
-import json
-import csv
 from statistics import mean
 
+from feature_stream import run_cli
+
 IN_FILE = "Sample_lol_events.jsonl"
 OUT_FILE = "lol_features.csv"
 
+FEATURE_SCHEMA = [
+    ("match_id", "string"), ("player_id", "string"), ("duration_min", "float64"),
+    ("cs_total", "int64"), ("cs_per_min", "float64"), ("kills", "int64"), ("assists", "int64"),
+    ("ka_sum", "int64"), ("kda_proxy", "float64"), ("wards_placed", "int64"), ("wards_cleared", "int64"),
+    ("vision_per_min", "float64"), ("tp_reaction_mean", "float64"), ("roam_count", "int64"),
+    ("roam_rate", "float64"), ("roam_success_rate", "float64"),
+    ("team_blue_objectives", "int64"), ("team_red_objectives", "int64"),
+]
+
 
 def safe_mean(xs):
     return mean(xs) if xs else 0.0
@@ -18,76 +29,88 @@ def safe_div(a, b):
     return a / b if b else 0.0
 
 
-with open(IN_FILE, "r", encoding="utf-8") as fh, open(OUT_FILE, "w", newline='', encoding="utf-8") as outfh:
-    writer = None
-    for line in fh:
-        match = json.loads(line)
-        match_id = match["match_id"]
-        duration_min = match["summary"]["duration_min"]
-        player_events = match["player_events"]
-
-        # derive team objective counts
-        blue_objs = sum(1 for o in match["summary"]["objectives"] if o["winner"] == "BLUE")
-        red_objs = sum(1 for o in match["summary"]["objectives"] if o["winner"] == "RED")
-
-        for pid, evs in player_events.items():
-            cs_events = [e for e in evs if e["type"] == "cs"]
-            kills = sum(1 for e in evs if e["type"] == "kill")
-            assists = sum(1 for e in evs if e["type"] == "assist")
-            wards_placed = sum(1 for e in evs if e["type"] == "ward_place")
-            wards_cleared = sum(1 for e in evs if e["type"] == "ward_clear")
-
+def player_features(match_id, duration_min, blue_objs, red_objs, pid, evs):
+    """Feature row for one player's match events; every counter comes from a single pass."""
+    cs_total = kills = assists = wards_placed = wards_cleared = 0
+    roam_count = roam_outcomes = roam_success = 0
+    tp_reactions = []
+    for e in evs:
+        event_type = e["type"]
+        if event_type == "cs":
+            cs_total += 1
+        elif event_type == "kill":
+            kills += 1
+        elif event_type == "assist":
+            assists += 1
+        elif event_type == "ward_place":
+            wards_placed += 1
+        elif event_type == "ward_clear":
+            wards_cleared += 1
+        elif event_type == "tp_start":
             # TP reaction time: difference between tp_call and player's tp_start when present
-            tp_starts = [e for e in evs if e["type"] == "tp_start"]
-            tp_reactions = []
-            for e in tp_starts:
-                call_ts = e.get("call_ts")
-                if call_ts is not None:
-                    tp_reactions.append(max(0.0, e["t"] - call_ts))
-            tp_reaction_mean = safe_mean(tp_reactions)
-
-            # Roam success rate
-            roam_starts = [e for e in evs if e["type"] == "roam_start"]
-            roam_outcomes = [e for e in evs if e["type"] == "roam_outcome"]
-            roam_success = sum(1 for e in roam_outcomes if e.get("success"))
-            roam_rate = safe_div(len(roam_starts), duration_min)
-            roam_success_rate = safe_div(roam_success, max(1, len(roam_outcomes)))
-
-            # CS and gold proxies
-            cs_total = len(cs_events)
-            cs_per_min = safe_div(cs_total, duration_min)
-            kda = safe_div(kills + assists, 1)  # deaths not tracked in Sample, use KA as a simple proxy
-
-            # Vision score proxy
-            vision_actions = wards_placed + wards_cleared
-            vision_per_min = safe_div(vision_actions, duration_min)
-
-            # Team objective influence proxy (share team objectives equally to players of that team not available here; keep match-level for now)
-            feat = {
-                "match_id": match_id,
-                "player_id": pid,
-                "duration_min": duration_min,
-                "cs_total": cs_total,
-                "cs_per_min": round(cs_per_min, 3),
-                "kills": kills,
-                "assists": assists,
-                "ka_sum": kills + assists,
-                "kda_proxy": kda,
-                "wards_placed": wards_placed,
-                "wards_cleared": wards_cleared,
-                "vision_per_min": round(vision_per_min, 3),
-                "tp_reaction_mean": round(tp_reaction_mean, 3),
-                "roam_count": len(roam_starts),
-                "roam_rate": round(roam_rate, 3),
-                "roam_success_rate": round(roam_success_rate, 3),
-                "team_blue_objectives": blue_objs,
-                "team_red_objectives": red_objs,
-            }
-
-            if writer is None:
-                writer = csv.DictWriter(outfh, fieldnames=list(feat.keys()))
-                writer.writeheader()
-            writer.writerow(feat)
-
-print(f"Wrote LoL features to {OUT_FILE}")
-
+            call_ts = e.get("call_ts")
+            if call_ts is not None:
+                tp_reactions.append(max(0.0, e["t"] - call_ts))
+        elif event_type == "roam_start":
+            roam_count += 1
+        elif event_type == "roam_outcome":
+            roam_outcomes += 1
+            if e.get("success"):
+                roam_success += 1
+
+    tp_reaction_mean = safe_mean(tp_reactions)
+
+    # Roam success rate
+    roam_rate = safe_div(roam_count, duration_min)
+    roam_success_rate = safe_div(roam_success, max(1, roam_outcomes))
+
+    # CS and gold proxies
+    cs_per_min = safe_div(cs_total, duration_min)
+    kda = safe_div(kills + assists, 1)  # deaths not tracked in Sample, use KA as a simple proxy
+
+    # Vision score proxy
+    vision_actions = wards_placed + wards_cleared
+    vision_per_min = safe_div(vision_actions, duration_min)
+
+    # Team objective influence proxy (share team objectives equally to players of that team not available here; keep match-level for now)
+    return {
+        "match_id": match_id,
+        "player_id": pid,
+        "duration_min": duration_min,
+        "cs_total": cs_total,
+        "cs_per_min": round(cs_per_min, 3),
+        "kills": kills,
+        "assists": assists,
+        "ka_sum": kills + assists,
+        "kda_proxy": kda,
+        "wards_placed": wards_placed,
+        "wards_cleared": wards_cleared,
+        "vision_per_min": round(vision_per_min, 3),
+        "tp_reaction_mean": round(tp_reaction_mean, 3),
+        "roam_count": roam_count,
+        "roam_rate": round(roam_rate, 3),
+        "roam_success_rate": round(roam_success_rate, 3),
+        "team_blue_objectives": blue_objs,
+        "team_red_objectives": red_objs,
+    }
+
+
+def match_features(match):
+    """One parsed JSONL match -> one feature row per player."""
+    duration_min = match["summary"]["duration_min"]
+
+    # derive team objective counts
+    blue_objs = red_objs = 0
+    for o in match["summary"]["objectives"]:
+        if o["winner"] == "BLUE":
+            blue_objs += 1
+        elif o["winner"] == "RED":
+            red_objs += 1
+
+    return [player_features(match["match_id"], duration_min, blue_objs, red_objs, pid, evs)
+            for pid, evs in match["player_events"].items()]
+
+
+if __name__ == "__main__":
+    run_cli(match_features, FEATURE_SCHEMA, IN_FILE, OUT_FILE,
+            description="Extract per-player-match LoL features from a matches JSONL file", label="LoL features")
@@ -0,0 +1,287 @@
+"""
+Batch feature extraction: match JSON files -> partitioned Parquet dataset.
+
+Fans match files out over a ProcessPoolExecutor (at most --max-in-flight files queued at
+once). Each worker loads a file, computes compute_player_round_features_batch for the
+matches in it and writes one Parquet part per (game, date) partition:
+
+    <out>/game=valorant/date=2024-03-01/part-<file hash>.parquet
+
+The parent appends one line per finished file to <out>/_manifest.jsonl (path, size, mtime,
+rows, parts, or the error). A re-run skips files whose size and mtime match an "ok"
+entry, so an interrupted build resumes where it stopped; changed files are reprocessed
+and their old parts replaced, failed files are retried.
+
+A file may hold one match object, a list of matches, or {"matches": [...]}.
+
+With --cache-dir, per-match features go through the content-addressed FeatureCache
+(feature_cache.py): matches whose payload, feature code and parameters are unchanged are
+read back instead of recomputed, so a rebuild into a fresh --out (or with --force) only
+computes new or changed matches.
+
+Usage:
+    python server/batch_feature_engineering.py server/data/matches/ 'archive/**/*.json' \\
+        --out features_parquet [--workers 8] [--max-in-flight 16] [--no-positional] [--force]
+        [--cache-dir ~/.cache/esports-features --cache-max-bytes 20G]
+
+Every part is written with one Arrow schema (part_schema): the full feature column list
+with fixed types, positional columns null for matches without replayFrames. Read back
+with pandas.read_parquet("features_parquet") (game/date come back as columns).
+"""
+import argparse
+import glob
+import hashlib
+import json
+import os
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+sys.path.insert(0, os.path.dirname(__file__))
+
+from feature_cache import FeatureCache, parse_size
+from feature_engineering import compute_player_round_features_batch, feature_dtypes
+
+MANIFEST = "_manifest.jsonl"
+
+_caches: Dict[Tuple[str, Optional[int]], FeatureCache] = {}  # one per worker process
+
+
+def find_match_files(inputs: Iterable[str]) -> List[str]:
+    """Directories (searched recursively for *.json), files and glob patterns -> sorted unique paths."""
+    paths = set()
+    for item in inputs:
+        if os.path.isdir(item):
+            matches = glob.glob(os.path.join(item, "**", "*.json"), recursive=True)
+        else:
+            matches = glob.glob(item, recursive=True) if glob.has_magic(item) else [item]
+        paths.update(os.path.abspath(p) for p in matches if os.path.isfile(p))
+    return sorted(paths)
+
+
+def load_matches(json_path: str) -> List[Dict[str, Any]]:
+    with open(json_path, "r") as f:
+        data = json.load(f)
+    if isinstance(data, dict):
+        data = data["matches"] if isinstance(data.get("matches"), list) else [data]
+    return [m for m in data if isinstance(m, dict) and m.get("rounds") and isinstance(m["rounds"], list)]
+
+
+def match_partition(match: Dict[str, Any]) -> Tuple[str, str]:
+    """(game, UTC date of startedAt) for a match; 'unknown' date when startedAt is missing or unparseable."""
+    game = str(match.get("game") or "valorant").lower()
+    started_at = match.get("startedAt")
+    if isinstance(started_at, (int, float)) and not isinstance(started_at, bool):
+        date = datetime.fromtimestamp(started_at, timezone.utc).date().isoformat()
+    elif started_at:
+        ts = pd.to_datetime(started_at, utc=True, errors="coerce")
+        date = "unknown" if pd.isna(ts) else ts.date().isoformat()
+    else:
+        date = "unknown"
+    return game, date
+
+
+def _file_state(path: str) -> Dict[str, int]:
+    st = os.stat(path)
+    return {"size": st.st_size, "mtime_ns": st.st_mtime_ns}
+
+
+_ARROW_TYPES = {'i': pa.int64(), 'u': pa.int64(), 'f': pa.float64(), 'b': pa.bool_()}
+
+_schemas: Dict[bool, pa.Schema] = {}  # include_positional -> part schema, one per worker process
+
+
+def part_schema(include_positional: bool) -> pa.Schema:
+    """
+    Arrow schema every part of a dataset is written with: the full feature column list
+    (positional columns included whether or not a file's matches have replayFrames) and
+    one type per column (feature_dtypes), so pd.read_parquet(out) sees the same schema in
+    every fragment.
+    """
+    schema = _schemas.get(include_positional)
+    if schema is None:
+        schema = _schemas[include_positional] = pa.schema(
+            [(col, _ARROW_TYPES.get(dtype.kind, pa.string()))
+             for col, dtype in feature_dtypes(include_positional=include_positional).items()])
+    return schema
+
+
+def _write_part(df: pd.DataFrame, path: str, schema: pa.Schema):
+    """Write atomically with `schema`: missing feature columns become nulls, ints may hold nulls."""
+    df = df.reindex(columns=schema.names)
+    for field in schema:
+        if pa.types.is_string(field.type):
+            df[field.name] = df[field.name].astype(object).where(df[field.name].notna(), None)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f"{path}.tmp-{os.getpid()}"
+    # no per-part pandas metadata: it records each part's own dtypes and readers take the first one
+    pq.write_table(pa.Table.from_pandas(df, schema=schema, preserve_index=False).replace_schema_metadata(None), tmp)
+    os.replace(tmp, path)
+
+
+def _features(matches: List[Dict[str, Any]], include_positional: bool, cache: Optional[FeatureCache]) -> pd.DataFrame:
+    if cache is None:
+        return compute_player_round_features_batch(matches, include_positional=include_positional)
+    frames = [df for df in cache.get_or_compute_many(matches, include_positional=include_positional) if not df.empty]
+    return pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
+
+
+def process_file(json_path: str, out_dir: str, include_positional: bool = True,
+                 cache_dir: Optional[str] = None, cache_max_bytes: Optional[int] = None) -> Dict[str, Any]:
+    """Worker: one match file -> Parquet parts. Returns a manifest entry (status 'ok' or 'error')."""
+    start = time.perf_counter()
+    entry: Dict[str, Any] = {"path": json_path}
+    cache = None
+    if cache_dir:
+        cache = _caches.get((cache_dir, cache_max_bytes))
+        if cache is None:
+            cache = _caches[(cache_dir, cache_max_bytes)] = FeatureCache(cache_dir, cache_max_bytes)
+        hits_before = cache.hits
+    try:
+        # a file deleted or made unreadable since discovery is an error entry, not a dead worker
+        entry.update(_file_state(json_path))
+        by_partition: Dict[Tuple[str, str], List[Dict[str, Any]]] = {}
+        matches = load_matches(json_path)
+        for match in matches:
+            by_partition.setdefault(match_partition(match), []).append(match)
+        name = f"part-{hashlib.sha1(json_path.encode()).hexdigest()[:16]}.parquet"
+        parts, rows = [], 0
+        for (game, date), group in sorted(by_partition.items()):
+            df = _features(group, include_positional, cache)
+            if df.empty:
+                continue
+            part = os.path.join(f"game={game}", f"date={date}", name)
+            _write_part(df, os.path.join(out_dir, part), part_schema(include_positional))
+            parts.append(part)
+            rows += len(df)
+        entry.update(status="ok", matches=len(matches), rows=rows, parts=parts)
+    except Exception as e:
+        entry.update(status="error", error=f"{type(e).__name__}: {e}")
+    if cache is not None:
+        entry["cache_hits"] = cache.hits - hits_before
+    entry["seconds"] = round(time.perf_counter() - start, 3)
+    return entry
+
+
+def load_manifest(out_dir: str) -> Dict[str, Dict[str, Any]]:
+    """path -> latest manifest entry (the manifest is append-only; later lines win)."""
+    entries = {}
+    path = os.path.join(out_dir, MANIFEST)
+    if os.path.exists(path):
+        with open(path, "r") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue  # torn last line from an interrupted run
+                entries[entry["path"]] = entry
+    return entries
+
+
+def is_done(entry: Optional[Dict[str, Any]], path: str) -> bool:
+    if not entry or entry.get("status") != "ok":
+        return False
+    try:
+        state = _file_state(path)
+    except OSError:
+        return False  # gone since discovery: process_file records the error
+    return {k: entry.get(k) for k in ("size", "mtime_ns")} == state
+
+
+class Progress:
+    def __init__(self, total: int, interval: float):
+        self.total, self.interval = total, interval
+        self.files = self.matches = self.rows = self.errors = self.cache_hits = 0
+        self.start = self.last = time.perf_counter()
+
+    def add(self, entry: Dict[str, Any]):
+        self.files += 1
+        self.matches += entry.get("matches", 0)
+        self.rows += entry.get("rows", 0)
+        self.cache_hits += entry.get("cache_hits", 0)
+        if entry["status"] != "ok":
+            self.errors += 1
+            print(f"error: {entry['path']}: {entry['error']}")
+        now = time.perf_counter()
+        if now - self.last >= self.interval or self.files == self.total:
+            self.last = now
+            self.report(now)
+
+    def report(self, now: float):
+        elapsed = max(now - self.start, 1e-9)
+        eta = (self.total - self.files) * elapsed / max(self.files, 1)
+        print(f"[{self.files:>{len(str(self.total))}}/{self.total} files] {self.matches} matches {self.rows} rows"
+              f"  {self.files / elapsed:.1f} files/s {self.matches / elapsed:.1f} matches/s {self.rows / elapsed:.0f} rows/s"
+              f"  eta {eta:.0f}s  cache hits {self.cache_hits}  errors {self.errors}", flush=True)
+
+
+def run(inputs: Iterable[str], out_dir: str, workers: Optional[int] = None, max_in_flight: Optional[int] = None,
+        include_positional: bool = True, force: bool = False, report_interval: float = 5.0,
+        cache_dir: Optional[str] = None, cache_max_bytes: Optional[int] = None) -> Progress:
+    os.makedirs(out_dir, exist_ok=True)
+    files = find_match_files(inputs)
+    manifest = load_manifest(out_dir)
+    todo = files if force else [p for p in files if not is_done(manifest.get(p), p)]
+    print(f"{len(files)} match files, {len(files) - len(todo)} already in {os.path.join(out_dir, MANIFEST)}, "
+          f"{len(todo)} to process")
+
+    workers = workers or os.cpu_count() or 1
+    max_in_flight = max(1, max_in_flight or 2 * workers)
+    progress = Progress(len(todo), report_interval)
+    pending = iter(todo)
+    with open(os.path.join(out_dir, MANIFEST), "a") as log, ProcessPoolExecutor(max_workers=workers) as pool:
+        in_flight = set()
+        while True:
+            # keep the window full: bounded memory for queued arguments and returned entries
+            for path in pending:
+                # parts of a changed file may land in other partitions; drop the stale ones first
+                for part in (manifest.get(path) or {}).get("parts", []):
+                    try:
+                        os.remove(os.path.join(out_dir, part))
+                    except FileNotFoundError:
+                        pass
+                in_flight.add(pool.submit(process_file, path, out_dir, include_positional, cache_dir, cache_max_bytes))
+                if len(in_flight) >= max_in_flight:
+                    break
+            if not in_flight:
+                break
+            done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in done:
+                entry = future.result()
+                entry["finished_at"] = datetime.now(timezone.utc).isoformat()
+                log.write(json.dumps(entry) + "\n")
+                log.flush()
+                progress.add(entry)
+    return progress
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Extract player-round features from match JSONs into partitioned Parquet")
+    parser.add_argument("inputs", nargs="+", help="match JSON files, directories (recursive) or glob patterns")
+    parser.add_argument("--out", required=True, help="output dataset directory (holds the manifest)")
+    parser.add_argument("--workers", type=int, default=None, help="worker processes (default: CPU count)")
+    parser.add_argument("--max-in-flight", type=int, default=None, help="files queued at once (default: 2 x workers)")
+    parser.add_argument("--no-positional", action="store_true", help="skip replayFrames positional features")
+    parser.add_argument("--force", action="store_true", help="ignore the manifest and reprocess every file")
+    parser.add_argument("--report-interval", type=float, default=5.0, help="seconds between progress lines")
+    parser.add_argument("--cache-dir", default=None, help="reuse per-match features from this FeatureCache directory")
+    parser.add_argument("--cache-max-bytes", type=parse_size, default=None, help="LRU size limit for --cache-dir, e.g. 20G")
+    args = parser.parse_args()
+
+    progress = run(args.inputs, args.out, args.workers, args.max_in_flight,
+                   include_positional=not args.no_positional, force=args.force, report_interval=args.report_interval,
+                   cache_dir=args.cache_dir, cache_max_bytes=args.cache_max_bytes)
+    elapsed = time.perf_counter() - progress.start
+    print(f"done: {progress.files} files, {progress.matches} matches, {progress.rows} rows in {elapsed:.1f}s"
+          f" ({progress.errors} errors)")
+    sys.exit(1 if progress.errors else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,142 @@
+"""
+Benchmark compute_player_round_features: row-wise reference vs vectorized engine.
+
+Generates a deterministic synthetic Valorant dataset (same match schema as the Sample
+generator: players with baseSkill, rounds with buys / playerRoundResults / winner), checks
+that both engines agree, and reports time per match for
+
+  rowwise     compute_player_round_features(match, engine='rowwise')  (first --rowwise-matches)
+  vectorized  compute_player_round_features(match)                    (every match, one call each)
+  batch       compute_player_round_features_batch(matches)            (one call for the dataset)
+
+and, with --frames N, compute_positional_aggregates on one match with N replay frames
+(per-player loop vs (frames x players x 2) tensor, whole match and chunked).
+
+Usage:
+    python server/bench_feature_engineering.py [--matches 1000] [--rounds 24] [--rowwise-matches 50]
+                                               [--frames 5000] [--chunk-frames 512]
+"""
+import argparse
+import os
+import random
+import sys
+import time
+import warnings
+
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(__file__))
+
+from feature_engineering import (compute_player_round_features, compute_player_round_features_batch,
+                                 compute_positional_aggregates)
+
+BUY_TYPES = ['Eco', 'Pistol', 'Light', 'Partial', 'Force', 'Full']
+WEAPONS = ['Classic', 'Ghost', 'Sheriff', 'Spectre', 'Bulldog', 'Phantom', 'Vandal', 'Operator', None]
+PARITY_TOLERANCE = dict(check_exact=False, rtol=1e-9, atol=1e-12)
+
+
+def synthetic_match(seed: int, n_rounds: int = 24) -> dict:
+    """One 10-player match; sides swap at half, ~3% of player-rounds missing, some winners implicit."""
+    rng = random.Random(seed)
+    players = [{'id': f'm{seed}_p{i}', 'baseSkill': round(rng.uniform(0.3, 0.7), 3)} for i in range(10)]
+    if seed % 3 == 0:
+        del players[3]['baseSkill']
+    rounds = []
+    for rn in range(1, n_rounds + 1):
+        second_half = rn > n_rounds // 2
+        buys, results = [], []
+        for i, p in enumerate(players):
+            if rng.random() < 0.03:
+                continue
+            side = 'attackers' if (i < 5) != second_half else 'defenders'
+            buys.append({'playerId': p['id'], 'side': side, 'buyType': rng.choice(BUY_TYPES),
+                         'weapon': rng.choice(WEAPONS), 'spent': rng.choice([0, 400, 950, 2900, 3900, 4700]),
+                         'walletAfter': rng.randint(0, 9000)})
+            results.append({'playerId': p['id'], 'side': side, 'kills': rng.choice([0, 0, 0, 1, 1, 2, 3]),
+                            'planted': rng.random() < 0.1, 'defused': rng.random() < 0.05,
+                            'payout': rng.choice([1900, 2400, 3000])})
+        rnd = {'roundNumber': rn, 'buys': buys, 'playerRoundResults': results, 'winProbAttack': round(rng.random(), 3)}
+        if rng.random() < 0.8:
+            rnd['winner'] = rng.choice(['attackers', 'defenders'])
+        rounds.append(rnd)
+    return {'id': f'match_{seed}', 'players': players, 'rounds': rounds, 'startedAt': 1700000000 + seed * 3600}
+
+
+def synthetic_frames(match: dict, n_frames: int, seed: int = 0, gaps: bool = False) -> list:
+    """Replay frames for the match roster; gaps=True drops players from frames and adds NaN / unknown ids."""
+    rng = random.Random(seed)
+    ids = [p['id'] for p in match['players']] + (['spectator'] if gaps else [])
+    frames = []
+    for t in range(n_frames):
+        players = []
+        for pid in ids:
+            if gaps and rng.random() < 0.1:
+                continue
+            x = float('nan') if gaps and rng.random() < 0.05 else rng.uniform(0, 3000)
+            y = float('nan') if gaps and rng.random() < 0.02 else rng.uniform(0, 3000)
+            players.append({'id': pid, 'x': x, 'y': y})
+        frames.append({'tick': t, 'players': players})
+    return frames
+
+
+def bench_positional(n_frames: int, chunk_frames: int):
+    match = synthetic_match(0, n_rounds=2)
+    match['replayFrames'] = synthetic_frames(match, n_frames)
+    timings = {}
+    for name, kwargs in (("rowwise", dict(engine='rowwise')), ("tensor", dict(chunk_frames=None)),
+                         (f"chunk={chunk_frames}", dict(chunk_frames=chunk_frames))):
+        start = time.perf_counter()
+        result = compute_positional_aggregates(match, **kwargs)
+        timings[name] = time.perf_counter() - start
+        if name == "rowwise":
+            reference = result
+        else:
+            pd.testing.assert_frame_equal(reference, result, **PARITY_TOLERANCE)
+    print(f"\npositional aggregates, {n_frames} frames x 10 players (parity ok)")
+    for name, seconds in timings.items():
+        print(f"{name:10s} {seconds * 1e3:9.2f} ms   ({timings['rowwise'] / seconds:6.1f}x)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark row-wise vs vectorized player-round features")
+    parser.add_argument("--matches", type=int, default=1000)
+    parser.add_argument("--rounds", type=int, default=24)
+    parser.add_argument("--rowwise-matches", type=int, default=50,
+                        help="matches timed (and parity-checked) on the slow row-wise path; 0 = all")
+    parser.add_argument("--frames", type=int, default=0, help="also benchmark positional aggregates on N frames")
+    parser.add_argument("--chunk-frames", type=int, default=512)
+    args = parser.parse_args()
+    warnings.simplefilter("ignore")  # pandas FutureWarnings from the row-wise groupby.apply calls
+
+    matches = [synthetic_match(seed, args.rounds) for seed in range(args.matches)]
+    n_rowwise = args.rowwise_matches or args.matches
+    print(f"{args.matches} matches x {args.rounds} rounds x 10 players (positional features off)\n")
+
+    start = time.perf_counter()
+    reference = [compute_player_round_features(m, include_positional=False, engine='rowwise') for m in matches[:n_rowwise]]
+    rowwise_s = (time.perf_counter() - start) / n_rowwise
+
+    start = time.perf_counter()
+    single = [compute_player_round_features(m, include_positional=False) for m in matches]
+    single_s = (time.perf_counter() - start) / args.matches
+
+    start = time.perf_counter()
+    batch = compute_player_round_features_batch(matches, include_positional=False)
+    batch_s = (time.perf_counter() - start) / args.matches
+
+    for ref, got in zip(reference, single):
+        pd.testing.assert_frame_equal(ref, got, **PARITY_TOLERANCE)
+    expected = pd.concat(reference, ignore_index=True)
+    pd.testing.assert_frame_equal(expected, batch.iloc[:len(expected)].reset_index(drop=True), **PARITY_TOLERANCE)
+    print(f"parity ok on {n_rowwise} matches ({len(expected.columns)} columns)\n")
+
+    for name, per_match in (("rowwise", rowwise_s), ("vectorized", single_s), ("batch", batch_s)):
+        print(f"{name:10s} {per_match * 1e3:9.2f} ms/match   {per_match * args.matches:8.2f} s/{args.matches} matches"
+              f"   ({rowwise_s / per_match:6.1f}x)")
+
+    if args.frames:
+        bench_positional(args.frames, args.chunk_frames)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,265 @@
+"""
+Content-addressed on-disk cache for compute_player_round_features results.
+
+Entries are Arrow IPC (Feather, lz4) files laid out as
+
+    <cache_dir>/<code version>/<match hash[:2]>/<match hash>-<params hash>.arrow
+
+  match hash    sha256 of the canonical JSON of the match payload
+  params hash   sha256 of (rolling_windows, include_positional)
+  code version  FEATURE_SET_VERSION plus a hash of feature_engineering.py, so editing the
+                feature code (or bumping the constant) starts a fresh namespace
+
+Arrow IPC rather than Parquet because hits are the hot path: a 24-round match reads back
+in ~3 ms vs ~9 ms for the same frame as Parquet, at about the same size.
+
+A file's mtime is its last use (refreshed on every hit); when the cache grows past
+max_bytes the least recently used entries are evicted down to 90% of the limit. Size
+accounting is per process, so several workers sharing a directory may briefly overshoot.
+
+    cache = FeatureCache("~/.cache/esports-features", max_bytes=5 << 30)
+    df = cache.get_or_compute(match)
+    frames = cache.get_or_compute_many(matches)   # misses computed in one batch call
+
+Maintenance:
+    python server/feature_cache.py --cache-dir DIR stats
+    python server/feature_cache.py --cache-dir DIR prune --max-bytes 2G
+    python server/feature_cache.py --cache-dir DIR invalidate (--all | --stale | --match FILE [FILE ...])
+"""
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import sys
+import time
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(__file__))
+
+import feature_engineering
+from feature_engineering import (FEATURE_SET_VERSION, compute_player_round_features,
+                                 compute_player_round_features_batch, has_positional_input,
+                                 restore_int_columns)
+
+LOW_WATER = 0.9  # evict down to this fraction of max_bytes
+
+
+def _sha256(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+def feature_code_version() -> str:
+    with open(feature_engineering.__file__, "rb") as f:
+        return f"v{FEATURE_SET_VERSION}-{_sha256(f.read())[:12]}"
+
+
+def match_hash(match: Dict[str, Any]) -> str:
+    return _sha256(json.dumps(match, sort_keys=True, separators=(",", ":"), default=str).encode())
+
+
+def params_hash(rolling_windows: Iterable[int], include_positional: bool) -> str:
+    params = {"rolling_windows": [int(w) for w in rolling_windows], "include_positional": bool(include_positional)}
+    return _sha256(json.dumps(params, sort_keys=True).encode())[:16]
+
+
+def parse_size(text: str) -> int:
+    """'512M', '5G', '1048576' -> bytes."""
+    units = {"K": 1 << 10, "M": 1 << 20, "G": 1 << 30, "T": 1 << 40}
+    text = text.strip().upper().rstrip("B")
+    return int(float(text[:-1]) * units[text[-1]]) if text and text[-1] in units else int(text)
+
+
+class FeatureCache:
+    def __init__(self, cache_dir: str, max_bytes: Optional[int] = None, version: Optional[str] = None):
+        self.cache_dir = os.path.expanduser(cache_dir)
+        self.max_bytes = max_bytes
+        self.version = version or feature_code_version()
+        self.hits = self.misses = 0
+        self._size: Optional[int] = None  # bytes on disk, scanned lazily
+
+    # ---------- paths ----------
+
+    def entry_path(self, mhash: str, phash: str) -> str:
+        return os.path.join(self.cache_dir, self.version, mhash[:2], f"{mhash}-{phash}.arrow")
+
+    def _entries(self, versions: Optional[Iterable[str]] = None) -> List[Tuple[str, os.stat_result]]:
+        out = []
+        if not os.path.isdir(self.cache_dir):
+            return out
+        for version in (versions if versions is not None else os.listdir(self.cache_dir)):
+            vdir = os.path.join(self.cache_dir, version)
+            for root, _dirs, files in os.walk(vdir):
+                for name in files:
+                    if name.endswith(".arrow"):
+                        path = os.path.join(root, name)
+                        try:
+                            out.append((path, os.stat(path)))
+                        except FileNotFoundError:
+                            pass  # evicted by another process
+        return out
+
+    # ---------- get / put ----------
+
+    def get(self, match: Dict[str, Any], rolling_windows: List[int] = [3,5,10],
+            include_positional: bool = True) -> Optional[pd.DataFrame]:
+        return self._read(self.entry_path(match_hash(match), params_hash(rolling_windows, include_positional)))
+
+    def put(self, match: Dict[str, Any], df: pd.DataFrame, rolling_windows: List[int] = [3,5,10],
+            include_positional: bool = True):
+        self._write(self.entry_path(match_hash(match), params_hash(rolling_windows, include_positional)), df)
+
+    def get_or_compute(self, match: Dict[str, Any], rolling_windows: List[int] = [3,5,10],
+                       include_positional: bool = True) -> pd.DataFrame:
+        path = self.entry_path(match_hash(match), params_hash(rolling_windows, include_positional))
+        df = self._read(path)
+        if df is None:
+            df = compute_player_round_features(match, rolling_windows, include_positional)
+            self._write(path, df)
+        return df
+
+    def get_or_compute_many(self, matches: List[Dict[str, Any]], rolling_windows: List[int] = [3,5,10],
+                            include_positional: bool = True) -> List[pd.DataFrame]:
+        """
+        One frame per match, in order. Misses are computed together with
+        compute_player_round_features_batch (matches with and without positional output in
+        separate calls, so each frame has the columns a single-match call gives). Int
+        columns a peer's NaN turned float are cast back per match, so an entry does not
+        depend on which other matches missed with it.
+        """
+        phash = params_hash(rolling_windows, include_positional)
+        paths = [self.entry_path(match_hash(m), phash) for m in matches]
+        frames: List[Optional[pd.DataFrame]] = [self._read(p) for p in paths]
+        groups: Dict[bool, List[int]] = {}
+        for i, df in enumerate(frames):
+            if df is None:
+                groups.setdefault(include_positional and has_positional_input(matches[i]), []).append(i)
+        for missed in groups.values():
+            batch = compute_player_round_features_batch([matches[i] for i in missed], rolling_windows,
+                                                        include_positional, match_index=True)
+            by_match = dict(tuple(batch.groupby('_m', sort=False))) if not batch.empty else {}
+            for k, i in enumerate(missed):
+                part = by_match.get(k)
+                df = pd.DataFrame() if part is None else restore_int_columns(
+                    part.drop(columns='_m').reset_index(drop=True), rolling_windows, include_positional)
+                self._write(paths[i], df)
+                frames[i] = df
+        return frames
+
+    def _read(self, path: str) -> Optional[pd.DataFrame]:
+        try:
+            df = pd.read_feather(path) if os.path.getsize(path) else pd.DataFrame()
+            os.utime(path)  # LRU: mtime is last use
+        except (FileNotFoundError, OSError, ValueError):
+            # missing, evicted mid-read, or a torn write: treat as a miss
+            self.misses += 1
+            return None
+        self.hits += 1
+        return df
+
+    def _write(self, path: str, df: pd.DataFrame):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.tmp-{os.getpid()}"
+        if df.columns.empty:
+            open(tmp, "wb").close()  # a match without player rounds: empty file, read back as DataFrame()
+        else:
+            df.to_feather(tmp)
+        os.replace(tmp, path)
+        if self.max_bytes is not None:
+            if self._size is None:
+                self._size = self.size()
+            else:
+                self._size += os.path.getsize(path)
+            if self._size > self.max_bytes:
+                self.prune(int(self.max_bytes * LOW_WATER))
+
+    # ---------- maintenance ----------
+
+    def size(self) -> int:
+        return sum(st.st_size for _path, st in self._entries())
+
+    def stats(self) -> Dict[str, Any]:
+        versions: Dict[str, Dict[str, int]] = {}
+        for path, st in self._entries():
+            version = os.path.relpath(path, self.cache_dir).split(os.sep)[0]
+            v = versions.setdefault(version, {"entries": 0, "bytes": 0})
+            v["entries"] += 1
+            v["bytes"] += st.st_size
+        return {"cache_dir": self.cache_dir, "current_version": self.version, "versions": versions,
+                "entries": sum(v["entries"] for v in versions.values()),
+                "bytes": sum(v["bytes"] for v in versions.values())}
+
+    def prune(self, max_bytes: int) -> int:
+        """Evict least recently used entries (any version) until the cache fits in max_bytes; returns files removed."""
+        entries = sorted(self._entries(), key=lambda e: e[1].st_mtime)
+        total = sum(st.st_size for _path, st in entries)
+        removed = 0
+        for path, st in entries:
+            if total <= max_bytes:
+                break
+            try:
+                os.remove(path)
+                removed += 1
+            except FileNotFoundError:
+                pass
+            total -= st.st_size
+        self._size = total
+        return removed
+
+    def invalidate(self, matches: Optional[Iterable[Dict[str, Any]]] = None, stale: bool = False) -> int:
+        """
+        Remove entries: for the given matches (every version and parameter set), or with
+        stale=True every version but the current one, or with neither the whole cache.
+        Returns files removed.
+        """
+        removed = 0
+        if matches is not None:
+            prefixes = {match_hash(m) for m in matches}
+            for path, _st in self._entries():
+                if os.path.basename(path).split("-")[0] in prefixes:
+                    os.remove(path)
+                    removed += 1
+        elif os.path.isdir(self.cache_dir):
+            for version in os.listdir(self.cache_dir):
+                if stale and version == self.version:
+                    continue
+                removed += len(self._entries([version]))
+                shutil.rmtree(os.path.join(self.cache_dir, version), ignore_errors=True)
+        self._size = None
+        return removed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Inspect, prune and invalidate the player-round feature cache")
+    parser.add_argument("--cache-dir", required=True)
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("stats", help="entries and bytes per feature-code version")
+    prune = sub.add_parser("prune", help="evict least recently used entries down to a size")
+    prune.add_argument("--max-bytes", required=True, type=parse_size, help="e.g. 500M, 5G")
+    inv = sub.add_parser("invalidate", help="drop cached features")
+    which = inv.add_mutually_exclusive_group(required=True)
+    which.add_argument("--all", action="store_true", help="everything")
+    which.add_argument("--stale", action="store_true", help="entries from other feature-code versions")
+    which.add_argument("--match", nargs="+", metavar="FILE", help="matches in these JSON files")
+    args = parser.parse_args()
+
+    cache = FeatureCache(args.cache_dir)
+    start = time.perf_counter()
+    if args.command == "stats":
+        print(json.dumps(cache.stats(), indent=2))
+        return
+    if args.command == "prune":
+        removed = cache.prune(args.max_bytes)
+    elif args.match:
+        from batch_feature_engineering import load_matches
+        removed = cache.invalidate([m for path in args.match for m in load_matches(path)])
+    else:
+        removed = cache.invalidate(stale=args.stale)
+    print(f"removed {removed} entries in {time.perf_counter() - start:.2f}s; "
+          f"{cache.size() / (1 << 20):.1f} MiB left in {cache.cache_dir}")
+
+
+if __name__ == "__main__":
+    main()
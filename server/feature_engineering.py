@@ -23,6 +23,10 @@ from scipy.stats import entropy as sc_entropy
 import math
 import os
 
+# Bump when feature definitions change in a way the source hash would not capture
+# (e.g. a dependency upgrade that changes results); invalidates the feature cache.
+FEATURE_SET_VERSION = 1
+
 # ---------- Utilities ----------
 
 def safe_div(a, b, eps=1e-9):
@@ -39,6 +43,21 @@ def build_base_player_round_df(match: Dict[str, Any]) -> pd.DataFrame:
     """
     Create a DataFrame with one row per player per round combining buys and playerRoundResults.
     """
+    df = pd.DataFrame(_player_round_rows(match))
+    if df.empty:
+        return df
+    df = df.sort_values(['playerId', 'roundNumber']).reset_index(drop=True)
+    return _cast_base_types(df)
+
+def _cast_base_types(df: pd.DataFrame) -> pd.DataFrame:
+    # ensure types
+    df['roundNumber'] = df['roundNumber'].astype(int)
+    df['kills'] = df['kills'].astype(int)
+    df['spent'] = df['spent'].astype(float)
+    df['walletAfter'] = df['walletAfter'].astype(float)
+    return df
+
+def _player_round_rows(match: Dict[str, Any]) -> List[Dict[str, Any]]:
     rows = []
     match_id = match.get('id', 'unknown')
     # create quick lookup for player base skill
@@ -82,21 +101,15 @@ def build_base_player_round_df(match: Dict[str, Any]) -> pd.DataFrame:
             # augment with player base skill if available
             row['baseSkill'] = player_skill.get(player_id, np.nan)
             rows.append(row)
-
-    df = pd.DataFrame(rows)
-    if df.empty:
-        return df
-    df = df.sort_values(['playerId', 'roundNumber']).reset_index(drop=True)
-    # ensure types
-    df['roundNumber'] = df['roundNumber'].astype(int)
-    df['kills'] = df['kills'].astype(int)
-    df['spent'] = df['spent'].astype(float)
-    df['walletAfter'] = df['walletAfter'].astype(float)
-    return df
+    return rows
 
 # ---------- Frame-based positional features (optional) ----------
 
-def compute_positional_aggregates(match: Dict[str, Any], radius_threshold=800.0) -> pd.DataFrame:
+POSITIONAL_CHUNK_FRAMES = 4096  # frames per distance block: chunk x players x players floats
+
+def compute_positional_aggregates(match: Dict[str, Any], radius_threshold=800.0,
+                                  engine: str = 'vectorized',
+                                  chunk_frames: Optional[int] = POSITIONAL_CHUNK_FRAMES) -> pd.DataFrame:
     """
     Compute per-player aggregate positional features across the whole match from replayFrames:
       - avg_distance_to_teammates
@@ -105,28 +118,92 @@ def compute_positional_aggregates(match: Dict[str, Any], radius_threshold=800.0)
       - time_in_high_risk_zone (proxied by being within 'radius_threshold' of many opponents)
     Return DataFrame indexed by playerId with these features.
     If replayFrames missing or empty, returns empty df.
+
+    engine='vectorized' (default) converts the frames once into a (frames x players x 2)
+    tensor and computes all pairwise distances with broadcasting, `chunk_frames` frames at
+    a time (None = whole match in one block); engine='rowwise' runs the original per-player
+    loop. Both return the same values.
     """
+    if engine == 'rowwise':
+        return compute_positional_aggregates_rowwise(match, radius_threshold)
+    if engine != 'vectorized':
+        raise ValueError(f"unknown engine: {engine!r}")
     frames = match.get('replayFrames') or []
     if not frames:
         return pd.DataFrame()
+    positions = _frame_positions(frames)
+    side_map = _positional_side_map(match)
+    if side_map is None:
+        return pd.DataFrame()
 
-    # Build positions per tick per player into dict: playerId -> list of (x,y)
+    pids = list(positions)
+    lengths = np.array([len(c) for c in positions.values()])
+    coords = _position_tensor(positions, lengths)
+    sides = np.empty(len(pids), dtype=object)
+    sides[:] = [side_map.get(pid) for pid in pids]
+    known = np.array([pid in side_map for pid in pids])
+    # relation[i, j]: whether player j counts as a teammate / enemy of player i
+    same_side = sides[:, None] == sides[None, :]
+    teammate = same_side & known[None, :] & ~np.eye(len(pids), dtype=bool)
+    enemy = ~same_side & known[None, :]
+
+    sums = np.zeros((2, len(pids)))    # sum over frames of the per-frame mean distance (team, enemy)
+    counts = np.zeros((2, len(pids)))  # frames contributing to each sum
+    high_risk = np.zeros(len(pids))
+    step = chunk_frames or len(coords)
+    for start in range(0, len(coords), step):
+        block = coords[start:start + step]
+        own = ~np.isnan(block[:, :, 0]) & (np.arange(start, start + len(block))[:, None] < lengths[None, :])
+        present = ~np.isnan(block[:, :, 0])
+        dist = np.hypot(block[:, :, None, 0] - block[:, None, :, 0], block[:, :, None, 1] - block[:, None, :, 1])
+        for k, relation in enumerate((teammate, enemy)):
+            mask = relation[None, :, :] & present[:, None, :]
+            n = mask.sum(axis=2)
+            total = np.where(mask, dist, 0.0).sum(axis=2)
+            use = own & (n > 0)
+            sums[k] += np.where(use, total / np.maximum(n, 1), 0.0).sum(axis=0)
+            counts[k] += use.sum(axis=0)
+            if relation is enemy:
+                near = (mask & (dist < radius_threshold)).sum(axis=2)
+                high_risk += (own & (near >= 2)).sum(axis=0)
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        avg = np.where(counts > 0, sums / counts, np.nan)
+    rows = []
+    for i, pid in enumerate(pids):
+        raw = coords[:lengths[i], i]
+        pts = raw[~np.isnan(raw[:, 0])]
+        if pts.size == 0:
+            rows.append({'playerId': pid, 'pos_avg_distance_to_teammates': np.nan, 'pos_avg_distance_to_enemies': np.nan,
+                         'pos_entropy': np.nan, 'pos_time_in_high_risk_ratio': np.nan})
+            continue
+        rows.append({
+            'playerId': pid,
+            'pos_avg_distance_to_teammates': float(avg[0, i]),
+            'pos_avg_distance_to_enemies': float(avg[1, i]),
+            'pos_entropy': _position_entropy(pts),
+            'pos_time_in_high_risk_ratio': float(safe_div(high_risk[i], max(1, lengths[i])))
+        })
+    return pd.DataFrame(rows).set_index('playerId')
+
+def _frame_positions(frames: List[Dict[str, Any]]) -> Dict[Any, list]:
+    """playerId -> list of (x, y), one entry per frame the player appears in."""
     positions = {}
     for f in frames:
-        players = f.get('players', [])
-        for p in players:
-            pid = p.get('id')
-            if pid not in positions:
-                positions[pid] = []
-            positions[pid].append((p.get('x', np.nan), p.get('y', np.nan)))
+        for p in f.get('players', []):
+            positions.setdefault(p.get('id'), []).append((p.get('x', np.nan), p.get('y', np.nan)))
+    return positions
 
-    # Precompute enemies/teammates from match players sides
-    # derive sides mapping from round 1 buys if available; fallback: assign first 5 players as attackers
-    side_map = {}
+def has_positional_input(match: Dict[str, Any]) -> bool:
+    """Whether compute_positional_aggregates returns rows (adds pos_* columns) for this match."""
+    return bool(match.get('replayFrames')) and bool(match.get('players'))
+
+def _positional_side_map(match: Dict[str, Any]) -> Optional[Dict[Any, Any]]:
+    """Side per player from round 1 buys, else first 5 players attack; None when the match has no players."""
     all_players = [p['id'] for p in match.get('players', [])]
     if not all_players:
-        return pd.DataFrame()
-    # find first round buys if available
+        return None
+    side_map = {}
     first_round = (match.get('rounds') or [None])[0]
     if first_round and 'buys' in first_round:
         for b in first_round['buys']:
@@ -134,6 +211,52 @@ def compute_positional_aggregates(match: Dict[str, Any], radius_threshold=800.0)
     else:
         for i, pid in enumerate(all_players):
             side_map[pid] = 'attackers' if i < 5 else 'defenders'
+    return side_map
+
+def _position_tensor(positions: Dict[Any, list], lengths: np.ndarray) -> np.ndarray:
+    """
+    Dense (samples x players x 2) float tensor: sample k of each player is its k-th recorded
+    position (the frame index when every frame lists every player); players with fewer
+    samples are forward-filled with their last one. Missing coordinates stay NaN.
+    """
+    coords = np.full((int(lengths.max()), len(positions), 2), np.nan)
+    for j, samples in enumerate(positions.values()):
+        arr = np.array(samples, dtype=float).reshape(-1, 2)
+        coords[:len(arr), j] = arr
+        coords[len(arr):, j] = arr[-1]
+    return coords
+
+def _position_entropy(pts: np.ndarray) -> float:
+    """Spatial entropy of positions binned into a coarse 10x10 grid."""
+    xs = pts[:, 0]
+    ys = pts[:, 1]
+    try:
+        x_bins = np.linspace(np.nanmin(xs), np.nanmax(xs) + 1e-9, 10)
+        y_bins = np.linspace(np.nanmin(ys), np.nanmax(ys) + 1e-9, 10)
+        hx, _ = np.histogramdd(pts, bins=(x_bins, y_bins))
+        flat = hx.flatten()
+        ps = flat / (flat.sum() + 1e-9)
+        return float(sc_entropy(ps + 1e-12, base=2))
+    except Exception:
+        return np.nan
+
+def compute_positional_aggregates_rowwise(match: Dict[str, Any], radius_threshold=800.0) -> pd.DataFrame:
+    """
+    Per-player loop reference for compute_positional_aggregates (quadratic in players and
+    frames); kept for parity checks.
+    """
+    frames = match.get('replayFrames') or []
+    if not frames:
+        return pd.DataFrame()
+
+    # Build positions per tick per player into dict: playerId -> list of (x,y)
+    positions = _frame_positions(frames)
+
+    # Precompute enemies/teammates from match players sides
+    # derive sides mapping from round 1 buys if available; fallback: assign first 5 players as attackers
+    side_map = _positional_side_map(match)
+    if side_map is None:
+        return pd.DataFrame()
 
     # compute aggregates
     rows = []
@@ -204,18 +327,7 @@ def compute_positional_aggregates(match: Dict[str, Any], radius_threshold=800.0)
         risk_ratio = safe_div(high_risk_counts, max(1, len(coords)))
 
         # spatial entropy: bin positions into coarse grid and compute entropy
-        xs = pts[:, 0]
-        ys = pts[:, 1]
-        # create 10x10 grid bounds
-        try:
-            x_bins = np.linspace(np.nanmin(xs), np.nanmax(xs) + 1e-9, 10)
-            y_bins = np.linspace(np.nanmin(ys), np.nanmax(ys) + 1e-9, 10)
-            hx, _ = np.histogramdd(pts, bins=(x_bins, y_bins))
-            flat = hx.flatten()
-            ps = flat / (flat.sum() + 1e-9)
-            pos_entropy = float(sc_entropy(ps + 1e-12, base=2))
-        except Exception:
-            pos_entropy = np.nan
+        pos_entropy = _position_entropy(pts)
 
         rows.append({
             'playerId': pid,
@@ -232,10 +344,29 @@ def compute_positional_aggregates(match: Dict[str, Any], radius_threshold=800.0)
 
 def compute_player_round_features(match: Dict[str, Any],
                                   rolling_windows: List[int] = [3,5,10],
-                                  include_positional: bool = True) -> pd.DataFrame:
+                                  include_positional: bool = True,
+                                  engine: str = 'vectorized') -> pd.DataFrame:
     """
     Compute a broad set (50+) of engineered features for each (player, round) in the match.
 
+    engine='vectorized' (default) builds per-(round, side) tables once and attaches them
+    with indexed lookups (see compute_player_round_features_batch); engine='rowwise' runs
+    the original row-by-row reference implementation. Both return the same columns.
+    """
+    if engine == 'rowwise':
+        return compute_player_round_features_rowwise(match, rolling_windows, include_positional)
+    if engine != 'vectorized':
+        raise ValueError(f"unknown engine: {engine!r}")
+    return compute_player_round_features_batch([match], rolling_windows, include_positional)
+
+
+def compute_player_round_features_rowwise(match: Dict[str, Any],
+                                          rolling_windows: List[int] = [3,5,10],
+                                          include_positional: bool = True) -> pd.DataFrame:
+    """
+    Compute a broad set (50+) of engineered features for each (player, round) in the match.
+    Row-wise reference implementation (slow: rescans rounds per row); kept for parity checks.
+
     Returns: DataFrame with columns:
       - metadata: matchId, roundNumber, playerId, side, buyType, weapon, spent, walletAfter, kills, baseSkill
       - economy features, rolling features (avgKills@3/5/10, avgSpent@3/5/10), streaks, team/opponent aggregates,
@@ -291,7 +422,7 @@ def compute_player_round_features(match: Dict[str, Any],
         df[f'sumKills_last_{w}'] = grouped['kills'].apply(lambda s: s.shift(1).rolling(window=w, min_periods=1).sum()).reset_index(level=0, drop=True)
         df[f'avgSpent_last_{w}'] = grouped['spent'].apply(lambda s: s.shift(1).rolling(window=w, min_periods=1).mean()).reset_index(level=0, drop=True)
         # fraction of full buys in last w rounds
-        df[f'fullBuys_last_{w}'] = grouped['buyType'].apply(lambda s: s.shift(1).rolling(window=w, min_periods=1).apply(lambda x: np.sum([1 if xi == 'Full' else 0 for xi in x]) / max(len(x),1))).reset_index(level=0, drop=True)
+        df[f'fullBuys_last_{w}'] = grouped['buyType'].apply(lambda s: (s == 'Full').astype(float).shift(1).rolling(window=w, min_periods=1).mean()).reset_index(level=0, drop=True)
 
     # last round kills
     df['lastRoundKills'] = grouped['kills'].apply(lambda s: s.shift(1)).reset_index(level=0, drop=True).fillna(0).astype(int)
@@ -404,7 +535,8 @@ def compute_player_round_features(match: Dict[str, Any],
         # create side-round level aggregation first
         side_round = buys_df.groupby(['roundNumber', 'side']).agg(total=('playerId','count'), full=('buyType', lambda s: np.sum([1 if v=='Full' else 0 for v in s]))).reset_index()
         # now for each side compute rolling fraction
-        side_round['full_frac_last_5'] = side_round.groupby('side').full.apply(lambda s: s.shift(1).rolling(5, min_periods=1).sum() / side_round.groupby('side').total.apply(lambda t: t.shift(1).rolling(5, min_periods=1).sum()))
+        by_side = side_round.groupby('side')
+        side_round['full_frac_last_5'] = by_side.full.transform(lambda s: s.shift(1).rolling(5, min_periods=1).sum()) / by_side.total.transform(lambda t: t.shift(1).rolling(5, min_periods=1).sum())
         # map this into df
         side_round_map = {(int(r['roundNumber']), r['side']): float(r.get('full_frac_last_5', np.nan)) for _, r in side_round.iterrows()}
         df['team_full_frac_last_5'] = df.apply(lambda r: side_round_map.get((r['roundNumber'], r['side']), np.nan), axis=1)
@@ -446,7 +578,7 @@ def compute_player_round_features(match: Dict[str, Any],
         df['opp_win_streak_before'] = 0
 
     # ---------- Positional features (optional) ----------
-    pos_df = compute_positional_aggregates(match) if include_positional else pd.DataFrame()
+    pos_df = compute_positional_aggregates(match, engine='rowwise') if include_positional else pd.DataFrame()
     if not pos_df.empty:
         # join position features to df by playerId
         pos_df = pos_df.reset_index().rename(columns={'index':'playerId'}) if 'playerId' not in pos_df.columns else pos_df.reset_index()
@@ -517,7 +649,7 @@ def compute_player_round_features(match: Dict[str, Any],
     def top_n_kills(rn, n=3):
         players = df[df['roundNumber'] == rn]
         if players.empty: return {}
-        top = players.sort_values('kills', ascending=False).head(n)['playerId'].tolist()
+        top = players.sort_values('kills', ascending=False, kind='mergesort').head(n)['playerId'].tolist()
         return {pid: 1 if pid in top else 0 for pid in players['playerId'].tolist()}
     # compute for each round
     top_map = {}
@@ -565,6 +697,343 @@ def lookup_team_val_local(rn, side, match, key):
         return float(np.nanmean(vals)) if vals else 0.0
     return 0
 
+# ---------- Vectorized engine ----------
+# Same features as compute_player_round_features_rowwise, for one or many matches at once.
+# Everything the row-wise path looks up per row (team/opponent round aggregates, win
+# streaks, next-round buys, top-3 kills, ...) is built once as a small keyed table and
+# attached with one indexed lookup; per-player history uses grouped shift/rolling/cumsum.
+# Rows are keyed by '_m' (position of the match in the input) so matches never mix.
+
+WEAPON_POWER = {
+    'Classic': 0.1, 'Shorty': 0.08, 'Ghost': 0.45, 'Sheriff': 0.65, 'Frenzy': 0.2,
+    'Bulldog': 0.5, 'Guardian': 0.55, 'Phantom': 0.85, 'Vandal': 0.87, 'Operator': 1.1,
+    'Spectre': 0.6, 'Judge': 0.45
+}
+BUY_AGGRESSIVENESS = {'Eco': 0.0, 'Pistol': 0.4, 'Light': 0.45, 'Partial': 0.75, 'Force': 0.85, 'Full': 1.0}
+SIDES = ('attackers', 'defenders')
+
+
+def _lookup(table, key_sets: List[List[Any]], default=np.nan) -> List[np.ndarray]:
+    """
+    `table.get(tuple(row_keys), default)` for every row of each key set, as one indexed take
+    per set (object arrays). `table` is a dict keyed by tuples or a MultiIndexed Series; its
+    index is built once and shared by all key sets.
+    """
+    n = len(key_sets[0][0])
+    if not len(table):
+        return [np.full(n, default, dtype=object) for _ in key_sets]
+    if isinstance(table, pd.Series):
+        index, values = table.index, np.append(table.to_numpy(dtype=object), None)
+    else:
+        index = pd.MultiIndex.from_arrays([list(level) for level in zip(*table.keys())])
+        values = np.empty(len(table) + 1, dtype=object)
+        values[:-1] = list(table.values())
+    values[-1] = default  # pos == -1 (missing) takes the default
+    return [values[index.get_indexer(pd.MultiIndex.from_arrays([np.asarray(k) for k in keys]))]
+            for keys in key_sets]
+
+
+def _as_column(values: np.ndarray, index) -> pd.Series:
+    """Object values -> Series with the dtype pandas infers for row-wise apply results."""
+    return pd.Series(values.tolist(), index=index, dtype=None if len(values) else float)
+
+
+def _flip(side: pd.Series) -> np.ndarray:
+    return np.where(side.to_numpy() == 'attackers', 'defenders', 'attackers').astype(object)
+
+
+def _run_before(flag: pd.Series, group: pd.Series) -> pd.Series:
+    """Consecutive True values immediately before each row within its group (0 if none)."""
+    run_id = (~flag).groupby(group).cumsum()
+    run = flag.astype(int).groupby([group, run_id]).cumsum()
+    return run.groupby(group).shift(1).fillna(0).astype(int)
+
+
+def _round_tables(matches: List[Dict[str, Any]]):
+    """
+    One pass over every match's rounds:
+      team[(m, rn, side)]  -> (team_spent, team_avg_weaponPower, team_avg_baseSkill) for
+                              attackers/defenders (zeros when the side has no buys)
+      local[(m, rn, side)] -> (spent, count) for every side value present
+      winners              -> (m, rn, winner) per round for win streaks
+      next_buy[(m, rn, pid)] -> buyType in round rn + 1
+      buys                 -> (m, rn, pid, side, buyType) rows for the rolling full-buy fraction
+    The first round with a given number wins, like the row-wise lookups.
+    """
+    team, local, next_buy = {}, {}, {}
+    winners, buys = [], []
+    for m, match in enumerate(matches):
+        players = match.get('players', [])
+        skill_of = {}
+        for p in players:
+            skill_of.setdefault(p.get('id'), p.get('baseSkill', np.nan))
+        rounds = match.get('rounds', [])
+        first_by_rn = {}
+        for rnd in rounds:
+            first_by_rn.setdefault(rnd.get('roundNumber'), rnd)
+        for rn, rnd in first_by_rn.items():
+            by_side: Dict[Any, List[dict]] = {}
+            for b in rnd.get('buys', []):
+                by_side.setdefault(b.get('side'), []).append(b)
+            for side, side_buys in by_side.items():
+                local[(m, rn, side)] = (sum([b.get('spent', 0) for b in side_buys]), len(side_buys))
+            for side in SIDES:
+                side_buys = by_side.get(side)
+                if not side_buys:
+                    team[(m, rn, side)] = (0, 0, 0)
+                    continue
+                avg_weapon = np.mean([(0.3 if b.get('weapon') is None else (0.85 if b.get('weapon') == 'Phantom' else 0.5)) for b in side_buys])
+                base_skills = []
+                for b in side_buys:
+                    skill = skill_of.get(b.get('playerId'), np.nan)
+                    base_skills.append(skill if not np.isnan(skill) else 0.45)
+                team[(m, rn, side)] = (local[(m, rn, side)][0], avg_weapon,
+                                       float(np.nanmean(base_skills)) if base_skills else np.nan)
+        for rnd in rounds:
+            rn = rnd.get('roundNumber')
+            for b in rnd.get('buys', []):
+                buys.append((m, rn, b['playerId'], b['side'], b.get('buyType', '')))
+            if not rn:
+                continue
+            next_rnd = first_by_rn.get(rn + 1)
+            if next_rnd is not None:
+                for b in (next_rnd.get('buys') or []):
+                    next_buy[(m, rn, b['playerId'])] = b.get('buyType')
+        for rnd in sorted(rounds, key=lambda x: x.get('roundNumber', 0)):
+            winners.append((m, rnd.get('roundNumber'),
+                            rnd.get('winner') or ('attackers' if rnd.get('winProbAttack', 0) > 0.5 else 'defenders')))
+    return team, local, winners, next_buy, buys
+
+
+def _win_streaks_before(df: pd.DataFrame, side_sets: List[np.ndarray], winners: List[tuple]) -> List[np.ndarray]:
+    """Consecutive wins of each row's side in the rounds numbered below its round (per match), per side set."""
+    if not winners:
+        return [np.zeros(len(df), dtype=int) for _ in side_sets]
+    w = pd.DataFrame(winners, columns=['_m', 'roundNumber', 'winner'])
+    w['roundNumber'] = w['roundNumber'].astype(int)
+    w = w.sort_values(['_m', 'roundNumber'], kind='mergesort').reset_index(drop=True)
+    lo = min(w['roundNumber'].min(), df['roundNumber'].min())
+    span = max(w['roundNumber'].max(), df['roundNumber'].max()) - lo + 2
+    w_key = w['_m'].to_numpy() * span + (w['roundNumber'].to_numpy() - lo)
+    row_m = df['_m'].to_numpy()
+    # last round of the same match numbered strictly below this row's round
+    j = np.searchsorted(w_key, row_m * span + (df['roundNumber'].to_numpy() - lo), side='left') - 1
+    valid = (j >= 0) & (w['_m'].to_numpy()[np.maximum(j, 0)] == row_m)
+    streaks = {}
+    for s in pd.unique(np.concatenate(side_sets)):
+        won = w['winner'] == s
+        streaks[s] = np.where(won, _run_before(won, w['_m']).to_numpy() + 1, 0)  # wins ending at each round
+    out = []
+    for side in side_sets:
+        col = np.zeros(len(df), dtype=int)
+        for s, streak in streaks.items():
+            rows = valid & (side == s)
+            col[rows] = streak[j[rows]]
+        out.append(col)
+    return out
+
+
+def compute_player_round_features_batch(matches: List[Dict[str, Any]],
+                                        rolling_windows: List[int] = [3,5,10],
+                                        include_positional: bool = True,
+                                        match_index: bool = False) -> pd.DataFrame:
+    """
+    Vectorized compute_player_round_features for many matches: one DataFrame holding every
+    match's rows (in input order), with the same columns and values as running the
+    row-wise path per match. match_index=True keeps a trailing '_m' column with the
+    position of each row's match in `matches`.
+    """
+    matches = list(matches)
+    rows = []
+    for m, match in enumerate(matches):
+        for row in _player_round_rows(match):
+            row['_m'] = m
+            rows.append(row)
+    if not rows:
+        return pd.DataFrame()
+    df = pd.DataFrame(rows).sort_values(['_m', 'playerId', 'roundNumber']).reset_index(drop=True)
+    df = _cast_base_types(df)
+    team, local, winners, next_buy, buys = _round_tables(matches)
+    m_col, rn_col = df['_m'].to_numpy(), df['roundNumber'].to_numpy()
+    side_col = df['side']
+    opp_side = _flip(side_col)
+    idx = df.index
+
+    # ---------- Basic derived numeric features ----------
+    winner_map = {}
+    for m, match in enumerate(matches):
+        for rnd in match.get('rounds', []):
+            rn = rnd.get('roundNumber')
+            if rn is None: continue
+            winner_map[(m, int(rn))] = rnd.get('winner') or rnd.get('winnerSide') or ('attackers' if (rnd.get('winProbAttack', 0) > 0.5) else 'defenders')
+    df['roundWinnerSide'], = _lookup(winner_map, [[m_col, rn_col]])
+    df['roundWinnerIsPlayerTeam'] = (df['side'] == df['roundWinnerSide']).astype(int)
+    df['weaponPower'] = df['weapon'].map(WEAPON_POWER).astype(float).fillna(0.3)
+    df['buyAggressiveness'] = df['buyType'].map(BUY_AGGRESSIVENESS).astype(float).fillna(0.5)
+    spent = df['spent']
+    df['buyValueRatio'] = np.where(spent > 0, df['weaponPower'] / (spent + 1e-9), 0.0)
+    df['isAttack'] = (df['side'] == 'attackers').astype(int)
+
+    # ---------- Rolling player-level features ----------
+    player = df.groupby(['_m', 'playerId'], sort=False).ngroup()
+    by_player = df.groupby(player, sort=False)
+    prev = pd.DataFrame({
+        'kills': by_player['kills'].shift(1),
+        'spent': by_player['spent'].shift(1),
+        'full': (df['buyType'] == 'Full').astype(float).groupby(player).shift(1),
+    })
+    for w in rolling_windows:
+        # groups are contiguous and numbered in row order, so results line up positionally
+        means = prev.groupby(player).rolling(window=w, min_periods=1).mean()
+        df[f'avgKills_last_{w}'] = means['kills'].to_numpy()
+        df[f'sumKills_last_{w}'] = prev['kills'].groupby(player).rolling(window=w, min_periods=1).sum().to_numpy()
+        df[f'avgSpent_last_{w}'] = means['spent'].to_numpy()
+        df[f'fullBuys_last_{w}'] = means['full'].to_numpy()
+    df['lastRoundKills'] = prev['kills'].fillna(0).astype(int)
+    df['ecoStreak_before'] = _run_before(df['buyType'] == 'Eco', player)
+    df['fullBuyStreak_before'] = _run_before(df['buyType'] == 'Full', player)
+
+    if 'clutch' not in df.columns:
+        df['clutch'] = 0
+    attempt = df.get('clutch_attempt', pd.Series(False, index=idx)).astype(bool) | df['clutch'].astype(bool)
+    success = attempt & (df.get('clutch_success', pd.Series(False, index=idx)).astype(bool) | df['clutch'].astype(bool))
+    prior_attempts = attempt.astype(int).groupby(player).cumsum() - attempt.astype(int)
+    prior_successes = success.astype(int).groupby(player).cumsum() - success.astype(int)
+    df['prior_clutch_success_rate'] = prior_successes / (np.maximum(1, prior_attempts) + 1e-9)
+
+    # ---------- Team-level and opponent aggregates per round ----------
+    team_keys, opp_keys = [m_col, rn_col, side_col.to_numpy()], [m_col, rn_col, opp_side]
+    team_vals, opp_vals = _lookup(team, [team_keys, opp_keys], default=(np.nan, np.nan, np.nan))
+    for i, name in enumerate(['team_total_spent_round', 'team_avg_weaponPower_round', 'team_avg_baseSkill_round']):
+        df[name] = _as_column(np.array([v[i] for v in team_vals], dtype=object), idx)
+    for i, name in enumerate(['opp_total_spent_round', 'opp_avg_weaponPower_round', 'opp_avg_baseSkill_round']):
+        df[name] = _as_column(np.array([v[i] for v in opp_vals], dtype=object), idx)
+    df['economicPressure'] = (df['opp_total_spent_round'] / ((df['team_total_spent_round'] + 1e-9) + 1e-9)).astype(float)
+
+    buys_df = pd.DataFrame(buys, columns=['_m', 'roundNumber', 'playerId', 'side', 'buyType'])
+    if not buys_df.empty:
+        buys_df['isFull'] = (buys_df['buyType'] == 'Full').astype(int)
+        side_round = buys_df.groupby(['_m', 'roundNumber', 'side']).agg(total=('playerId', 'count'), full=('isFull', 'sum')).reset_index()
+        by_side = side_round.groupby(['_m', 'side'], sort=False)
+        prior = {col: by_side[col].shift(1).groupby([side_round['_m'], side_round['side']]).rolling(5, min_periods=1).sum()
+                 .reset_index(level=[0, 1], drop=True).sort_index() for col in ('full', 'total')}
+        frac = (prior['full'] / prior['total']).to_numpy()
+        frac = pd.Series(frac, index=pd.MultiIndex.from_arrays(
+            [side_round['_m'], side_round['roundNumber'].astype(int), side_round['side']]))
+        team_frac, opp_frac = _lookup(frac, [team_keys, opp_keys])
+        df['team_full_frac_last_5'] = team_frac.astype(float)
+        df['opp_full_frac_last_5'] = opp_frac.astype(float)
+    else:
+        df['team_full_frac_last_5'] = np.nan
+        df['opp_full_frac_last_5'] = np.nan
+
+    # ---------- Temporal context features ----------
+    n_rounds = np.maximum(df.groupby('_m')['roundNumber'].transform('max').to_numpy(), 0)
+    half_start = np.where(n_rounds > 0, (n_rounds + 1) // 2 + 1, 0)
+    df['isPistolRound'] = ((rn_col == 1) | ((half_start > 0) & (rn_col == half_start))).astype(int)
+    df['roundInHalf'] = np.where(half_start > 0, (rn_col - 1) % np.maximum(half_start - 1, 1) + 1, rn_col)
+    df['team_win_streak_before'], df['opp_win_streak_before'] = _win_streaks_before(
+        df, [side_col.to_numpy(dtype=object), opp_side], winners)
+
+    # ---------- Positional features (optional) ----------
+    if include_positional:
+        pos_frames = []
+        for m, match in enumerate(matches):
+            pos_df = compute_positional_aggregates(match)
+            if not pos_df.empty:
+                # same shape as the row-wise merge, including its 'index' column
+                pos_df = pos_df.reset_index().reset_index()
+                pos_df['_m'] = m
+                pos_frames.append(pos_df)
+        if pos_frames:
+            df = df.merge(pd.concat(pos_frames, ignore_index=True), on=['_m', 'playerId'], how='left')
+            idx = df.index
+
+    # ---------- Derived ratios and advanced features ----------
+    base_skill_series = df.groupby(player.to_numpy())['baseSkill'].transform('mean')
+    df['playerSkill_z'] = base_skill_series.groupby(df['_m'].to_numpy()).transform(zscore)
+
+    skill_var = df.groupby(['_m', 'roundNumber', 'side'])['baseSkill'].var()
+    team_var, opp_var = _lookup(skill_var, [team_keys, opp_keys], default=0.0)
+    df['team_skill_var'] = team_var.astype(float)
+    df['opp_skill_var'] = opp_var.astype(float)
+
+    local_vals, = _lookup(local, [team_keys], default=(0, 0))
+    total = np.array([v[0] for v in local_vals], dtype=float)
+    count = np.array([v[1] for v in local_vals], dtype=float)
+    df['avgTeamSpent'] = total / (np.maximum(1, count) + 1e-9)
+    df['spent_over_team_avg'] = df['spent'] / ((df['avgTeamSpent'] + 1e-9) + 1e-9)
+
+    df['expectedKills_simple'] = df['baseSkill'] * df['weaponPower'] * df['buyAggressiveness'] * (df['team_avg_baseSkill_round'].fillna(df['baseSkill']) / 0.5)
+
+    next_buy_type, = _lookup(next_buy, [[m_col, rn_col, df['playerId'].to_numpy()]], default='NA')
+    df['nextRoundBuyType'] = _as_column(next_buy_type, idx)
+    df['next_can_full_buy'] = (df['nextRoundBuyType'] == 'Full').astype(int)
+
+    df['fatigue_index'] = df.groupby(player.to_numpy()).cumcount() / df.groupby(player.to_numpy())['roundNumber'].transform('max').replace(0,1)
+
+    hours, weekdays = np.zeros(len(matches), dtype=int), np.zeros(len(matches), dtype=int)
+    for m, match in enumerate(matches):
+        started_at = match.get('startedAt', None)
+        if started_at:
+            dt = pd.to_datetime(started_at, unit='s')
+            hours[m], weekdays[m] = dt.hour, dt.weekday()
+    df['match_hour'] = hours[m_col]
+    df['match_weekday'] = weekdays[m_col]
+
+    df['pressure_metric'] = df['opp_avg_weaponPower_round'] - df['team_avg_weaponPower_round']
+
+    # top 3 by kills per round; ties keep row order like the row-wise stable sort
+    order = np.lexsort((np.arange(len(df)), -df['kills'].to_numpy(), rn_col, m_col))
+    rank = np.empty(len(df), dtype=int)
+    rank[order] = df.iloc[order].groupby(['_m', 'roundNumber'], sort=False).cumcount().to_numpy()
+    df['in_top3_kills'] = (rank < 3).astype(int)
+
+    meta_cols = ['matchId', 'roundNumber', 'playerId', 'side', 'buyType', 'weapon', 'spent', 'walletAfter', 'kills', 'payout']
+    other_cols = [c for c in df.columns if c not in meta_cols and c != '_m']
+    return df[meta_cols + other_cols + (['_m'] if match_index else [])].reset_index(drop=True)
+
+# ---------- Output dtypes ----------
+# a tiny match with no missing values that exercises every feature, positional ones included
+_DTYPE_PROBE = {
+    'id': 'dtype-probe', 'startedAt': 1700000000,
+    'players': [{'id': 'a', 'baseSkill': 0.5}, {'id': 'b', 'baseSkill': 0.5}],
+    'rounds': [{
+        'roundNumber': 1, 'winProbAttack': 0.5, 'winner': 'attackers',
+        'buys': [{'playerId': pid, 'side': side, 'buyType': 'Full', 'weapon': 'Vandal', 'spent': 3900, 'walletAfter': 100}
+                 for pid, side in (('a', 'attackers'), ('b', 'defenders'))],
+        'playerRoundResults': [{'playerId': pid, 'side': side, 'kills': 1, 'planted': False, 'defused': False, 'payout': 3000}
+                               for pid, side in (('a', 'attackers'), ('b', 'defenders'))],
+    }],
+    'replayFrames': [{'tick': 0, 'players': [{'id': 'a', 'x': 0.0, 'y': 0.0}, {'id': 'b', 'x': 1.0, 'y': 1.0}]}],
+}
+_feature_dtypes: Dict[tuple, pd.Series] = {}
+
+def feature_dtypes(rolling_windows: List[int] = [3,5,10], include_positional: bool = True) -> pd.Series:
+    """
+    Column -> dtype of compute_player_round_features output when nothing is missing, in
+    output order (positional columns included when include_positional). An int column
+    only comes back float for a match that has NaN in it.
+    """
+    key = (tuple(rolling_windows), include_positional)
+    dtypes = _feature_dtypes.get(key)
+    if dtypes is None:
+        dtypes = _feature_dtypes[key] = compute_player_round_features_batch(
+            [_DTYPE_PROBE], rolling_windows, include_positional).dtypes
+    return dtypes
+
+def restore_int_columns(df: pd.DataFrame, rolling_windows: List[int] = [3,5,10],
+                        include_positional: bool = True) -> pd.DataFrame:
+    """
+    Cast float columns that are int in feature_dtypes and hold no NaN back to int64: a
+    slice of a multi-match batch then has the dtypes a single-match call gives.
+    """
+    dtypes = feature_dtypes(rolling_windows, include_positional)
+    for col in df.columns:
+        if col in dtypes and dtypes[col].kind == 'i' and df[col].dtype.kind == 'f' and df[col].notna().all():
+            df[col] = df[col].astype('int64')
+    return df
+
 # ---------- Feature list explanation ----------
 FEATURE_DESCRIPTIONS = {
     # Short descriptions for each key feature that compute_player_round_features produces (examples)
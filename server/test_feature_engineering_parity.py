@@ -0,0 +1,88 @@
+"""
+Parity checks: the vectorized compute_player_round_features engine must match the
+row-wise reference column for column (names, order, dtypes, values).
+
+Run with pytest, or directly: python server/test_feature_engineering_parity.py
+"""
+import os
+import random
+import sys
+import warnings
+
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(__file__))
+
+from bench_feature_engineering import PARITY_TOLERANCE, synthetic_frames, synthetic_match
+from feature_engineering import (compute_player_round_features, compute_player_round_features_batch,
+                                 compute_positional_aggregates)
+
+warnings.simplefilter("ignore", FutureWarning)
+
+
+def rowwise(match, **kwargs):
+    return compute_player_round_features(match, engine='rowwise', **kwargs)
+
+
+def test_single_match_parity():
+    for seed in range(6):
+        match = synthetic_match(seed)
+        pd.testing.assert_frame_equal(rowwise(match, include_positional=False),
+                                      compute_player_round_features(match, include_positional=False),
+                                      **PARITY_TOLERANCE)
+
+
+def test_batch_parity():
+    matches = [synthetic_match(seed, n_rounds=12) for seed in range(5)]
+    expected = pd.concat([rowwise(m, include_positional=False) for m in matches], ignore_index=True)
+    pd.testing.assert_frame_equal(expected, compute_player_round_features_batch(matches, include_positional=False),
+                                  **PARITY_TOLERANCE)
+
+
+def test_positional_parity():
+    match = synthetic_match(11, n_rounds=6)
+    rng = random.Random(1)
+    match['replayFrames'] = [
+        {'tick': t, 'players': [{'id': p['id'], 'x': rng.uniform(0, 3000), 'y': rng.uniform(0, 3000)}
+                                for p in match['players'][:9]]}
+        for t in range(40)
+    ]
+    pd.testing.assert_frame_equal(rowwise(match), compute_player_round_features(match), **PARITY_TOLERANCE)
+
+
+def test_edge_cases_parity():
+    match = synthetic_match(5, n_rounds=3)
+    del match['startedAt']
+    for rnd in match['rounds']:
+        rnd.pop('winner', None)
+        rnd['winnerSide'] = 'defenders'
+    # one side skips buying for a round: zero team aggregates for the opponent lookup
+    match['rounds'][1]['buys'] = [b for b in match['rounds'][1]['buys'] if b['side'] == 'attackers']
+    pd.testing.assert_frame_equal(rowwise(match, include_positional=False),
+                                  compute_player_round_features(match, include_positional=False),
+                                  **PARITY_TOLERANCE)
+    empty = {'id': 'empty', 'players': [], 'rounds': []}
+    assert compute_player_round_features(empty).empty and rowwise(empty).empty
+
+
+def test_positional_aggregates_parity():
+    for seed in range(6):
+        match = synthetic_match(seed, n_rounds=2)
+        # players skipping frames, NaN coordinates and an id outside the roster
+        match['replayFrames'] = synthetic_frames(match, n_frames=150, seed=seed, gaps=True)
+        if seed % 2:
+            del match['rounds'][0]['buys']  # sides fall back to roster order
+        expected = compute_positional_aggregates(match, engine='rowwise')
+        for chunk_frames in (None, 1, 16):
+            pd.testing.assert_frame_equal(expected, compute_positional_aggregates(match, chunk_frames=chunk_frames),
+                                          **PARITY_TOLERANCE)
+    assert compute_positional_aggregates({'id': 'no_frames', 'players': []}).empty
+
+
+if __name__ == '__main__':
+    test_single_match_parity()
+    test_batch_parity()
+    test_positional_parity()
+    test_edge_cases_parity()
+    test_positional_aggregates_parity()
+    print("All parity checks passed")